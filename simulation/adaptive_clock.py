@@ -0,0 +1,153 @@
+import math
+import random
+import numpy as np
+from distance_engine import haversine_distance
+from neighbor_index import make_neighbor_index
+
+MAX_SEARCH_FACTOR = 10  # Widest search for approaching cars, in connection distances; longer jumps are cut short
+
+
+class AdaptiveClock:
+    """
+    Finds the next tick at which check_network can change the topology.
+
+    Between two such ticks every check is a no-op: no car arrives or departs, no
+    connected pair leaves range and no car below num_min_connections gets an
+    unconnected car within range. The bound uses each car's largest step along its
+    trajectory, so two cars `d` km apart close or open their distance by at most
+    the sum of their steps per position.
+
+    Bounds are computed with the haversine distance whatever the simulation's
+    distance mode, which keeps them cheap under "geodesic". `tolerance` is the
+    relative error allowed between haversine and the simulation's distances.
+
+    Cars that could come within range of a car below the minimum are found with a
+    neighbor index queried at the connection distance grown by how far the cars
+    can close it before the jump ends, so a check costs about as much as a
+    neighbor index update rather than growing with needy x active cars.
+    """
+    def __init__(self, num_cars, connection_distance, tolerance=0.01, index_kind="grid"):
+        """
+        Args:
+            num_cars (int): Number of cars.
+            connection_distance (float): Connection range in km.
+            tolerance (float): Largest relative difference between haversine and the simulation's distances.
+            index_kind (str): Neighbor index searched for approaching cars.
+        """
+        self.connection_distance = connection_distance
+        self.tolerance = tolerance
+        self.index_kind = index_kind
+        self.max_step = np.zeros(num_cars, dtype=np.float64)  # Largest haversine distance in km between two consecutive positions
+        self.measured = np.zeros(num_cars, dtype=bool)
+
+    def measure(self, state, car_ids):
+        """
+        Measure the largest step of cars that have not been measured yet.
+        """
+        for car_id in np.asarray(car_ids).tolist():
+            if self.measured[car_id]:
+                continue
+            trajectory = state.trajectory(car_id)
+            if len(trajectory) > 1:
+                steps = haversine_distance(trajectory[:-1, 0], trajectory[:-1, 1], trajectory[1:, 0], trajectory[1:, 1])
+                self.max_step[car_id] = steps.max()
+            self.measured[car_id] = True
+
+    def next_change_tick(self, simulation, time_interval=1):
+        """
+        Return the earliest tick, not before the current one, at which check_network may change anything.
+
+        Args:
+            simulation (NetworkSimulation): The simulation, with its neighbor index up to date.
+            time_interval (int): Simulation step in seconds; cars move that many positions per step.
+
+        Returns:
+            int: The tick to run the next check at.
+        """
+        now = simulation.timestamp
+        active_ids = simulation.active_car_ids
+        next_event = simulation.schedule.next_event_tick()
+        if next_event is None or next_event <= now:
+            return now
+        limit = math.ceil((next_event - now) / time_interval)  # Steps until the next arrival or departure
+        if len(active_ids) == 0:
+            return now + limit * time_interval
+        state = simulation.state
+        self.measure(state, active_ids)
+
+        # Connected pairs must stay within range
+        edges = simulation.edges
+        if len(edges):
+            keys = np.array(list(edges.edges), dtype=np.int64)
+            if any(simulation.pair_distances.get(key) is None for key in edges.edges):
+                return now  # A link breaks at this tick
+            distances = self.haversine(state.position[keys[:, 0]], state.position[keys[:, 1]])
+            closing = (self.max_step[keys[:, 0]] + self.max_step[keys[:, 1]]) * time_interval
+            reach = self.connection_distance / (1 + self.tolerance)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Steps the pair is certainly still within range for
+                steps = np.where(closing > 0, np.floor((reach - distances) / closing), np.inf)
+            limit = min(limit, np.maximum(steps, 0).min() + 1)
+
+        # Cars below the minimum must not get an unconnected car within range
+        num_min_connections = simulation.sim_params.get("num_min_connections", 3)
+        needy = np.array([car_id for car_id in active_ids.tolist() if edges.degree(car_id) < num_min_connections],
+                         dtype=np.int64)
+        if len(needy):
+            row_of = np.full(state.num_cars, -1, dtype=np.int64)
+            row_of[needy] = np.arange(len(needy))
+            pair_rows = np.maximum(row_of[simulation.pair_first], row_of[simulation.pair_second])
+            if any(not edges.connected(car_id, other_car_id) for car_id, other_car_id in
+                   zip(simulation.pair_first[pair_rows >= 0].tolist(), simulation.pair_second[pair_rows >= 0].tolist())):
+                return now  # A car can be connected at this tick
+            # Only cars within `radius` can reach range of a needy car before the jump ends
+            closing_max = (self.max_step[needy].max() + self.max_step[active_ids].max()) * time_interval
+            reach = self.connection_distance / (1 - self.tolerance)
+            radius = reach + closing_max * limit
+            if radius > MAX_SEARCH_FACTOR * self.connection_distance:
+                radius = MAX_SEARCH_FACTOR * self.connection_distance
+                limit = min(limit, math.floor((radius - reach) / closing_max))
+            index = make_neighbor_index(self.index_kind, radius)
+            index.build(active_ids.tolist(), state.position[active_ids].tolist())
+            first, second = [], []
+            for car_id in needy.tolist():
+                for other_car_id in index.query(car_id):
+                    # Ignore the cars it is already connected to
+                    if not edges.connected(car_id, other_car_id):
+                        first.append(car_id)
+                        second.append(other_car_id)
+            if first:
+                first = np.array(first, dtype=np.int64)
+                second = np.array(second, dtype=np.int64)
+                distances = self.haversine(state.position[first], state.position[second])
+                closing = (self.max_step[first] + self.max_step[second]) * time_interval
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    # First step at which the pair could be within range
+                    steps = np.where(closing > 0, np.ceil((distances - reach) / closing),
+                                     np.where(distances > reach, np.inf, 0))
+                limit = min(limit, np.maximum(steps, 0).min())
+
+        return now + int(limit) * time_interval
+
+    @staticmethod
+    def haversine(positions1, positions2):
+        """
+        Return the haversine distance in km between each row of two (n, 2) position arrays.
+        """
+        return haversine_distance(positions1[:, 0], positions1[:, 1], positions2[:, 0], positions2[:, 1])
+
+
+def skip_motion_noise(state, active_ids, first_tick, last_tick, time_interval=1):
+    """
+    Draw and discard the motion-vector noise of the skipped ticks first_tick..last_tick.
+
+    Every motion vector update draws two uniforms per active car that has passed at
+    least two positions, so discarding the same number keeps the random stream, and
+    with it every later tick, identical to a run that computed every tick.
+    """
+    active_ids = np.asarray(active_ids, dtype=np.int64)
+    draws = 0
+    for tick in range(first_tick, last_tick + 1, time_interval):
+        draws += 2 * int(np.count_nonzero(tick - state.offset[active_ids] >= 1))
+    for _ in range(draws):
+        random.random()
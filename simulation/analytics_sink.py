@@ -0,0 +1,253 @@
+"""
+Per-tick analytics output.
+
+A sink buffers at most `buffer_size` entries, appends them to its file whenever the
+buffer fills and fsyncs at most every `fsync_interval` seconds, so memory stays
+bounded and a crash loses at most the last buffer. read_analytics reads any of the
+formats back as a list of dicts.
+
+A resumed simulation reopens its text sink at the size recorded by its last
+checkpoint, dropping whatever was written after it, and appends from there.
+"""
+import csv
+import json
+import os
+import time
+
+
+def to_builtin(value):
+    """JSON fallback for NumPy scalars and arrays."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class AnalyticsSink:
+    """
+    Base class of the file sinks. Subclasses implement write_entries and close_file.
+    """
+    def __init__(self, path, buffer_size=256, fsync_interval=10.0, resume_size=None):
+        """
+        Args:
+            path (str): Output file, truncated on open.
+            buffer_size (int): Entries kept in memory before they are written out.
+            fsync_interval (float): Minimum seconds between two fsyncs. 0 fsyncs on every flush.
+            resume_size (int): Bytes of an existing file to keep and append to, instead of truncating it.
+        """
+        self.path = path
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.resume_size = resume_size
+        self.buffer = []
+        self.entries_written = 0
+        self.last_fsync = time.monotonic()
+        self.file = self.open_file()
+
+    def open_file(self):
+        if self.resume_size is None:
+            return open(self.path, "w", newline="")
+        file = open(self.path, "r+", newline="")
+        file.truncate(self.resume_size)
+        file.seek(0, os.SEEK_END)
+        return file
+
+    def write(self, entry):
+        """
+        Queue one analytics entry, flushing the buffer when it is full.
+        """
+        self.buffer.append(entry)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self, sync=False):
+        """
+        Write the buffered entries out, and fsync if `sync` or the fsync interval has passed.
+        """
+        if self.buffer:
+            self.write_entries(self.buffer)
+            self.entries_written += len(self.buffer)
+            self.buffer = []
+        self.file.flush()
+        if sync or time.monotonic() - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = time.monotonic()
+
+    def write_entries(self, entries):
+        raise NotImplementedError("write_entries must be implemented in subclasses")
+
+    def position(self):
+        """
+        Flush and fsync every entry so far and return how far the output has got, for a checkpoint.
+
+        Returns:
+            dict: {"entries": entries written, "size": file size in bytes}.
+        """
+        self.flush(sync=True)
+        return {"entries": self.entries_written, "size": os.fstat(self.file.fileno()).st_size}
+
+    def close(self):
+        """
+        Flush and fsync the remaining entries and close the file.
+        """
+        if self.file.closed:
+            return
+        self.flush(sync=True)
+        self.close_file()
+
+    def close_file(self):
+        self.file.close()
+
+
+class JSONLinesSink(AnalyticsSink):
+    """One JSON object per line."""
+    def write_entries(self, entries):
+        self.file.write("".join(json.dumps(entry, default=to_builtin) + "\n" for entry in entries))
+
+
+class CSVSink(AnalyticsSink):
+    """CSV with a header taken from the keys of the first entry."""
+    def __init__(self, path, buffer_size=256, fsync_interval=10.0, resume_size=None):
+        self.writer = None
+        super().__init__(path, buffer_size, fsync_interval, resume_size)
+
+    def write_entries(self, entries):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(entries[0]))
+            if not self.resume_size:  # A resumed file already has its header
+                self.writer.writeheader()
+        self.writer.writerows(entries)
+
+
+class ParquetSink(AnalyticsSink):
+    """
+    Parquet file with one row group per flush. Needs pyarrow, and unlike the text
+    sinks the file is only readable once the sink is closed, so it cannot be resumed.
+    """
+    def __init__(self, path, buffer_size=256, fsync_interval=10.0, resume_size=None):
+        if resume_size is not None:
+            raise ValueError("Parquet analytics cannot be resumed, use the jsonl or csv format")
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.writer = None
+        super().__init__(path, buffer_size, fsync_interval)
+
+    def open_file(self):
+        return open(self.path, "wb")
+
+    def position(self):
+        raise ValueError("Parquet analytics cannot be checkpointed, use the jsonl or csv format")
+
+    def write_entries(self, entries):
+        table = self.pyarrow.Table.from_pylist(entries)
+        if self.writer is None:
+            self.writer = self.parquet.ParquetWriter(self.file, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close_file(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.file.close()
+
+
+class MemorySink:
+    """
+    Keeps every entry in `entries`. Used when a simulation has no output file.
+    """
+    def __init__(self):
+        self.path = None
+        self.entries = []
+
+    def write(self, entry):
+        self.entries.append(entry)
+
+    def flush(self, sync=False):
+        pass
+
+    def position(self):
+        return {"entries": len(self.entries)}
+
+    def close(self):
+        pass
+
+
+ANALYTICS_SINKS = {
+    "jsonl": JSONLinesSink,
+    "csv": CSVSink,
+    "parquet": ParquetSink,
+}
+EXTENSION_FORMATS = {
+    ".jsonl": "jsonl",
+    ".csv": "csv",
+    ".parquet": "parquet",
+}
+
+
+def analytics_format(path):
+    """
+    Return the sink format matching the extension of `path`, JSON Lines by default.
+    """
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), "jsonl")
+
+
+def make_analytics_sink(path, kind=None, buffer_size=256, fsync_interval=10.0, resume_size=None):
+    """
+    Create the analytics sink for a simulation.
+
+    Args:
+        path (str): Output file, or None to keep the entries in memory.
+        kind (str): "jsonl", "csv" or "parquet". Defaults to the format of the file extension.
+        buffer_size (int): Entries kept in memory before they are written out.
+        fsync_interval (float): Minimum seconds between two fsyncs.
+        resume_size (int): Bytes of an existing output file to keep and append to, when resuming a run.
+
+    Returns:
+        AnalyticsSink or MemorySink: The sink.
+    """
+    if path is None:
+        return MemorySink()
+    kind = kind or analytics_format(path)
+    if kind not in ANALYTICS_SINKS:
+        raise ValueError(f"Unknown analytics format {kind!r}, expected one of {sorted(ANALYTICS_SINKS)}")
+    if kind == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            path = os.path.splitext(path)[0] + ".jsonl"
+            print(f"pyarrow is not installed, writing analytics as JSON Lines to {path}")
+            kind = "jsonl"
+    return ANALYTICS_SINKS[kind](path, buffer_size, fsync_interval, resume_size)
+
+
+def parse_csv_value(value):
+    """Convert a CSV field back to int, float, bool or None where it looks like one."""
+    if value == "":
+        return None
+    if value in ("True", "False"):
+        return value == "True"
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+def read_analytics(path, kind=None):
+    """
+    Read analytics written by a sink back as a list of dicts.
+
+    Files ending in .json are read as a single JSON document, as written before the sinks existed.
+    """
+    if kind is None and path.lower().endswith(".json"):
+        with open(path) as file:
+            return json.load(file)
+    kind = kind or analytics_format(path)
+    if kind == "parquet":
+        import pyarrow.parquet
+        return pyarrow.parquet.read_table(path).to_pylist()
+    with open(path, newline="") as file:
+        if kind == "csv":
+            return [{key: parse_csv_value(value) for key, value in row.items()} for row in csv.DictReader(file)]
+        return [json.loads(line) for line in file if line.strip()]
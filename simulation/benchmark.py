@@ -0,0 +1,293 @@
+"""
+Offline scaling benchmarks for the topology algorithms.
+
+Fixture scenarios are generated without OSRM: every trip is a straight route from
+osrm_stub_server, interpolated like a fetched one, so the trips have the same shape
+as the ones in simulation_data.json. Starts are spread over a box that grows with
+the number of cars, which keeps the traffic density constant, and each fixture is
+saved once as a scenario directory and memory-mapped by later runs.
+
+Each case runs a full simulation under the tick profiler and reports the time of
+check_network (including the neighbor index update that feeds it) and
+simulate_car_positions, ticks per second and the cost per active car per tick. Results are saved as JSON, and two result files, e.g. of two
+revisions, can be compared case by case.
+"""
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from osrm_stub_server import straight_route
+from scenario import save_scenario, load_scenario
+from sweep import TOPOLOGIES
+from trajectory_interpolation import interpolate_route
+from utils import manual_bounding_boxes
+
+FIXTURE_SIZES = (100, 1000, 5000, 20000)
+FIXTURE_CENTER = (42.3141061843, -83.0368789337)
+FIXTURE_DENSITY = 200  # Trip starts per km^2
+FIXTURE_OFFSET_RANGE = (0, 240)  # Start ticks, as in main.new_simulation
+CONNECTION_DISTANCES = (0.05, 0.1, 0.2, 0.4)  # Swept at AXIS_CARS cars
+TRIP_LENGTHS = (0.5, 1.0, 2.0, 4.0)  # km, swept at AXIS_CARS cars
+AXIS_CARS = 1000
+DEFAULT_TRIP_KM = 1.0
+DEFAULT_CONNECTION_DISTANCE = 0.1
+MIN_CASE_SECONDS = 2.0  # Short cases are repeated up to MAX_REPEATS times and the fastest run kept
+MAX_REPEATS = 5
+REGRESSION_THRESHOLD = 0.10  # Relative slowdown reported as a regression
+SHARD_COUNTS = (0, 2, 4)  # Worker processes of the shard scaling runs, 0 for the single-process search
+SHARD_SCALING_CARS = 5000
+COMPARED_METRICS = ("check_network_ms_per_tick", "neighbor_index_ms_per_tick", "positions_ms_per_tick",
+                    "us_per_car_tick", "wall_seconds")
+
+
+def fixture_trips(num_cars, trip_km=DEFAULT_TRIP_KM, density=FIXTURE_DENSITY, seed=0):
+    """
+    Generate straight trips of `trip_km` km in random directions.
+
+    Returns:
+        tuple: (trips, bounding_box), trips shaped like simulate_traffic_within_box output.
+    """
+    rng = random.Random(seed)
+    bounding_box = manual_bounding_boxes(FIXTURE_CENTER, math.sqrt(num_cars / density))
+    lat_per_km = 1 / 111
+    lon_per_km = 1 / (111 * math.cos(math.radians(FIXTURE_CENTER[0])))
+    start_time = 1700000000.0
+    trips = []
+    for _ in range(num_cars):
+        lat = rng.uniform(bounding_box["min_lat"], bounding_box["max_lat"])
+        lon = rng.uniform(bounding_box["min_lon"], bounding_box["max_lon"])
+        bearing = rng.uniform(0, 2 * math.pi)
+        end = [lon + trip_km * math.sin(bearing) * lon_per_km, lat + trip_km * math.cos(bearing) * lat_per_km]
+        route = straight_route([[lon, lat], end])
+        times, positions = interpolate_route(route)
+        trips.append({
+            "route": route,
+            "positions": positions,
+            "timestamps": start_time + times,
+            "offset": rng.randint(*FIXTURE_OFFSET_RANGE),
+        })
+    return trips, bounding_box
+
+
+def fixture_scenario(fixture_dir, num_cars, trip_km=DEFAULT_TRIP_KM, density=FIXTURE_DENSITY, seed=0):
+    """
+    Return the scenario directory of a fixture, generating it on first use.
+    """
+    path = os.path.join(fixture_dir, f"cars{num_cars}-trip{trip_km:g}km-density{density:g}-seed{seed}")
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        trips, bounding_box = fixture_trips(num_cars, trip_km, density, seed)
+        save_scenario(path, trips, bounding_box)
+    return path
+
+
+def benchmark_cases(sizes=FIXTURE_SIZES):
+    """
+    List the benchmark cases: every fixture size at the default settings, plus
+    connection_distance and trip length sweeps at AXIS_CARS cars if that size is included.
+
+    Returns:
+        list: Dicts with name, num_cars, trip_km and connection_distance.
+    """
+    cases = [(num_cars, DEFAULT_TRIP_KM, DEFAULT_CONNECTION_DISTANCE) for num_cars in sizes]
+    if AXIS_CARS in sizes:
+        cases += [(AXIS_CARS, DEFAULT_TRIP_KM, distance) for distance in CONNECTION_DISTANCES]
+        cases += [(AXIS_CARS, trip_km, DEFAULT_CONNECTION_DISTANCE) for trip_km in TRIP_LENGTHS]
+    unique = list(dict.fromkeys(cases))
+    return [{"name": f"cars{num_cars}-trip{trip_km:g}km-range{distance:g}km", "num_cars": num_cars,
+             "trip_km": trip_km, "connection_distance": distance} for num_cars, trip_km, distance in unique]
+
+
+def run_case(scenario_path, topology, sim_params, seed=0):
+    """
+    Run one profiled simulation and reduce its profile to the benchmark metrics.
+
+    Returns:
+        dict: Timings of the run.
+    """
+    random.seed(seed)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        store, bounding_box = load_scenario(scenario_path)
+        simulation = TOPOLOGIES[topology](store, bounding_box, {**sim_params, "profile": True})
+        started = time.perf_counter()
+        simulation.run_simulation(time_interval=1)
+        wall_seconds = time.perf_counter() - started
+    ticks = simulation.profiler.ticks
+    car_ticks = sum(tick["active_cars"] for tick in ticks)
+    # The pair search and its distances run in the neighbor_index phase since the index was split out
+    check_network = sum(tick["neighbor_index"] + tick["validation"] + tick["link_search"] + tick["stats"]
+                        for tick in ticks)
+    neighbor_index = sum(tick["neighbor_index"] for tick in ticks)
+    positions = sum(tick["positions"] for tick in ticks)
+    rss = [tick["peak_rss_kb"] for tick in ticks if tick["peak_rss_kb"] is not None]
+    return {
+        "ticks": len(ticks),
+        "car_ticks": car_ticks,
+        "wall_seconds": wall_seconds,
+        "ticks_per_second": len(ticks) / wall_seconds if wall_seconds else 0.0,
+        "us_per_car_tick": wall_seconds / car_ticks * 1e6 if car_ticks else 0.0,
+        "check_network_seconds": check_network,
+        "check_network_ms_per_tick": check_network / len(ticks) * 1000 if ticks else 0.0,
+        "positions_seconds": positions,
+        "positions_ms_per_tick": positions / len(ticks) * 1000 if ticks else 0.0,
+        "neighbor_index_seconds": neighbor_index,
+        "neighbor_index_ms_per_tick": neighbor_index / len(ticks) * 1000 if ticks else 0.0,
+        "links_created": sum(entry["new_connections_made"] for entry in simulation.analytics_sink.entries),
+        "peak_rss_kb": max(rss) if rss else None,
+    }
+
+
+def revision():
+    """
+    Return the git revision of the working tree, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(fixture_dir, results_file=None, sizes=FIXTURE_SIZES, topologies=("smart", "random"),
+                   base_params=None, seed=0):
+    """
+    Run every benchmark case for every topology.
+
+    Args:
+        fixture_dir (str): Directory holding the generated fixture scenarios.
+        results_file (str): JSON file the results are saved to, e.g. as a baseline.
+        sizes (tuple): Fixture sizes in cars.
+        topologies (tuple): Names from sweep.TOPOLOGIES.
+        base_params (dict): Simulation parameters shared by every case.
+        seed (int): Seed of the fixtures and of the random module in every run.
+
+    Returns:
+        dict: {"revision", "python", "machine", "results": [one dict per case and topology]}.
+    """
+    results = []
+    for case in benchmark_cases(sizes):
+        scenario_path = fixture_scenario(fixture_dir, case["num_cars"], case["trip_km"], seed=seed)
+        params = {**(base_params or {}), "connection_distance": case["connection_distance"]}
+        for topology in topologies:
+            runs = [run_case(scenario_path, topology, params, seed)]
+            while sum(run["wall_seconds"] for run in runs) < MIN_CASE_SECONDS and len(runs) < MAX_REPEATS:
+                runs.append(run_case(scenario_path, topology, params, seed))
+            row = {"case": case["name"], "topology": topology, **case, "runs": len(runs)}
+            row.update(min(runs, key=lambda run: run["wall_seconds"]))
+            results.append(row)
+            print(f"{row['case']:>32} {topology:>8}: {row['ticks_per_second']:8.1f} ticks/s, "
+                  f"check_network {row['check_network_ms_per_tick']:8.2f} ms/tick, "
+                  f"{row['us_per_car_tick']:7.2f} us/car-tick")
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    if results_file:
+        with open(results_file, "w") as file:
+            json.dump(report, file, indent=1)
+        print(f"Benchmark results saved to {results_file}")
+    return report
+
+
+def run_shard_scaling(fixture_dir, results_file=None, num_cars=SHARD_SCALING_CARS, shard_counts=SHARD_COUNTS,
+                      topology="smart", base_params=None, seed=0):
+    """
+    Measure how the run time changes with the number of neighbor search shards.
+
+    Every sharded tick is split over the workers (shard_min_cars is 0), and the
+    links created are reported so a run that differs from the single-process one
+    stands out.
+
+    Args:
+        fixture_dir (str): Directory holding the generated fixture scenarios.
+        results_file (str): JSON file the results are saved to.
+        num_cars (int): Fixture size in cars.
+        shard_counts (tuple): Worker processes of each run, 0 for the single-process search.
+        topology (str): Name from sweep.TOPOLOGIES.
+        base_params (dict): Simulation parameters shared by every run.
+        seed (int): Seed of the fixture and of the random module in every run.
+
+    Returns:
+        dict: {"revision", "python", "machine", "cpus", "results": [one dict per shard count]}.
+    """
+    scenario_path = fixture_scenario(fixture_dir, num_cars, DEFAULT_TRIP_KM, seed=seed)
+    params = {**(base_params or {}), "connection_distance": DEFAULT_CONNECTION_DISTANCE, "shard_min_cars": 0}
+    results = []
+    for shards in shard_counts:
+        row = {"num_cars": num_cars, "topology": topology, "shards": shards}
+        row.update(run_case(scenario_path, topology, {**params, "shards": shards}, seed))
+        row["speedup"] = results[0]["wall_seconds"] / row["wall_seconds"] if results else 1.0
+        results.append(row)
+        print(f"{shards:2d} shards: {row['wall_seconds']:8.2f} s, neighbor search {row['neighbor_index_seconds']:8.2f} s, "
+              f"speedup {row['speedup']:5.2f}x, {row['links_created']} links")
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if results_file:
+        with open(results_file, "w") as file:
+            json.dump(report, file, indent=1)
+        print(f"Shard scaling results saved to {results_file}")
+    return report
+
+
+def compare_benchmarks(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare two benchmark reports case by case and print the ratio of each timing.
+
+    Returns:
+        list: (case, topology, metric, baseline value, current value) of every regression,
+              i.e. every timing more than `threshold` slower than in the baseline.
+    """
+    baseline_rows = {(row["case"], row["topology"]): row for row in baseline["results"]}
+    print(f"Baseline {baseline.get('revision')} vs current {current.get('revision')}")
+    print(f"{'case':>32} {'topology':>8}  " + "  ".join(f"{metric:>26}" for metric in COMPARED_METRICS))
+    regressions = []
+    for row in current["results"]:
+        reference = baseline_rows.get((row["case"], row["topology"]))
+        if reference is None:
+            continue
+        cells = []
+        for metric in COMPARED_METRICS:
+            if metric not in reference:  # Baseline from before the metric existed
+                cells.append(f"{'-':>26} ")
+                continue
+            ratio = row[metric] / reference[metric] if reference[metric] else float("nan")
+            flag = "!" if ratio > 1 + threshold else " "
+            if flag == "!":
+                regressions.append((row["case"], row["topology"], metric, reference[metric], row[metric]))
+            cells.append(f"{ratio:25.2f}x{flag}")
+        print(f"{row['case']:>32} {row['topology']:>8}  " + "  ".join(cells))
+    print(f"{len(regressions)} timings more than {threshold:.0%} slower than the baseline")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "run":
+        from main import simultation_params
+        sizes = tuple(int(size) for size in sys.argv[4:]) or FIXTURE_SIZES
+        run_benchmarks(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, sizes, base_params=simultation_params)
+    elif len(sys.argv) in (4, 5) and sys.argv[1] == "compare":
+        threshold = float(sys.argv[4]) if len(sys.argv) == 5 else REGRESSION_THRESHOLD
+        with open(sys.argv[2]) as baseline_file, open(sys.argv[3]) as current_file:
+            regressions = compare_benchmarks(json.load(baseline_file), json.load(current_file), threshold)
+        sys.exit(1 if regressions else 0)
+    elif len(sys.argv) >= 3 and sys.argv[1] == "shards":
+        from main import simultation_params
+        num_cars = int(sys.argv[4]) if len(sys.argv) > 4 else SHARD_SCALING_CARS
+        run_shard_scaling(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, num_cars,
+                          base_params=simultation_params)
+    else:
+        print("Usage: python benchmark.py run <fixture_dir> [results.json] [num_cars ...]\n"
+              "       python benchmark.py compare <baseline.json> <results.json> [threshold]\n"
+              "       python benchmark.py shards <fixture_dir> [results.json] [num_cars]")
+        sys.exit(1)
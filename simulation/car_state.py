@@ -0,0 +1,199 @@
+import numpy as np
+
+
+def trip_trajectory(trip):
+    """
+    Return the trajectory of a trip as arrays, whatever format it was built in.
+
+    Trips either hold a 'positions' list of {"position", "timestamp"} dicts (as saved
+    in simulation_data.json), or a (T, 2) 'positions' array or list of pairs with a
+    separate 'timestamps' sequence (as built by the parallel trip pipeline).
+
+    Returns:
+        tuple: ((T, 2) float64 positions, (T,) float64 timestamps).
+    """
+    positions = trip["positions"]
+    if len(positions) and isinstance(positions[0], dict):
+        return (np.array([position["position"][:2] for position in positions], dtype=np.float64),
+                np.array([position["timestamp"] for position in positions], dtype=np.float64))
+    positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+    timestamps = trip.get("timestamps")
+    if timestamps is None:
+        timestamps = np.arange(1, len(positions) + 1, dtype=np.float64)
+    return positions, np.asarray(timestamps, dtype=np.float64)
+
+
+class CarStateStore:
+    """
+    Struct-of-arrays storage for every car in a simulation.
+
+    Per-car state lives in contiguous NumPy arrays indexed by car id. All trajectories
+    are packed into one (total_positions, 2) buffer; car `i` owns the rows
+    `start[i]:start[i] + length[i]`. Trajectories are stored relative to a float64
+    `origin` so that the default float32 buffer keeps millimeter precision.
+    """
+    def __init__(self, offset, start, length, trajectories, timestamps, origin):
+        """
+        Args:
+            offset (array-like): Simulation tick at which each car starts driving.
+            start (array-like): First row of each car in the packed buffers.
+            length (array-like): Number of positions of each car.
+            trajectories (numpy.ndarray): Packed (total_positions, 2) positions relative to `origin`.
+            timestamps (numpy.ndarray): Packed (total_positions,) timestamps of each position.
+            origin (array-like): (latitude, longitude) subtracted from every stored position.
+        """
+        self.offset = np.asarray(offset, dtype=np.int64)
+        self.start = np.asarray(start, dtype=np.int64)
+        self.length = np.asarray(length, dtype=np.int64)
+        self.trajectories = trajectories
+        self.timestamps = timestamps
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.num_cars = len(self.offset)
+        self.init_car_state()
+        has_positions = self.length > 0
+        self.position[has_positions] = self.positions_at(np.flatnonzero(has_positions), 0)
+
+    def init_car_state(self):
+        """
+        Allocate the mutable per-car state, with every car inactive.
+        """
+        self.active = np.zeros(self.num_cars, dtype=bool)
+        self.completed = np.zeros(self.num_cars, dtype=bool)
+        self.position = np.zeros((self.num_cars, 2), dtype=np.float64)
+        self.motion_vector = np.zeros((self.num_cars, 3), dtype=np.float64)  # (d_lat, d_lon, speed)
+
+    @classmethod
+    def from_trips(cls, trips, dtype=np.float32):
+        """
+        Pack simulated trips into a store.
+
+        Args:
+            trips (list): Trips as produced by simulate_traffic_within_box, each with
+                          'offset' and a trajectory in any format accepted by trip_trajectory.
+            dtype (numpy.dtype): Storage type of the packed trajectory buffer.
+
+        Returns:
+            CarStateStore: The packed store. The trip dicts are not modified.
+        """
+        length = np.array([len(trip["positions"]) for trip in trips], dtype=np.int64)
+        start = np.zeros(len(trips), dtype=np.int64)
+        if len(trips):
+            start[1:] = np.cumsum(length)[:-1]
+        total = int(length.sum())
+
+        trajectories = np.empty((total, 2), dtype=dtype)
+        timestamps = np.empty(total, dtype=np.float64)
+        origin = None
+        for trip, first in zip(trips, start):
+            if not len(trip["positions"]):
+                continue
+            positions, trip_timestamps = trip_trajectory(trip)
+            if origin is None:
+                origin = positions[0].copy()
+            trajectories[first:first + len(positions)] = positions - origin
+            timestamps[first:first + len(positions)] = trip_timestamps
+        if origin is None:
+            origin = np.zeros(2, dtype=np.float64)
+
+        return cls([trip["offset"] for trip in trips], start, length, trajectories, timestamps, origin)
+
+    def fresh(self):
+        """
+        Return a new store sharing this store's trajectory buffers, with every car
+        back in its initial state. Lets several simulations run on one loaded scenario.
+        """
+        return CarStateStore(self.offset, self.start, self.length, self.trajectories, self.timestamps, self.origin)
+
+    def close(self):
+        """Release the files backing the store. An in-memory store holds none."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def positions_at(self, car_ids, index):
+        """
+        Return absolute positions of several cars at per-car trajectory indices.
+
+        Args:
+            car_ids (numpy.ndarray): Car ids.
+            index (numpy.ndarray or int): Index into each car's trajectory.
+
+        Returns:
+            numpy.ndarray: (len(car_ids), 2) float64 positions.
+        """
+        rows = self.start[car_ids] + index
+        return self.trajectories[rows].astype(np.float64) + self.origin
+
+    def trajectory(self, car_id):
+        """
+        Return the full trajectory of one car as a (length, 2) float64 array.
+        """
+        first = self.start[car_id]
+        return self.trajectories[first:first + self.length[car_id]].astype(np.float64) + self.origin
+
+    def trajectory_timestamps(self, car_id):
+        """
+        Return the timestamps of one car's trajectory.
+        """
+        first = self.start[car_id]
+        return self.timestamps[first:first + self.length[car_id]]
+
+    def load(self, car_ids):
+        """
+        Make the trajectories of arriving cars available. Every trajectory of this
+        store is always in memory, so there is nothing to do.
+        """
+
+    def release(self, car_ids):
+        """
+        Drop the trajectories of completed cars. Nothing to do for this store.
+        """
+
+    def memory_stats(self):
+        """
+        Returns:
+            dict: Bytes held by trajectory buffers and the number of cars whose trajectory they hold.
+        """
+        return {
+            "trajectory_bytes": self.trajectories.nbytes + self.timestamps.nbytes,
+            "loaded_cars": self.num_cars,
+        }
+
+    def checkpoint_arrays(self):
+        """
+        Return the mutable per-car arrays by name. A checkpoint saves them and a resumed
+        run writes them back in place.
+        """
+        return {"active": self.active, "completed": self.completed,
+                "position": self.position, "motion_vector": self.motion_vector}
+
+    def checkpoint_meta(self):
+        """
+        Return the scalar state a checkpoint needs besides checkpoint_arrays, as plain JSON values.
+        """
+        return {}
+
+    def restore_checkpoint(self, meta):
+        """
+        Finish restoring a checkpoint once the checkpoint arrays have been written back.
+
+        Args:
+            meta (dict): checkpoint_meta() of the checkpointed store.
+        """
+
+    def active_ids(self):
+        """
+        Return the ids of the active cars in ascending order.
+        """
+        return np.flatnonzero(self.active)
+
+    def nbytes(self):
+        """
+        Return the memory used by the NumPy arrays of the store, in bytes.
+        """
+        arrays = (self.offset, self.start, self.length, self.trajectories, self.timestamps,
+                  self.active, self.completed, self.position, self.motion_vector)
+        return sum(array.nbytes for array in arrays)
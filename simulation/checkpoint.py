@@ -0,0 +1,332 @@
+"""
+Checkpoints of a running NetworkSimulation.
+
+A checkpoint directory holds a numbered series of compressed .npz files. Every
+`full_interval`-th checkpoint is a full snapshot of the simulation state; the ones
+in between are deltas with only the per-car rows and the edges that changed since
+the previous checkpoint, so their size follows the activity of the interval rather
+than the number of cars. A full snapshot also carries every simulation_results
+record so far and a delta the ones produced since the previous checkpoint; every
+file carries the state of the random module and how far the analytics output had
+got. Once a full snapshot is on disk the checkpoints before it are removed, so
+the directory holds one chain of a full snapshot and its deltas.
+
+Checkpoints are taken at the top of the run loop, where the positions and motion
+vectors of the current tick are set and nothing of the tick has been checked yet.
+State that is rebuilt every tick (neighbor index, pair distances) or only memoizes
+a pure function (link lifetime cache, adaptive clock step bounds) is not saved.
+Resuming loads the latest full snapshot, applies the deltas after it and continues
+exactly as the interrupted run would have.
+"""
+import json
+import os
+import random
+import re
+import numpy as np
+from analytics_sink import to_builtin
+
+CHECKPOINT_VERSION = 2
+CHECKPOINT_FILE = re.compile(r"checkpoint-(\d{6})-(full|delta)\.npz$")
+# Simulation attributes saved as they are; each is saved only if the topology has it
+SIMULATION_ATTRIBUTES = (
+    "timestamp", "cars_completed", "new_connections_made", "old_connections_dropped",
+    "avg_connection_duration", "avg_connection_health", "time_tick", "num_connections", "ticks_skipped",
+)
+LINK_STATISTICS_ATTRIBUTES = ("num_links", "created_sum", "health_sum", "links_completed", "lifetime_sum")
+RESULT_ARRAYS = ("results_added", "results_added_counts", "results_removed", "results_removed_counts")
+
+
+def checkpoint_files(directory):
+    """
+    Returns:
+        list: (sequence number, "full" or "delta", path) of every checkpoint in `directory`, in order.
+    """
+    if not os.path.isdir(directory):
+        return []
+    files = []
+    for name in os.listdir(directory):
+        match = CHECKPOINT_FILE.match(name)
+        if match:
+            files.append((int(match.group(1)), match.group(2), os.path.join(directory, name)))
+    return sorted(files)
+
+
+def read_checkpoint(path, names=None):
+    """
+    Read one checkpoint file.
+
+    Args:
+        path (str): Checkpoint file.
+        names (tuple): Arrays to read besides the meta data, or None for all of them.
+
+    Returns:
+        tuple: (meta dict, {name: array}).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(data["meta"].tobytes().decode())
+        arrays = {name: data[name] for name in data.files if name != "meta" and (names is None or name in names)}
+    return meta, arrays
+
+
+def simulation_arrays(simulation):
+    """
+    Return the per-car arrays of a simulation by name: the car state and, with the
+    rolling estimator, its position windows.
+    """
+    arrays = simulation.state.checkpoint_arrays()
+    if simulation.motion_estimator is not None:
+        arrays.update(simulation.motion_estimator.checkpoint_arrays())
+    return arrays
+
+
+def tick_array(values):
+    """Pack creation ticks, keeping them integers unless some are not."""
+    integral = all(isinstance(value, (int, np.integer)) for value in values)
+    return np.array(values, dtype=np.int64 if integral else np.float64)
+
+
+def pack_pairs(pair_lists):
+    """
+    Flatten per-record pair lists.
+
+    Returns:
+        tuple: ((total, 2) int64 pairs, per-record pair counts).
+    """
+    counts = np.array([len(pairs) for pairs in pair_lists], dtype=np.int64)
+    pairs = np.array([pair for pairs in pair_lists for pair in pairs], dtype=np.int64).reshape(-1, 2)
+    return pairs, counts
+
+
+def unpack_pairs(pairs, counts):
+    """Inverse of pack_pairs, with the pairs as tuples."""
+    pairs = [tuple(pair) for pair in pairs.tolist()]
+    bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    return [pairs[first:last] for first, last in zip(bounds[:-1], bounds[1:])]
+
+
+class Checkpointer:
+    """
+    Writes the checkpoints of one simulation run and restores a run from them.
+
+    The arrays and edges of the last checkpoint are kept to diff the next one
+    against, which costs one extra copy of the per-car arrays.
+    """
+    def __init__(self, directory, interval=300, full_interval=10):
+        """
+        Args:
+            directory (str): Directory the checkpoint files are written to.
+            interval (int): Simulation seconds between two checkpoints.
+            full_interval (int): Every full_interval-th checkpoint is a full snapshot.
+        """
+        self.directory = directory
+        self.interval = interval
+        self.full_interval = full_interval
+        self.sequence = 0
+        self.deltas_since_full = None  # None until the first full snapshot
+        self.next_due = None
+        self.saved_arrays = {}
+        self.saved_edges = {}
+        self.results_saved = 0  # simulation_results records already in a checkpoint
+        self.entries_saved = 0  # Entries of a memory sink already in a checkpoint
+
+    def latest(self):
+        """
+        Return the meta data of the latest checkpoint in the directory, or None if there is none.
+        """
+        files = checkpoint_files(self.directory)
+        return read_checkpoint(files[-1][2], ())[0] if files else None
+
+    def start(self):
+        """
+        Prepare the directory for a new run, removing the checkpoints of an earlier one.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        for _, _, path in checkpoint_files(self.directory):
+            os.remove(path)
+
+    def prune(self, sequence):
+        """
+        Remove the checkpoints before `sequence`, once the full snapshot `sequence` is on disk.
+        """
+        for file_sequence, _, path in checkpoint_files(self.directory):
+            if file_sequence < sequence:
+                os.remove(path)
+
+    def due(self, timestamp):
+        """Return True if a checkpoint should be written at `timestamp`."""
+        return self.next_due is None or timestamp >= self.next_due
+
+    def write(self, simulation):
+        """
+        Write a full snapshot or a delta of the simulation's current state.
+
+        The analytics sink is flushed and fsynced first, so the checkpoint never
+        refers to output that is not on disk.
+        """
+        full = self.deltas_since_full is None or self.deltas_since_full + 1 >= self.full_interval
+        arrays = {}
+        for name, array in simulation_arrays(simulation).items():
+            if full:
+                arrays[name] = array
+                self.saved_arrays[name] = array.copy()
+                continue
+            saved = self.saved_arrays[name]
+            rows = np.flatnonzero((array != saved).reshape(len(array), -1).any(axis=1))
+            arrays[f"{name}_rows"] = rows
+            arrays[f"{name}_values"] = array[rows]
+            saved[rows] = array[rows]
+
+        # Edges keep their insertion order, which fixes the order links are validated in
+        edges = simulation.edges.edges
+        if full:
+            arrays["edge_keys"] = np.array(list(edges), dtype=np.int64).reshape(-1, 2)
+            arrays["edge_created"] = tick_array(list(edges.values()))
+        else:
+            saved_edges = self.saved_edges
+            removed = [key for key, created in saved_edges.items() if edges.get(key) != created]
+            added = [(key, created) for key, created in edges.items() if saved_edges.get(key) != created]
+            arrays["edges_removed"] = np.array(removed, dtype=np.int64).reshape(-1, 2)
+            arrays["edges_added"] = np.array([key for key, _ in added], dtype=np.int64).reshape(-1, 2)
+            arrays["edges_added_created"] = tick_array([created for _, created in added])
+        self.saved_edges = dict(edges)
+
+        # A full snapshot carries the whole log, so the checkpoints before it can go
+        results = simulation.simulation_results[0 if full else self.results_saved:]
+        self.results_saved = len(simulation.simulation_results)
+        arrays["results_added"], arrays["results_added_counts"] = pack_pairs(
+            [result["added_pairs"] for result in results])
+        arrays["results_removed"], arrays["results_removed_counts"] = pack_pairs(
+            [result["removed_pairs"] for result in results])
+
+        version, internal_state, gauss_next = random.getstate()
+        arrays["random_state"] = np.array(internal_state, dtype=np.uint32)
+
+        sink = simulation.analytics_sink
+        meta = {
+            "version": CHECKPOINT_VERSION,
+            "sequence": self.sequence,
+            "kind": "full" if full else "delta",
+            "topology": type(simulation).__name__,
+            "num_cars": simulation.state.num_cars,
+            "attributes": {name: getattr(simulation, name) for name in SIMULATION_ATTRIBUTES
+                           if hasattr(simulation, name)},
+            "link_statistics": {name: getattr(simulation.link_stats, name) for name in LINK_STATISTICS_ATTRIBUTES},
+            "lifetime_counts": list(simulation.link_stats.lifetime_counts.items()),
+            "random": [version, gauss_next],
+            "store": simulation.state.checkpoint_meta(),
+            "analytics": sink.position(),
+            "results": [[result["time_tick"], result["num_connections"], result["avg_connection_duration"],
+                         result["avg_connection_health"]] for result in results],
+        }
+        if sink.path is None:
+            meta["memory_entries"] = sink.entries[0 if full else self.entries_saved:]
+            self.entries_saved = len(sink.entries)
+        arrays["meta"] = np.frombuffer(json.dumps(meta, default=to_builtin).encode(), dtype=np.uint8)
+
+        path = os.path.join(self.directory, f"checkpoint-{self.sequence:06d}-{meta['kind']}.npz")
+        with open(path + ".tmp", "wb") as file:
+            np.savez_compressed(file, **arrays)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(path + ".tmp", path)  # A crash mid-write leaves the previous checkpoint the latest
+        if full:
+            self.prune(self.sequence)
+
+        self.sequence += 1
+        self.deltas_since_full = 0 if full else self.deltas_since_full + 1
+        self.next_due = simulation.timestamp + self.interval
+        print(f"Checkpoint {meta['kind']} {self.sequence - 1} written at {simulation.timestamp}")
+
+    def restore(self, simulation):
+        """
+        Restore a freshly created simulation from the latest checkpoint in the directory.
+
+        Raises:
+            ValueError: If there is no full snapshot, or the checkpoints were written by
+                        another topology, scenario or kind of analytics output.
+        """
+        files = checkpoint_files(self.directory)
+        fulls = [position for position, (_, kind, _) in enumerate(files) if kind == "full"]
+        if not fulls:
+            raise ValueError(f"No full checkpoint in {self.directory}")
+        chain = files[fulls[-1]:]
+
+        live = simulation_arrays(simulation)
+        edges = {}
+        for _, kind, path in chain:
+            meta, arrays = read_checkpoint(path)
+            if meta["version"] != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version {meta['version']} in {path}")
+            if meta["topology"] != type(simulation).__name__ or meta["num_cars"] != simulation.state.num_cars:
+                raise ValueError(f"{path} is a checkpoint of a {meta['topology']} run with {meta['num_cars']} cars")
+            if kind == "full":
+                for name, array in live.items():
+                    array[...] = arrays[name]
+                edges = dict(zip(map(tuple, arrays["edge_keys"].tolist()), arrays["edge_created"].tolist()))
+            else:
+                for name, array in live.items():
+                    array[arrays[f"{name}_rows"]] = arrays[f"{name}_values"]
+                for key in map(tuple, arrays["edges_removed"].tolist()):
+                    del edges[key]
+                edges.update(zip(map(tuple, arrays["edges_added"].tolist()), arrays["edges_added_created"].tolist()))
+
+        # The scalars of the latest checkpoint describe the state the arrays were restored to
+        for name, value in meta["attributes"].items():
+            setattr(simulation, name, value)
+        for name, value in meta["link_statistics"].items():
+            setattr(simulation.link_stats, name, value)
+        simulation.link_stats.lifetime_counts = {bin_index: count for bin_index, count in meta["lifetime_counts"]}
+        for (car_id, other_car_id), created in edges.items():
+            simulation.edges.add(car_id, other_car_id, created)
+        simulation.edges.begin_tick()
+        version, gauss_next = meta["random"]
+        random.setstate((version, tuple(arrays["random_state"].tolist()), gauss_next))
+        simulation.state.restore_checkpoint(meta["store"])
+        simulation.schedule.restore(simulation.timestamp, np.flatnonzero(simulation.state.active))
+        simulation.active_car_ids = simulation.schedule.active_ids()
+
+        # simulation_results and a memory sink are append-only logs spread over the chain
+        sink = simulation.analytics_sink
+        if ("size" in meta["analytics"]) != (sink.path is not None):
+            raise ValueError("The checkpoints were written with a different kind of analytics output")
+        results, entries = [], []
+        for _, _, path in chain:
+            file_meta, arrays = read_checkpoint(path, RESULT_ARRAYS)
+            added = unpack_pairs(arrays["results_added"], arrays["results_added_counts"])
+            removed = unpack_pairs(arrays["results_removed"], arrays["results_removed_counts"])
+            for (time_tick, num_connections, duration, health), added_pairs, removed_pairs in zip(
+                    file_meta["results"], added, removed):
+                results.append({
+                    "time_tick": time_tick,
+                    "added_pairs": added_pairs,
+                    "removed_pairs": removed_pairs,
+                    "num_connections": num_connections,
+                    "avg_connection_duration": duration,
+                    "avg_connection_health": health,
+                })
+            entries += file_meta.get("memory_entries", [])
+        simulation.simulation_results[:] = results
+        if sink.path is None:
+            sink.entries[:] = entries
+        else:
+            sink.entries_written = meta["analytics"]["entries"]
+
+        self.saved_arrays = {name: array.copy() for name, array in live.items()}
+        self.saved_edges = edges
+        self.results_saved = len(results)
+        self.entries_saved = len(entries)
+        self.sequence = files[-1][0] + 1
+        self.deltas_since_full = len(chain) - 1
+        self.next_due = simulation.timestamp + self.interval
+        print(f"Resumed from checkpoint {files[-1][0]} at {simulation.timestamp}")
+
+
+def make_checkpointer(sim_params):
+    """
+    Create the checkpointer of a simulation from sim_params['checkpoint_dir'], or None without one.
+    """
+    directory = sim_params.get("checkpoint_dir")
+    if not directory:
+        return None
+    return Checkpointer(directory, sim_params.get("checkpoint_interval", 300),
+                        sim_params.get("checkpoint_full_interval", 10))
@@ -0,0 +1,150 @@
+import math
+import random
+import numpy as np
+from geopy.distance import geodesic
+
+EARTH_RADIUS = 6371000  # Radius of Earth in meters, same as NetworkSimulation.calculate_distance
+
+DISTANCE_MODES = ("haversine", "flat", "geodesic")
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """
+    Vectorized Haversine distance.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees.
+
+    Returns:
+        numpy.ndarray: Distances in kilometers.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS * c / 1000
+
+
+def flat_distance(lat1, lon1, lat2, lon2):
+    """
+    Vectorized equirectangular (flat-earth) distance, projected around the mean latitude of each pair.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees.
+
+    Returns:
+        numpy.ndarray: Distances in kilometers.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    x = (lon2 - lon1) * np.cos((lat1 + lat2) / 2)
+    y = lat2 - lat1
+    return EARTH_RADIUS * np.hypot(x, y) / 1000
+
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """
+    Exact ellipsoidal distance using geopy, one pair at a time. Used for validation.
+
+    Args:
+        lat1, lon1, lat2, lon2 (array-like): Coordinates in degrees.
+
+    Returns:
+        numpy.ndarray: Distances in kilometers.
+    """
+    lat1, lon1, lat2, lon2 = (np.atleast_1d(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    return np.array([
+        geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).km
+        for i in range(len(lat1))
+    ], dtype=np.float64)
+
+
+DISTANCE_FUNCTIONS = {
+    "haversine": haversine_distance,
+    "flat": flat_distance,
+    "geodesic": geodesic_distance,
+}
+
+
+class DistanceEngine:
+    """
+    Batched distance computation with a selectable accuracy mode.
+
+    Positions follow the NetworkSimulation convention: (latitude, longitude) pairs.
+    """
+    def __init__(self, mode="haversine"):
+        if mode not in DISTANCE_FUNCTIONS:
+            raise ValueError(f"Unknown distance mode '{mode}'. Choose from {list(DISTANCE_MODES)}.")
+        self.mode = mode
+        self.function = DISTANCE_FUNCTIONS[mode]
+
+    def distances(self, positions1, positions2):
+        """
+        Compute the distance between each row of two position arrays.
+
+        Args:
+            positions1 (array-like): (n, 2) array of (latitude, longitude).
+            positions2 (array-like): (n, 2) array of (latitude, longitude).
+
+        Returns:
+            numpy.ndarray: Distances in kilometers, shape (n,).
+        """
+        positions1 = np.asarray(positions1, dtype=np.float64).reshape(-1, 2)
+        positions2 = np.asarray(positions2, dtype=np.float64).reshape(-1, 2)
+        if len(positions1) == 0:
+            return np.zeros(0, dtype=np.float64)
+        return self.function(positions1[:, 0], positions1[:, 1], positions2[:, 0], positions2[:, 1])
+
+    def distance(self, pos1, pos2):
+        """
+        Compute the distance between two positions in kilometers.
+        """
+        return float(self.distances([pos1], [pos2])[0])
+
+
+def error_bound_report(center, max_distance_km=0.4, num_samples=2000, seed=0):
+    """
+    Compare every distance mode against the exact geodesic on random pairs around a center.
+
+    Args:
+        center (tuple): (latitude, longitude) to sample around.
+        max_distance_km (float): Largest pair separation to sample.
+        num_samples (int): Number of random pairs.
+        seed (int): Seed for the sampler.
+
+    Returns:
+        dict: Per mode, the max and mean absolute error in meters and the max relative error.
+    """
+    rng = random.Random(seed)
+    lat_span = max_distance_km / 111
+    lon_span = max_distance_km / (111 * max(abs(math.cos(math.radians(center[0]))), 1e-6))
+    positions1, positions2 = [], []
+    for _ in range(num_samples):
+        start = (center[0] + rng.uniform(-lat_span, lat_span), center[1] + rng.uniform(-lon_span, lon_span))
+        bearing = rng.uniform(0, 2 * math.pi)
+        scale = rng.uniform(0, 1) / math.sqrt(2)
+        positions1.append(start)
+        positions2.append((start[0] + lat_span * scale * math.sin(bearing),
+                           start[1] + lon_span * scale * math.cos(bearing)))
+
+    reference = DistanceEngine("geodesic").distances(positions1, positions2) * 1000
+    report = {}
+    for mode in DISTANCE_MODES:
+        values = DistanceEngine(mode).distances(positions1, positions2) * 1000
+        errors = np.abs(values - reference)
+        relative = errors[reference > 0] / reference[reference > 0]
+        report[mode] = {
+            "max_abs_error_m": float(errors.max()),
+            "mean_abs_error_m": float(errors.mean()),
+            "max_rel_error": float(relative.max()) if len(relative) else 0.0,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    sim_center = (42.3141061843, -83.0368789337)
+    for distance_km in (0.1, 0.4, 1.0):
+        print(f"Pairs up to {distance_km} km around {sim_center}:")
+        for mode, errors in error_bound_report(sim_center, distance_km).items():
+            print(f"  {mode:>9}: max {errors['max_abs_error_m']:.4f} m, mean {errors['mean_abs_error_m']:.4f} m, "
+                  f"max relative {errors['max_rel_error']:.2e}")
@@ -0,0 +1,100 @@
+class EdgeStore:
+    """
+    Undirected connection graph between cars.
+
+    Every edge is kept once in `edges` under its canonical (min id, max id) key,
+    mapped to the tick it was created at, and in both endpoints' adjacency sets, so
+    adding, dropping and looking up an edge are O(1). The edges added and removed
+    since the last begin_tick() are recorded as the tick's delta.
+    """
+    def __init__(self, num_cars):
+        """
+        Args:
+            num_cars (int): Number of cars; car ids are 0..num_cars-1.
+        """
+        self.adjacency = [set() for _ in range(num_cars)]
+        self.edges = {}  # (min id, max id) -> creation tick
+        self.added = []  # Keys added this tick
+        self.removed = []  # (key, creation tick) removed this tick
+
+    @staticmethod
+    def key(car_id, other_car_id):
+        """Return the canonical key of an edge."""
+        return (car_id, other_car_id) if car_id < other_car_id else (other_car_id, car_id)
+
+    def begin_tick(self):
+        """Start recording a new delta."""
+        self.added = []
+        self.removed = []
+
+    def add(self, car_id, other_car_id, tick):
+        """
+        Connect two cars. Returns False if they were already connected.
+        """
+        key = self.key(car_id, other_car_id)
+        if key in self.edges:
+            return False
+        self.edges[key] = tick
+        self.adjacency[car_id].add(other_car_id)
+        self.adjacency[other_car_id].add(car_id)
+        self.added.append(key)
+        return True
+
+    def drop(self, car_id, other_car_id):
+        """
+        Disconnect two cars. Returns the tick the edge was created at, or None if there was no edge.
+        """
+        key = self.key(car_id, other_car_id)
+        created = self.edges.pop(key, None)
+        if created is None:
+            return None
+        self.adjacency[car_id].discard(other_car_id)
+        self.adjacency[other_car_id].discard(car_id)
+        self.removed.append((key, created))
+        return created
+
+    def connected(self, car_id, other_car_id):
+        """Return True if the two cars are connected."""
+        return self.key(car_id, other_car_id) in self.edges
+
+    def degree(self, car_id):
+        """Return the number of connections of a car."""
+        return len(self.adjacency[car_id])
+
+    def neighbors(self, car_id):
+        """Return the set of cars connected to a car. Do not modify it."""
+        return self.adjacency[car_id]
+
+    def pairs(self):
+        """Return a snapshot list of every edge key."""
+        return list(self.edges)
+
+    def delta(self):
+        """
+        Returns:
+            tuple: (added keys, removed keys) since the last begin_tick().
+        """
+        return list(self.added), [key for key, _ in self.removed]
+
+    def __len__(self):
+        return len(self.edges)
+
+    def __contains__(self, key):
+        return key in self.edges
+
+
+def replay_connected_pairs(simulation_results):
+    """
+    Rebuild the full set of connected pairs after each tick from recorded deltas.
+
+    Args:
+        simulation_results (list): Per-tick records with 'added_pairs' and 'removed_pairs'.
+
+    Yields:
+        set: Canonical (min id, max id) pairs connected at the end of each tick.
+    """
+    pairs = set()
+    for result in simulation_results:
+        pairs.difference_update(tuple(pair) for pair in result["removed_pairs"])
+        pairs.update(tuple(pair) for pair in result["added_pairs"])
+        yield set(pairs)
@@ -0,0 +1,439 @@
+"""
+Differential equivalence harness between the reference and the optimized engines.
+
+The reference is the "baseline" engine: the frozen pre-optimization code of
+reference_topology, with per-car dicts and exact geodesic distances. Engines
+compared against it measure distances the same way. Topologies that have no
+baseline (lookahead) are compared against the "brute" engine, the current code
+with the brute-force neighbor search, which is itself checked against the baseline.
+
+An engine is one way of turning routes into trajectories and running a topology
+on them: which trajectory simulator, store precision, neighbor index, scoring
+kernel, motion estimator, clock and store backend it uses. The harness runs two
+engines on the same seeded routes with the same random seed. It then compares
+the trajectories, the connected pairs after every check and the analytics, and
+reports the first tick at which they diverge.
+
+For a divergence it also looks for a minimal repro. The scenario is cut off at
+the divergent tick and shrunk to the cars involved, their links, and then all
+cars active at that tick, until the divergence still shows. The result is
+written as a JSON file that `python equivalence.py repro <file>` runs again.
+"""
+import contextlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import numpy as np
+from car_state import CarStateStore
+from distance_engine import haversine_distance
+from edge_store import replay_connected_pairs
+from osrm_stub_server import straight_route
+from reference_topology import REFERENCE_TOPOLOGIES, CHANGED_ANALYTICS
+from scenario import save_scenario, load_scenario
+from sweep import TOPOLOGIES
+from traffic_simulation import simulate_car_on_route, simulate_car_on_route_stepwise
+from utils import manual_bounding_boxes
+
+TRAJECTORY_SIMULATORS = {
+    "stepwise": simulate_car_on_route_stepwise,
+    "interpolated": simulate_car_on_route,
+}
+# Each engine overrides the simulation parameters it is about; "sampled" engines
+# only produce analytics for some ticks, which are compared against the same ticks.
+# The "baseline" engine runs reference_topology, and "shared_params" are given to
+# every engine compared against it.
+REFERENCE_ENGINE = "baseline"
+FALLBACK_REFERENCE_ENGINE = "brute"  # For topologies reference_topology does not have
+ENGINES = {
+    "baseline": {"trajectory": "stepwise", "dtype": "float64", "baseline": True, "params": {},
+                 "shared_params": {"distance_mode": "geodesic"}},
+    "brute": {"trajectory": "stepwise", "dtype": "float64",
+              "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "vectorized"}},
+    "interpolated": {"trajectory": "interpolated", "dtype": "float64",
+                     "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "vectorized"}},
+    "float32": {"trajectory": "stepwise", "dtype": "float32",
+                "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "vectorized"}},
+    "grid": {"trajectory": "stepwise", "dtype": "float64",
+             "params": {"neighbor_index": "grid", "use_numba": False, "motion_estimator": "vectorized"}},
+    "kdtree": {"trajectory": "stepwise", "dtype": "float64",
+               "params": {"neighbor_index": "kdtree", "use_numba": False, "motion_estimator": "vectorized"}},
+    "numba": {"trajectory": "stepwise", "dtype": "float64",
+              "params": {"neighbor_index": "brute", "use_numba": True, "motion_estimator": "vectorized"}},
+    "rolling": {"trajectory": "stepwise", "dtype": "float64",
+                "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "rolling"}},
+    "streaming": {"trajectory": "stepwise", "dtype": "float64", "stream": True,
+                  "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "vectorized"}},
+    "adaptive": {"trajectory": "stepwise", "dtype": "float64", "sampled": True,
+                 "params": {"neighbor_index": "brute", "use_numba": False, "motion_estimator": "vectorized",
+                            "adaptive_clock": True}},
+    "sharded": {"trajectory": "stepwise", "dtype": "float64",
+                "params": {"neighbor_index": "grid", "use_numba": False, "motion_estimator": "vectorized",
+                           "shards": 2, "shard_min_cars": 0, "shard_rebalance_interval": 10}},
+    "optimized": {"trajectory": "interpolated", "dtype": "float32",
+                  "params": {"neighbor_index": "grid", "use_numba": True, "motion_estimator": "vectorized"}},
+}
+DEFAULT_TOLERANCES = {
+    "position_m": 0.5,  # Largest trajectory difference in meters
+    "analytics_rel": 1e-9,  # Relative difference of numeric analytics fields
+    "analytics_abs": 1e-12,  # Absolute difference of numeric analytics fields
+    "pair_mismatches": 0,  # Connected pairs allowed to differ at a tick
+}
+IGNORED_ANALYTICS = ("trajectory_bytes", "loaded_cars")  # Depend on the store backend by design
+STUB_CENTER = (42.3141061843, -83.0368789337)
+
+
+def reference_engine(topology):
+    """
+    Return the engine the other engines of a topology are compared against.
+    """
+    return REFERENCE_ENGINE if topology in REFERENCE_TOPOLOGIES else FALLBACK_REFERENCE_ENGINE
+
+
+def seeded_routes(num_cars=200, size_km=1.0, seed=0, offset_range=(0, 120)):
+    """
+    Generate routes with one bend through a box, offline, with osrm_stub_server.
+
+    Returns:
+        tuple: (routes, offsets, bounding_box).
+    """
+    rng = random.Random(seed)
+    bounding_box = manual_bounding_boxes(STUB_CENTER, size_km)
+
+    def point():
+        return [rng.uniform(bounding_box["min_lon"], bounding_box["max_lon"]),
+                rng.uniform(bounding_box["min_lat"], bounding_box["max_lat"])]
+
+    routes = [straight_route([point(), point(), point()]) for _ in range(num_cars)]
+    offsets = [rng.randint(*offset_range) for _ in range(num_cars)]
+    return routes, offsets, bounding_box
+
+
+def routes_from_simulation_data(json_file):
+    """
+    Take the routes and offsets of an existing simulation_data.json.
+
+    Returns:
+        tuple: (routes, offsets, bounding_box).
+    """
+    with open(json_file) as file:
+        data = json.load(file)
+    trips = data["simulation_data"]
+    return [trip["route"] for trip in trips], [trip["offset"] for trip in trips], data["bounding_box"]
+
+
+def engine_trips(routes, offsets, trajectory="interpolated", max_tick=None):
+    """
+    Simulate every route with one of TRAJECTORY_SIMULATORS and cut trips off after `max_tick`.
+    """
+    simulate = TRAJECTORY_SIMULATORS[trajectory]
+    trips = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for route, offset in zip(routes, offsets):
+            positions = simulate(route, start_time=0.0)
+            if max_tick is not None:
+                positions = positions[:max(0, max_tick - offset + 1)]
+            trips.append({"route": route, "positions": positions, "offset": offset})
+    return trips
+
+
+class EngineRun:
+    """
+    Everything one engine produced on a scenario.
+
+    Attributes:
+        trajectories (list): (length, 2) float64 trajectory of each car.
+        ticks (dict): Analytics timestamp -> (set of connected pairs, analytics entry),
+                      for the check that precedes each analytics entry.
+    """
+    def __init__(self, trajectories, ticks):
+        self.trajectories = trajectories
+        self.ticks = ticks
+
+
+def run_engine(engine_name, routes, offsets, bounding_box, topology="smart", sim_params=None, seed=0, max_tick=None):
+    """
+    Run one engine on a scenario.
+
+    Returns:
+        EngineRun: Trajectories, connected pairs and analytics of the run.
+    """
+    engine = ENGINES[engine_name]
+    trips = engine_trips(routes, offsets, engine["trajectory"], max_tick)
+    store = CarStateStore.from_trips(trips, dtype=np.dtype(engine["dtype"]))
+    trajectories = [store.trajectory(car_id) for car_id in range(store.num_cars)]
+    params = {**(sim_params or {}), **engine["params"]}
+
+    random.seed(seed)
+    if engine.get("baseline"):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            simulation = REFERENCE_TOPOLOGIES[topology](store, bounding_box, params)
+            simulation.run_simulation(time_interval=1)
+        return EngineRun(trajectories, {entry["timestamp"]: (connected, entry)
+                                        for connected, entry in zip(simulation.tick_pairs, simulation.analytics)})
+
+    with tempfile.TemporaryDirectory() as scenario_dir, \
+            open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if engine.get("stream"):
+            save_scenario(scenario_dir, trips, bounding_box, dtype=np.dtype(engine["dtype"]))
+            store, _ = load_scenario(scenario_dir, stream=True)
+        with store:
+            simulation = TOPOLOGIES[topology](store, bounding_box, params)
+            simulation.run_simulation(time_interval=1)
+
+    entries = simulation.analytics_sink.entries
+    pairs = replay_connected_pairs(simulation.simulation_results)
+    return EngineRun(trajectories, {entry["timestamp"]: (connected, entry) for connected, entry in zip(pairs, entries)})
+
+
+def compare_trajectories(reference, candidate, position_m):
+    """
+    Returns:
+        dict: The first car whose trajectory differs by more than `position_m` meters, or None.
+    """
+    for car_id, (expected, actual) in enumerate(zip(reference.trajectories, candidate.trajectories)):
+        if len(expected) != len(actual):
+            return {"car_id": car_id, "reason": "length", "reference": len(expected), "candidate": len(actual)}
+        if not len(expected):
+            continue
+        # Positions are (lat, lon) as in the simulation
+        errors = haversine_distance(expected[:, 0], expected[:, 1], actual[:, 0], actual[:, 1]) * 1000
+        index = int(np.argmax(errors))
+        if errors[index] > position_m:
+            return {"car_id": car_id, "reason": "position", "index": index, "error_m": float(errors[index]),
+                    "reference": expected[index].tolist(), "candidate": actual[index].tolist()}
+    return None
+
+
+def analytics_differences(expected, actual, rel, abs_tol, ignored=()):
+    """
+    Return {field: (reference, candidate)} for the analytics fields that differ beyond the tolerances.
+
+    Only the fields the reference reports are compared, except those in IGNORED_ANALYTICS and `ignored`.
+    """
+    differences = {}
+    for field in sorted(expected):
+        if field in IGNORED_ANALYTICS or field in ignored:
+            continue
+        value, other = expected.get(field), actual.get(field)
+        if isinstance(value, (int, float)) and isinstance(other, (int, float)):
+            if math.isclose(value, other, rel_tol=rel, abs_tol=abs_tol):
+                continue
+        elif value == other:
+            continue
+        differences[field] = (value, other)
+    return differences
+
+
+def compare_ticks(reference, candidate, tolerances, sampled=False, ignored=()):
+    """
+    Compare connected pairs and analytics tick by tick.
+
+    Args:
+        sampled (bool): The candidate only reports some ticks; others are not counted as missing.
+        ignored (tuple): Analytics fields not compared.
+
+    Returns:
+        dict: The first divergent tick, or None.
+    """
+    for timestamp in sorted(set(reference.ticks) | set(candidate.ticks)):
+        if timestamp not in candidate.ticks and sampled:
+            continue
+        if timestamp not in reference.ticks or timestamp not in candidate.ticks:
+            return {"timestamp": timestamp, "reason": "missing tick",
+                    "in_reference": timestamp in reference.ticks, "in_candidate": timestamp in candidate.ticks}
+        expected_pairs, expected_entry = reference.ticks[timestamp]
+        actual_pairs, actual_entry = candidate.ticks[timestamp]
+        only_reference = sorted(expected_pairs - actual_pairs)
+        only_candidate = sorted(actual_pairs - expected_pairs)
+        differences = analytics_differences(expected_entry, actual_entry,
+                                            tolerances["analytics_rel"], tolerances["analytics_abs"], ignored)
+        if len(only_reference) + len(only_candidate) > tolerances["pair_mismatches"] or differences:
+            return {"timestamp": timestamp, "reason": "topology" if only_reference or only_candidate else "analytics",
+                    "only_reference": only_reference, "only_candidate": only_candidate,
+                    "analytics": differences}
+    return None
+
+
+def comparison_params(reference, sim_params):
+    """
+    Return the simulation parameters both engines of a comparison against `reference` run with.
+    """
+    return {**(sim_params or {}), **ENGINES[reference].get("shared_params", {})}
+
+
+def compare_runs(expected, actual, candidate, reference, topology="smart", tolerances=None):
+    """
+    Find where the runs of a reference and a candidate engine diverge.
+
+    Returns:
+        dict: {"trajectory": first divergent trajectory or None, "tick": first divergent tick or None}.
+    """
+    tolerances = {**DEFAULT_TOLERANCES, **(tolerances or {})}
+    ignored = CHANGED_ANALYTICS.get(topology, ()) if ENGINES[reference].get("baseline") else ()
+    return {
+        "trajectory": compare_trajectories(expected, actual, tolerances["position_m"]),
+        "tick": compare_ticks(expected, actual, tolerances, ENGINES[candidate].get("sampled", False), ignored),
+    }
+
+
+def compare_engines(routes, offsets, bounding_box, candidate, reference=None, topology="smart",
+                    sim_params=None, seed=0, tolerances=None, max_tick=None):
+    """
+    Run two engines on the same scenario and find where they diverge.
+
+    Args:
+        reference (str): Engine to compare against; defaults to reference_engine(topology).
+
+    Returns:
+        dict: Result of compare_runs.
+    """
+    reference = reference or reference_engine(topology)
+    params = comparison_params(reference, sim_params)
+    expected = run_engine(reference, routes, offsets, bounding_box, topology, params, seed, max_tick)
+    actual = run_engine(candidate, routes, offsets, bounding_box, topology, params, seed, max_tick)
+    return compare_runs(expected, actual, candidate, reference, topology, tolerances)
+
+
+def divergence_cars(divergence, reference_run):
+    """
+    Candidate car subsets for a repro of a tick divergence, smallest first.
+    """
+    timestamp = divergence["timestamp"]
+    involved = {car_id for pair in divergence.get("only_reference", []) + divergence.get("only_candidate", [])
+                for car_id in pair}
+    pairs = reference_run.ticks.get(timestamp, (set(), None))[0]
+    linked = involved | {car_id for pair in pairs if set(pair) & involved for car_id in pair}
+    active = {car_id for car_id, trajectory in enumerate(reference_run.trajectories) if len(trajectory)}
+    subsets = [involved, linked, active]
+    return [sorted(subset) for index, subset in enumerate(subsets)
+            if subset and subset not in subsets[:index]]
+
+
+def minimal_repro(routes, offsets, bounding_box, candidate, divergence, reference=None,
+                  topology="smart", sim_params=None, seed=0, tolerances=None):
+    """
+    Shrink a tick divergence to the smallest scenario that still shows one.
+
+    The trips are cut off at the divergent tick, then restricted to ever larger sets
+    of cars until the two engines still diverge.
+
+    Returns:
+        dict: Repro description accepted by run_repro.
+    """
+    max_tick = divergence["timestamp"]
+    reference = reference or reference_engine(topology)
+    reference_run = run_engine(reference, routes, offsets, bounding_box, topology,
+                               comparison_params(reference, sim_params), seed, max_tick)
+    subsets = divergence_cars(divergence, reference_run) + [list(range(len(routes)))]
+    for car_ids in subsets:
+        repro = {
+            "reference": reference, "candidate": candidate, "topology": topology, "seed": seed,
+            "sim_params": sim_params or {}, "tolerances": tolerances or {}, "max_tick": max_tick,
+            "car_ids": car_ids, "bounding_box": bounding_box,
+            "routes": [routes[car_id] for car_id in car_ids], "offsets": [offsets[car_id] for car_id in car_ids],
+        }
+        result = run_repro(repro)
+        if result["tick"] is not None:
+            repro["divergence"] = result["tick"]
+            return repro
+    return None
+
+
+def run_repro(repro):
+    """
+    Run a repro written by minimal_repro.
+
+    Returns:
+        dict: Result of compare_engines on the repro scenario.
+    """
+    return compare_engines(repro["routes"], repro["offsets"], repro["bounding_box"], repro["candidate"],
+                           repro["reference"], repro["topology"], repro["sim_params"], repro["seed"],
+                           repro["tolerances"], repro["max_tick"])
+
+
+def print_result(candidate, result):
+    """
+    Print the outcome of one engine comparison.
+    """
+    if result["trajectory"] is None:
+        print(f"{candidate}: trajectories match")
+    else:
+        print(f"{candidate}: trajectories diverge: {result['trajectory']}")
+    divergence = result["tick"]
+    if divergence is None:
+        print(f"{candidate}: connected pairs and analytics match at every tick")
+        return
+    print(f"{candidate}: first divergent tick {divergence['timestamp']} ({divergence['reason']})")
+    for key in ("only_reference", "only_candidate"):
+        if divergence.get(key):
+            print(f"    pairs {key.replace('_', ' ')}: {divergence[key][:10]}")
+    for field, (expected, actual) in divergence.get("analytics", {}).items():
+        print(f"    {field}: reference {expected}, candidate {actual}")
+
+
+def check_engines(candidates, num_cars=200, topology="smart", sim_params=None, seed=0, tolerances=None,
+                  repro_dir=None, json_file=None):
+    """
+    Compare each candidate engine against the reference of the topology and write a repro for every divergence.
+
+    Args:
+        candidates (list): Names from ENGINES.
+        num_cars (int): Number of seeded stub routes, unless `json_file` is given.
+        topology (str): Name from sweep.TOPOLOGIES.
+        sim_params (dict): Simulation parameters shared by both engines.
+        seed (int): Seed of the routes and of the random module in every run.
+        tolerances (dict): Overrides of DEFAULT_TOLERANCES.
+        repro_dir (str): Directory the repro files are written to.
+        json_file (str): simulation_data.json to take the routes from instead.
+
+    Returns:
+        dict: Engine name -> result of compare_engines.
+    """
+    if json_file:
+        routes, offsets, bounding_box = routes_from_simulation_data(json_file)
+    else:
+        routes, offsets, bounding_box = seeded_routes(num_cars, seed=seed)
+    reference = reference_engine(topology)
+    params = comparison_params(reference, sim_params)
+    # The reference runs once; each candidate is compared against that run
+    expected = run_engine(reference, routes, offsets, bounding_box, topology, params, seed)
+    results = {}
+    for candidate in candidates:
+        actual = run_engine(candidate, routes, offsets, bounding_box, topology, params, seed)
+        result = compare_runs(expected, actual, candidate, reference, topology, tolerances)
+        print_result(candidate, result)
+        if result["tick"] is not None and repro_dir:
+            repro = minimal_repro(routes, offsets, bounding_box, candidate, result["tick"], reference, topology,
+                                  sim_params, seed, tolerances)
+            if repro is not None:
+                os.makedirs(repro_dir, exist_ok=True)
+                repro_file = os.path.join(repro_dir, f"repro-{candidate}-{topology}.json")
+                with open(repro_file, "w") as file:
+                    json.dump(repro, file)
+                print(f"    minimal repro with {len(repro['car_ids'])} cars up to tick {repro['max_tick']}: "
+                      f"python equivalence.py repro {repro_file}")
+        results[candidate] = result
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "repro":
+        with open(sys.argv[2]) as repro_file:
+            repro = json.load(repro_file)
+        print_result(repro["candidate"], run_repro(repro))
+    elif len(sys.argv) >= 3 and sys.argv[1] == "check":
+        from main import simultation_params
+        # Arguments of the form name=value override DEFAULT_TOLERANCES
+        overrides = dict(argument.split("=", 1) for argument in sys.argv[3:] if "=" in argument)
+        names = [argument for argument in sys.argv[3:] if "=" not in argument]
+        names = names or [name for name in ENGINES if name not in (REFERENCE_ENGINE, reference_engine(sys.argv[2]))]
+        check_engines(names, topology=sys.argv[2], sim_params=simultation_params,
+                      tolerances={name: float(value) for name, value in overrides.items()},
+                      repro_dir="equivalence_repros")
+    else:
+        print("Usage: python equivalence.py check <smart|random|lookahead> [engine ...] [tolerance=value ...]\n"
+              "       python equivalence.py repro <repro.json>")
+        sys.exit(1)
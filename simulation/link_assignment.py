@@ -0,0 +1,39 @@
+import numpy as np
+
+LINK_ASSIGNMENTS = ("greedy", "matching")
+
+
+def b_matching(first, second, scores, capacity, connected=None):
+    """
+    Select links for a whole tick as a greedy maximum-weight b-matching.
+
+    Candidate pairs are visited once in order of descending score (ties by ids),
+    and a pair is taken while both of its cars have capacity left. Unlike the
+    per-car greedy loop the result does not depend on car id order, and no car
+    takes more links than its capacity. The total score is at least half of the
+    optimal b-matching.
+
+    Args:
+        first (numpy.ndarray): First car of each candidate pair.
+        second (numpy.ndarray): Second car of each candidate pair.
+        scores (numpy.ndarray): Score of each candidate pair.
+        capacity (numpy.ndarray): Links each car may still take, indexed by car id. Updated in place.
+        connected (callable): Optional connected(car_id, other_car_id) to skip existing links.
+
+    Returns:
+        list: Selected (car id, other car id) pairs in selection order.
+    """
+    usable = (capacity[first] > 0) & (capacity[second] > 0)
+    first, second, scores = first[usable], second[usable], scores[usable]
+    order = np.lexsort((second, first, -scores))
+    remaining = capacity.tolist()
+    selected = []
+    for car_id, other_car_id in zip(first[order].tolist(), second[order].tolist()):
+        if remaining[car_id] and remaining[other_car_id]:
+            if connected is not None and connected(car_id, other_car_id):
+                continue
+            remaining[car_id] -= 1
+            remaining[other_car_id] -= 1
+            selected.append((car_id, other_car_id))
+    capacity[:] = remaining
+    return selected
@@ -0,0 +1,112 @@
+import numpy as np
+
+PREDICTION_MODES = ("trajectory", "motion")
+
+
+class LinkLifetimePredictor:
+    """
+    Predicts how many more steps two cars will stay within connection range.
+
+    In "trajectory" mode the cars' known future positions are read from the state
+    store; in "motion" mode their current motion vectors are extrapolated. Pairs
+    are predicted in one batched distance call over the look-ahead horizon.
+
+    Steps are `step_seconds` of simulation time apart. In trajectory mode a
+    prediction is cached per pair as the timestamp the link is expected to break
+    at, converted back to steps on every hit, and reused until it expires.
+    Predictions that ran into the horizon are only lower bounds and are recomputed
+    every time, so a lifetime only depends on the pair and the timestamp, not on
+    which ticks were visited before.
+    """
+    def __init__(self, state, distance_engine, connection_distance, horizon=30, mode="trajectory", step_seconds=1):
+        """
+        Args:
+            state (CarStateStore): State store of the simulation.
+            distance_engine (DistanceEngine): Distance engine of the simulation.
+            connection_distance (float): Connection range in km.
+            horizon (int): Number of future steps looked at.
+            mode (str): "trajectory" or "motion".
+            step_seconds (int): Simulation seconds between two predicted steps. Trajectories hold
+                                one position per second, so this is a whole number of positions.
+        """
+        if mode not in PREDICTION_MODES:
+            raise ValueError(f"Unknown prediction mode '{mode}'. Choose from {list(PREDICTION_MODES)}.")
+        self.state = state
+        self.distance_engine = distance_engine
+        self.connection_distance = connection_distance
+        self.horizon = horizon
+        self.mode = mode
+        self.step_seconds = step_seconds
+        self.cache = {}  # (min id, max id) -> predicted break timestamp
+        self.hits = 0
+        self.misses = 0
+
+    def future_positions(self, car_ids, timestamp):
+        """
+        Return (len(car_ids), horizon, 2) future positions and a mask of the steps each car is still driving.
+        """
+        steps = np.arange(1, self.horizon + 1) * self.step_seconds  # In positions, one per second
+        state = self.state
+        if self.mode == "motion":
+            positions = state.position[car_ids][:, None, :] + steps[None, :, None] * state.motion_vector[car_ids, None, :2]
+            driving = np.ones((len(car_ids), self.horizon), dtype=bool)
+            return positions, driving
+        index = (int(timestamp) - state.offset[car_ids])[:, None] + steps[None, :]
+        last_index = (state.length[car_ids] - 1)[:, None]
+        driving = index <= last_index
+        positions = state.positions_at(car_ids[:, None], np.minimum(index, last_index))
+        return positions, driving
+
+    def predict(self, first, second, timestamp):
+        """
+        Predict the remaining lifetime of pairs without using the cache.
+
+        Args:
+            first (numpy.ndarray): First car of each pair.
+            second (numpy.ndarray): Second car of each pair.
+            timestamp (float): Current simulation time.
+
+        Returns:
+            numpy.ndarray: For each pair, the number of future steps (0..horizon) before
+                           the cars leave range or one of them completes its trip.
+        """
+        if len(first) == 0:
+            return np.zeros(0, dtype=np.int64)
+        positions1, driving1 = self.future_positions(first, timestamp)
+        positions2, driving2 = self.future_positions(second, timestamp)
+        distances = self.distance_engine.distances(positions1.reshape(-1, 2), positions2.reshape(-1, 2))
+        within = (distances.reshape(len(first), self.horizon) <= self.connection_distance) & driving1 & driving2
+        # Length of the leading run of steps within range
+        broken = ~within
+        return np.where(broken.any(axis=1), broken.argmax(axis=1), self.horizon)
+
+    def lifetimes(self, first, second, timestamp):
+        """
+        Return the predicted remaining lifetime of each pair, from the cache where possible.
+        """
+        if self.mode == "motion":
+            return self.predict(first, second, timestamp)  # Motion vectors change every tick
+        lifetimes = np.empty(len(first), dtype=np.int64)
+        misses = []
+        for row, pair_key in enumerate(zip(first.tolist(), second.tolist())):
+            breaks_at = self.cache.get(pair_key)
+            if breaks_at is not None and breaks_at > timestamp:
+                lifetimes[row] = (breaks_at - timestamp) // self.step_seconds
+                continue
+            misses.append(row)
+        self.hits += len(first) - len(misses)
+        self.misses += len(misses)
+        if misses:
+            misses = np.array(misses, dtype=np.int64)
+            predicted = self.predict(first[misses], second[misses], timestamp)
+            lifetimes[misses] = predicted
+            for first_id, second_id, lifetime in zip(first[misses].tolist(), second[misses].tolist(), predicted.tolist()):
+                if lifetime < self.horizon:
+                    self.cache[(first_id, second_id)] = timestamp + lifetime * self.step_seconds
+        return lifetimes
+
+    def expire(self, timestamp):
+        """
+        Drop cached predictions whose link is expected to have broken by `timestamp`.
+        """
+        self.cache = {pair_key: breaks_at for pair_key, breaks_at in self.cache.items() if breaks_at > timestamp}
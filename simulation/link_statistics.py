@@ -0,0 +1,71 @@
+class LinkStatistics:
+    """
+    Running statistics of the links (connections) between cars.
+
+    Updated from each tick's edge changes and the distances already measured by
+    the neighbor search, so reading an average costs O(1) and keeping them
+    current costs O(changes) per tick plus one health term per surviving link.
+    Times are simulation seconds: a link created at `created` and dropped at `now`
+    lived `now - created` seconds, and the age of a current link is `now - created`.
+    """
+    def __init__(self, connection_distance, bin_width=1):
+        """
+        Args:
+            connection_distance (float): Range in km at which a link's health reaches 0.
+            bin_width (float): Width in seconds of the lifetime histogram bins.
+        """
+        self.connection_distance = connection_distance
+        self.bin_width = bin_width
+        self.num_links = 0
+        self.created_sum = 0  # Sum of the creation times of the current links
+        self.health_sum = 0.0  # Sum of the health of the current links, rebuilt every tick
+        self.links_completed = 0
+        self.lifetime_sum = 0
+        self.lifetime_counts = {}  # Histogram bin -> number of completed links
+
+    def health(self, distance):
+        """Normalize a link's distance to a health between 0 (out of range) and 1."""
+        return max(0, 1 - (distance / self.connection_distance))
+
+    def begin_tick(self):
+        """Start a tick; every surviving or new link reports its distance again."""
+        self.health_sum = 0.0
+
+    def link_added(self, created, distance):
+        """Record a link created at `created` between cars `distance` km apart."""
+        self.num_links += 1
+        self.created_sum += created
+        self.health_sum += self.health(distance)
+
+    def link_kept(self, distance):
+        """Record a link that survived validation, now `distance` km long."""
+        self.health_sum += self.health(distance)
+
+    def link_removed(self, created, now):
+        """Record the end of a link created at `created`."""
+        lifetime = now - created
+        self.num_links -= 1
+        self.created_sum -= created
+        self.links_completed += 1
+        self.lifetime_sum += lifetime
+        bin_index = int(lifetime // self.bin_width)
+        self.lifetime_counts[bin_index] = self.lifetime_counts.get(bin_index, 0) + 1
+
+    def avg_link_age(self, now):
+        """Return the mean age in seconds of the current links."""
+        return now - self.created_sum / self.num_links if self.num_links else 0
+
+    def avg_link_health(self):
+        """Return the mean health of the current links."""
+        return self.health_sum / self.num_links if self.num_links else 0
+
+    def avg_link_lifetime(self):
+        """Return the mean lifetime in seconds of the links that have ended."""
+        return self.lifetime_sum / self.links_completed if self.links_completed else 0
+
+    def lifetime_histogram(self):
+        """
+        Returns:
+            list: (bin start in seconds, number of completed links) for every non-empty bin, in order.
+        """
+        return [(bin_index * self.bin_width, count) for bin_index, count in sorted(self.lifetime_counts.items())]
@@ -0,0 +1,46 @@
+import numpy as np
+from smart_topology import SmartTopology
+from link_lifetime import LinkLifetimePredictor
+
+class LookaheadTopology(SmartTopology):
+    def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
+        """
+        Initialize the lookahead topology simulation with a list of cars.
+
+        Links are chosen like in SmartTopology, but candidates are ranked by how long
+        they are predicted to stay within range, so fewer links need to be re-established.
+
+        Args:
+            cars (list or CarStateStore): A list of car objects with 'offset' and 'positions',
+                         or an already packed CarStateStore.
+        """
+        super().__init__(cars, sim_co_ordinates, sim_params, sim_data_file)
+        self.predictor = LinkLifetimePredictor(
+            self.state,
+            self.distance_engine,
+            self.sim_params.get("connection_distance", 0.4),
+            self.sim_params.get("lookahead_horizon", 30),
+            self.sim_params.get("lifetime_prediction", "trajectory")
+        )
+
+    def run_simulation(self, time_interval=1):
+        """
+        Run the simulation, predicting one step per tick so lifetimes count the checks a link survives.
+        """
+        self.predictor.step_seconds = time_interval
+        return super().run_simulation(time_interval)
+
+    def score_candidates(self, first, second, distances):
+        """
+        Score candidate pairs by predicted lifetime, with the distance score breaking ties.
+
+        Returns:
+            numpy.ndarray: `lifetime_weight * lifetime / horizon + distance_weight * distance_score` per pair.
+        """
+        connection_distance = self.sim_params.get("connection_distance", 0.4)
+        lifetime_weight = self.sim_params.get("lifetime_weight", 1.0)
+        distance_weight = self.sim_params.get("distance_weight", 0.3)
+        self.predictor.expire(self.timestamp)
+        lifetimes = self.predictor.lifetimes(first, second, self.timestamp)
+        distance_score = np.maximum(0, 1 - (distances / connection_distance))
+        return lifetime_weight * (lifetimes / self.predictor.horizon) + distance_weight * distance_score
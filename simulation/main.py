@@ -1,7 +1,15 @@
 import traffic_simulation
+from osrm_utils import RouteFetcher
+from route_cache import RouteCache
 from random_topology import RandomTopology
 from smart_topology import SmartTopology
+from lookahead_topology import LookaheadTopology
+from scenario import load_scenario, convert_json_scenario
 import json
+import os
+import numpy as np
+
+SCENARIO_DIR = "/simulation_data/scenario"
 
 simultation_params = {
     "time_window": 1,
@@ -10,11 +18,29 @@ simultation_params = {
     "num_min_connections": 3,
     "similarity_weight": 0.7,
     "distance_weight": 0.3,
+    "neighbor_index": "grid",  # "grid", "kdtree" (needs scipy) or "brute"
+    "distance_mode": "haversine",  # "haversine", "flat" or "geodesic" (exact, slow)
+    "link_assignment": "greedy",  # SmartTopology: "greedy" per car or global "matching"
+    "lookahead_horizon": 30,  # LookaheadTopology: future steps checked per candidate pair
+    "lifetime_prediction": "trajectory",  # LookaheadTopology: "trajectory" (known future) or "motion"
+    "adaptive_clock": False,  # Jump over ticks at which no link can change; analytics only at checked ticks
+    "profile": False,  # Path of a per-tick phase profile (JSON), True to only print its summary
+    "checkpoint_dir": None,  # Directory for periodic checkpoints of the run state, None to disable
+    "checkpoint_interval": 300,  # Simulation seconds between checkpoints
+    "checkpoint_full_interval": 10,  # Every Nth checkpoint is a full snapshot, the others are deltas
+    "resume": False,  # Continue from the latest checkpoint in checkpoint_dir instead of starting over
+    "shards": 0,  # Worker processes splitting the neighbor search into spatial tiles, 0 for one process
+    "shard_min_cars": 1000,  # Ticks with fewer active cars search in the simulation process
 }
 
-def new_simulation():
+def new_simulation(route_cache_file="/simulation_data/route_cache.sqlite", seed=0):
     """
     Run a new simulation with the specified parameters.
+
+    Routes are cached in `route_cache_file`. The trips are drawn from `seed`, so a
+    repeated run with the same seed requests the same routes and is served from
+    the cache; a new seed gives new trips and mostly misses. Pass None as the
+    cache file to disable the cache, or as the seed for unseeded trips.
     """
     # Example usage of manual bounding boxes
     center = (42.3141061843, -83.0368789337)
@@ -28,6 +54,8 @@ def new_simulation():
     BOUNDING_BOX = simulation_bounding_box_traffic
     print(f"Manual BOUNDING_BOX: {BOUNDING_BOX}")
     print("("+str(BOUNDING_BOX["min_lat"])+", "+str(BOUNDING_BOX["min_lon"])+","+str(BOUNDING_BOX["max_lat"])+", "+str(BOUNDING_BOX["max_lon"])+")")
+    route_cache = RouteCache(route_cache_file) if route_cache_file else None
+    fetcher = RouteFetcher(cache=route_cache)
     # Simulate traffic within the bounding box
     simulated_routes = traffic_simulation.simulate_traffic_within_box(
         num_trips=1000,
@@ -35,7 +63,12 @@ def new_simulation():
         bounding_box=BOUNDING_BOX,
         time_window=1,
         time_offset_range=(0, 240),
+        fetcher=fetcher,
+        seed=seed,
     )
+    fetcher.close()
+    if route_cache:
+        route_cache.close()
     return simulated_routes, simulation_bounding_box
 
 
@@ -48,7 +81,8 @@ def save_simulation(simulation_data, bounding_box, filename="/simulation_data/si
         "bounding_box": bounding_box
     }
     with open(filename, "w") as file:
-        json.dump(data_to_save, file)
+        # Trajectory arrays are written as plain lists
+        json.dump(data_to_save, file, default=lambda value: value.tolist() if isinstance(value, np.ndarray) else value)
     print(f"Simulation data and bounding box saved to {filename}")
 
 def load_simulation(filename="/simulation_data/simulation_data.json"):
@@ -66,18 +100,20 @@ def load_simulation(filename="/simulation_data/simulation_data.json"):
 
 if __name__ == "__main__":
     # simulated_routes, simulation_bounding_box = new_simulation()
-    # Save the simulation data to a JSON file
-    # save_simulation(simulated_routes, simulation_bounding_box)
-    # Load the simulation data from the JSON file
-    loaded_simulation_data, loaded_simulation_bounding_box = load_simulation()
+    # Save the simulation data as a scenario directory (or to JSON with save_simulation)
+    # save_scenario(SCENARIO_DIR, simulated_routes, simulation_bounding_box)  # from scenario import save_scenario
+    # Convert an existing JSON file once, then memory-map the scenario
+    if not os.path.exists(SCENARIO_DIR):
+        convert_json_scenario("/simulation_data/simulation_data.json", SCENARIO_DIR)
+    # Pass stream=True for scenarios too large to hold every trajectory in memory
+    simulated_routes, simulation_bounding_box = load_scenario(SCENARIO_DIR)
 
-    simulated_routes = loaded_simulation_data
-    simulation_bounding_box = loaded_simulation_bounding_box
 
-
-    # run network simulation on simulated routes
+    # run network simulation on simulated routes (sweep.py runs parameter grids in parallel)
     # network_simulation = RandomTopology(simulated_routes, simulation_bounding_box, simultation_params)
-    network_simulation = SmartTopology(simulated_routes, simulation_bounding_box, simultation_params, "/simulation_data/smart_topology.json")
+    network_simulation = SmartTopology(simulated_routes, simulation_bounding_box, simultation_params, "/simulation_data/smart_topology.jsonl")
+    network_simulation.run_simulation(time_interval=1)
+    network_simulation = RandomTopology(simulated_routes, simulation_bounding_box, simultation_params, "/simulation_data/random_topology.jsonl")
     network_simulation.run_simulation(time_interval=1)
-    network_simulation = RandomTopology(simulated_routes, simulation_bounding_box, simultation_params, "/simulation_data/random_topology.json")
+    network_simulation = LookaheadTopology(simulated_routes, simulation_bounding_box, simultation_params, "/simulation_data/lookahead_topology.jsonl")
     network_simulation.run_simulation(time_interval=1)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import random
+import numpy as np
+from distance_engine import haversine_distance
+
+
+def motion_from_window(first, last, count, seconds_per_position, noise):
+    """
+    Turn the first and last position of each car's window into a motion vector.
+
+    The average of consecutive position differences over a window telescopes to
+    (last - first) / (count - 1), so only the window's endpoints are needed.
+
+    Args:
+        first (numpy.ndarray): (n, 2) oldest positions in each window.
+        last (numpy.ndarray): (n, 2) newest positions in each window.
+        count (numpy.ndarray): (n,) number of positions in each window.
+        seconds_per_position (float): Seconds between two trajectory positions.
+        noise (float): Half-width of the uniform noise added to the vector, relative to its length.
+
+    Returns:
+        numpy.ndarray: (n, 3) rows of (d_lat, d_lon, speed in m/s). Cars with fewer
+                       than two positions get a zero vector and consume no noise.
+    """
+    motion = np.zeros((len(count), 3), dtype=np.float64)
+    moving = count >= 2
+    if not moving.any():
+        return motion
+    steps = (count[moving] - 1).astype(np.float64)
+    motion[moving, :2] = (last[moving] - first[moving]) / steps[:, None]
+
+    # Add random noise scaled to the vector's length, drawn per car in id order, so the
+    # direction is perturbed by about `noise` whatever the speed
+    draws = [random.uniform(-noise, noise) for _ in range(2 * int(moving.sum()))]
+    length = np.hypot(motion[moving, 0], motion[moving, 1])
+    motion[moving, :2] += np.array(draws, dtype=np.float64).reshape(-1, 2) * length[:, None]
+
+    # Average speed over the window
+    distance = haversine_distance(first[moving, 0], first[moving, 1], last[moving, 0], last[moving, 1]) * 1000
+    motion[moving, 2] = distance / (steps * seconds_per_position)
+    return motion
+
+
+def vectorized_motion_vectors(state, car_ids, timestamp, seconds_per_position=1, window=5, noise=0.1):
+    """
+    Compute the motion vectors of many cars at once from the packed trajectory buffer.
+
+    Args:
+        state (CarStateStore): The car state store.
+        car_ids (numpy.ndarray): Ids of the cars to update, in ascending order.
+        timestamp (int): The current simulation tick.
+        seconds_per_position (float): Seconds between two trajectory positions.
+        window (int): Number of most recent positions to average over.
+        noise (float): Half-width of the uniform noise added to the vector, relative to its length.
+
+    Returns:
+        numpy.ndarray: (len(car_ids), 3) rows of (d_lat, d_lon, speed).
+    """
+    car_ids = np.asarray(car_ids, dtype=np.int64)
+    last_index = np.minimum(int(timestamp) - state.offset[car_ids], state.length[car_ids] - 1)
+    first_index = np.maximum(last_index - window + 1, 0)
+    first = state.positions_at(car_ids, first_index)
+    last = state.positions_at(car_ids, last_index)
+    return motion_from_window(first, last, last_index - first_index + 1, seconds_per_position, noise)
+
+
+class RollingMotionEstimator:
+    """
+    Per-car ring buffer of the last `window` trajectory positions, keyed by tick index.
+
+    Each update pushes only the positions a car passed since its previous update,
+    so the cost per car and tick is O(1) regardless of the trip length.
+    """
+    def __init__(self, num_cars, window=5):
+        self.window = window
+        self.buffer = np.zeros((num_cars, window, 2), dtype=np.float64)
+        self.count = np.zeros(num_cars, dtype=np.int64)  # Positions currently held, at most `window`
+        self.head = np.zeros(num_cars, dtype=np.int64)  # Slot that receives the next position
+        self.last_index = np.full(num_cars, -1, dtype=np.int64)  # Trajectory index of the newest position
+
+    def checkpoint_arrays(self):
+        """Return the per-car window arrays by name, for checkpoints."""
+        return {"motion_buffer": self.buffer, "motion_count": self.count,
+                "motion_head": self.head, "motion_last_index": self.last_index}
+
+    def push(self, state, car_id, index):
+        """
+        Advance one car's window up to trajectory position `index`.
+        """
+        first_new = max(self.last_index[car_id] + 1, index - self.window + 1)
+        if first_new > index:
+            return
+        positions = state.positions_at(car_id, np.arange(first_new, index + 1))
+        for position in positions:
+            self.buffer[car_id, self.head[car_id]] = position
+            self.head[car_id] = (self.head[car_id] + 1) % self.window
+        self.count[car_id] = min(self.count[car_id] + len(positions), self.window)
+        self.last_index[car_id] = index
+
+    def update(self, state, car_ids, timestamp, seconds_per_position=1, noise=0.1):
+        """
+        Push the newest positions of the given cars and return their motion vectors.
+
+        Args:
+            state (CarStateStore): The car state store.
+            car_ids (numpy.ndarray): Ids of the cars to update, in ascending order.
+            timestamp (int): The current simulation tick.
+            seconds_per_position (float): Seconds between two trajectory positions.
+            noise (float): Half-width of the uniform noise added to the vector, relative to its length.
+
+        Returns:
+            numpy.ndarray: (len(car_ids), 3) rows of (d_lat, d_lon, speed).
+        """
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        last_index = np.minimum(int(timestamp) - state.offset[car_ids], state.length[car_ids] - 1)
+        for car_id, index in zip(car_ids.tolist(), last_index.tolist()):
+            self.push(state, car_id, index)
+        count = self.count[car_ids]
+        newest = (self.head[car_ids] - 1) % self.window
+        oldest = (self.head[car_ids] - count) % self.window
+        first = self.buffer[car_ids, oldest]
+        last = self.buffer[car_ids, newest]
+        return motion_from_window(first, last, count, seconds_per_position, noise)
@@ -0,0 +1,209 @@
+import math
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy is optional, the grid index covers every case
+    cKDTree = None
+
+# Shortest ground length of one degree of latitude (WGS-84 meridian at the equator)
+# and of one degree of longitude at the equator on the smallest earth radius we use.
+# Both are lower bounds, so cells sized with them never miss a pair that is in range.
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON = 111.195
+SAFETY_MARGIN = 1.05  # Pad cells by 5% to absorb great-circle curvature
+
+
+def degree_cell_size(radius_km, max_abs_lat):
+    """
+    Convert a search radius into a (lat, lon) cell size in degrees.
+
+    Args:
+        radius_km (float): Search radius in kilometers.
+        max_abs_lat (float): Largest absolute latitude of the indexed positions.
+
+    Returns:
+        tuple: (lat_size, lon_size) in degrees.
+    """
+    lat_size = radius_km * SAFETY_MARGIN / KM_PER_DEGREE_LAT
+    # Widen the band by one cell so pairs straddling the extreme latitude are covered
+    band_lat = min(abs(max_abs_lat) + lat_size, 89.999)
+    lon_size = radius_km * SAFETY_MARGIN / (KM_PER_DEGREE_LON * math.cos(math.radians(band_lat)))
+    return lat_size, min(lon_size, 360.0)
+
+
+class BruteForceIndex:
+    """
+    Reference index that returns every other indexed car as a candidate.
+    """
+    def __init__(self, radius_km):
+        self.radius_km = radius_km
+        self.ids = []
+
+    def build(self, ids, positions):
+        """
+        Index the given cars.
+
+        Args:
+            ids (list): Car ids, in the order the topology iterates them.
+            positions (list): (latitude, longitude) of each car.
+        """
+        self.ids = sorted(ids)
+
+    def query(self, car_id):
+        """
+        Return the ids of all cars that may be within range of `car_id`, sorted ascending.
+        """
+        return [other_id for other_id in self.ids if other_id != car_id]
+
+
+class GridIndex:
+    """
+    Uniform lat/lon grid hashed by the connection distance.
+
+    Every car is bucketed into a cell at least `radius_km` wide in both directions,
+    so any car within range of another one lives in the same or an adjacent cell.
+    """
+    def __init__(self, radius_km):
+        self.radius_km = radius_km
+        self.cells = {}
+        self.car_cells = {}
+        self.cell_size = (1.0, 1.0)
+
+    def cell_of(self, position):
+        return (int(math.floor(position[0] / self.cell_size[0])),
+                int(math.floor(position[1] / self.cell_size[1])))
+
+    def build(self, ids, positions):
+        """
+        Rebuild the grid from scratch.
+
+        Args:
+            ids (list): Car ids, in the order the topology iterates them.
+            positions (list): (latitude, longitude) of each car.
+        """
+        self.cells = {}
+        self.car_cells = {}
+        if not ids:
+            return
+        max_abs_lat = max(abs(position[0]) for position in positions)
+        self.cell_size = degree_cell_size(self.radius_km, max_abs_lat)
+        for car_id, position in zip(ids, positions):
+            cell = self.cell_of(position)
+            self.cells.setdefault(cell, []).append(car_id)
+            self.car_cells[car_id] = cell
+
+    def query(self, car_id):
+        """
+        Return the ids of cars in the 3x3 block of cells around `car_id`, sorted ascending.
+        """
+        cell = self.car_cells.get(car_id)
+        if cell is None:
+            return []
+        candidates = []
+        for d_lat in (-1, 0, 1):
+            for d_lon in (-1, 0, 1):
+                candidates.extend(self.cells.get((cell[0] + d_lat, cell[1] + d_lon), ()))
+        candidates.sort()
+        return [other_id for other_id in candidates if other_id != car_id]
+
+
+class KDTreeIndex:
+    """
+    KD-tree over positions scaled to kilometers, backed by scipy's cKDTree.
+    """
+    def __init__(self, radius_km):
+        if cKDTree is None:
+            raise ImportError("KDTreeIndex requires scipy to be installed.")
+        self.radius_km = radius_km
+        self.ids = []
+        self.points = []
+        self.id_rows = {}
+        self.tree = None
+
+    def build(self, ids, positions):
+        """
+        Rebuild the tree from scratch.
+
+        Args:
+            ids (list): Car ids, in the order the topology iterates them.
+            positions (list): (latitude, longitude) of each car.
+        """
+        self.ids = list(ids)
+        self.id_rows = {car_id: row for row, car_id in enumerate(self.ids)}
+        self.tree = None
+        if not self.ids:
+            return
+        max_abs_lat = max(abs(position[0]) for position in positions)
+        lat_size, lon_size = degree_cell_size(self.radius_km, max_abs_lat)
+        # Scale both axes so that one cell is one search radius
+        self.points = [(position[0] / lat_size * self.radius_km, position[1] / lon_size * self.radius_km)
+                       for position in positions]
+        self.tree = cKDTree(self.points)
+
+    def query(self, car_id):
+        """
+        Return the ids of cars within the padded search radius of `car_id`, sorted ascending.
+        """
+        row = self.id_rows.get(car_id)
+        if row is None:
+            return []
+        rows = self.tree.query_ball_point(self.points[row], self.radius_km)
+        return sorted(self.ids[other] for other in rows if other != row)
+
+
+def pairs_within_range(index, distance_engine, radius_km, ids, positions, query_ids=None):
+    """
+    Index a set of cars and find the pairs of them that are within range, each once.
+
+    Args:
+        index (object): Neighbor index to build over the cars.
+        distance_engine (DistanceEngine): Engine measuring the candidate pairs, in one batch.
+        radius_km (float): Connection distance in kilometers.
+        ids (numpy.ndarray): Car ids in ascending order.
+        positions (numpy.ndarray): (len(ids), 2) positions of the cars.
+        query_ids (numpy.ndarray): Cars whose pairs are wanted, ascending. Defaults to all of `ids`.
+
+    Returns:
+        tuple: (first, second, distances) arrays of the pairs within range with
+               first < second and first in `query_ids`, ordered by (first, second).
+    """
+    index.build(ids.tolist(), positions.tolist())
+    first_ids, second_ids = [], []
+    for car_id in (ids if query_ids is None else query_ids).tolist():
+        for other_car_id in index.query(car_id):
+            if other_car_id > car_id:
+                first_ids.append(car_id)
+                second_ids.append(other_car_id)
+    first = np.asarray(first_ids, dtype=np.int64)
+    second = np.asarray(second_ids, dtype=np.int64)
+    distances = distance_engine.distances(positions[np.searchsorted(ids, first)],
+                                          positions[np.searchsorted(ids, second)])
+    within = distances <= radius_km
+    return first[within], second[within], distances[within]
+
+
+NEIGHBOR_INDEXES = {
+    "brute": BruteForceIndex,
+    "grid": GridIndex,
+    "kdtree": KDTreeIndex,
+}
+
+
+def make_neighbor_index(kind, radius_km):
+    """
+    Create a neighbor index by name.
+
+    Args:
+        kind (str): One of "brute", "grid" or "kdtree".
+        radius_km (float): Connection distance in kilometers.
+
+    Returns:
+        object: An index exposing build(ids, positions) and query(car_id).
+    """
+    if kind not in NEIGHBOR_INDEXES:
+        raise ValueError(f"Unknown neighbor index '{kind}'. Choose from {sorted(NEIGHBOR_INDEXES)}.")
+    if kind == "kdtree" and cKDTree is None:
+        print("scipy is not installed, falling back to the grid neighbor index.")
+        kind = "grid"
+    return NEIGHBOR_INDEXES[kind](radius_km)
@@ -1,6 +1,18 @@
 import time
 import math
-import random
+import numpy as np
+from neighbor_index import make_neighbor_index, pairs_within_range
+from distance_engine import DistanceEngine, EARTH_RADIUS
+from car_state import CarStateStore
+from activation_schedule import ActivationSchedule
+from motion_estimator import RollingMotionEstimator, vectorized_motion_vectors
+from analytics_sink import make_analytics_sink
+from edge_store import EdgeStore
+from link_statistics import LinkStatistics
+from adaptive_clock import AdaptiveClock, skip_motion_noise
+from profiler import make_profiler, print_profile
+from checkpoint import make_checkpointer
+from sharding import make_shard_pool
 
 class NetworkSimulation:
     def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
@@ -8,22 +20,64 @@ class NetworkSimulation:
         Initialize the network simulation with a list of cars.
 
         Args:
-            cars (list): A list of car objects. Each car object should have at least
-                         'id', 'position' (latitude, longitude), and 'timestamp'.
-                         The car object received contains 'offset' time and 'positions' data, and positions
+            cars (list or CarStateStore): A list of car objects, each containing 'offset' time and
+                         'positions' data, or an already packed CarStateStore. Car ids are
+                         the indices into this list.
         """
-        self.cars = cars
         self.sim_co_ordinates = sim_co_ordinates
         self.sim_params = sim_params
         self.sim_data_file = sim_data_file
-        self.init_cars()
+        self.init_cars(cars)
         self.timestamp = 0
         self.cars_completed = 0
         self.new_connections_made = 0
         self.old_connections_dropped = 0
-        self.active_connections = []
+        self.edges = EdgeStore(self.state.num_cars)  # Connections between cars
+        self.link_stats = LinkStatistics(
+            self.sim_params.get("connection_distance", 0.4),
+            self.sim_params.get("lifetime_bin_width", 1)
+        )
         self.avg_connection_duration = 0
-        self.analytics = []
+        self.checkpointer = make_checkpointer(self.sim_params)
+        resume_point = None
+        if self.checkpointer is not None and self.sim_params.get("resume", False):
+            resume_point = self.checkpointer.latest()  # None if there is nothing to resume yet
+        self.resuming = resume_point is not None
+        # Entries go to the sink as they are produced; with no output file they are kept in memory
+        self.analytics_sink = make_analytics_sink(
+            sim_data_file,
+            self.sim_params.get("analytics_format"),
+            self.sim_params.get("analytics_buffer_size", 256),
+            self.sim_params.get("analytics_fsync_interval", 10.0),
+            resume_point["analytics"].get("size") if resume_point else None
+        )
+        self.last_analytics = None
+        self.neighbor_index = make_neighbor_index(
+            self.sim_params.get("neighbor_index", "grid"),
+            self.sim_params.get("connection_distance", 0.4)
+        )
+        self.distance_engine = DistanceEngine(self.sim_params.get("distance_mode", "haversine"))
+        # Worker processes searching spatial tiles for pairs in range, started by run_simulation
+        self.shards = make_shard_pool(self.sim_params, self.state.num_cars)
+        self.neighbors = {}  # car id -> [(other car id, distance in km), ...] within range, sorted by id
+        self.pair_distances = {}  # (min id, max id) -> distance in km, for every pair within range
+        self.pair_first = np.zeros(0, dtype=np.int64)  # The same pairs as arrays
+        self.pair_second = np.zeros(0, dtype=np.int64)
+        self.pair_distance_values = np.zeros(0, dtype=np.float64)
+        self.motion_estimator = None
+        if self.sim_params.get("motion_estimator", "vectorized") == "rolling":
+            self.motion_estimator = RollingMotionEstimator(self.state.num_cars, self.sim_params.get("motion_window", 5))
+        self.clock = None
+        if self.sim_params.get("adaptive_clock", False):
+            self.clock = AdaptiveClock(
+                self.state.num_cars,
+                self.sim_params.get("connection_distance", 0.4),
+                self.sim_params.get("adaptive_clock_tolerance", 0.01),
+                self.sim_params.get("neighbor_index", "grid")
+            )
+        self.ticks_skipped = 0
+        # Wraps the phases of this instance for the duration of run_simulation; None costs nothing
+        self.profiler = make_profiler(self.sim_params.get("profile"))
 
     def calculate_distance(self, pos1, pos2):
         """
@@ -36,7 +90,7 @@ class NetworkSimulation:
         Returns:
             float: Distance in meters.
         """
-        R = 6371000  # Radius of Earth in meters
+        R = EARTH_RADIUS  # Radius of Earth in meters
         lat1, lon1 = math.radians(pos1[0]), math.radians(pos1[1])
         lat2, lon2 = math.radians(pos2[0]), math.radians(pos2[1])
         dlat = lat2 - lat1
@@ -46,67 +100,132 @@ class NetworkSimulation:
         c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
         return R * c
     
-    def init_cars(self):
+    def init_cars(self, cars):
         """
-        Initialize the cars with their positions and active status.
+        Pack the cars into a struct-of-arrays state store. The trip dicts are left untouched,
+        and a store passed in (e.g. a loaded scenario) only lends its trajectory buffers.
         """
-        for id, car in enumerate(self.cars):
-            car['active'] = False
-            car['completed'] = False  # Add 'completed' flag
-            car['id'] = id
-            car['position'] = (car['positions'][0]['position'][0], car['positions'][0]['position'][1])  # Fixed reference
-            car['network_connections'] = []
+        if isinstance(cars, CarStateStore):
+            self.state = cars.fresh()
+        else:
+            self.state = CarStateStore.from_trips(cars)
+        self.schedule = ActivationSchedule(self.state.offset, self.state.length)
+        self.active_car_ids = self.state.active_ids()
 
-    def simulate_car_vectors(self, car, time_interval):
+    def simulate_car_vectors(self, time_interval):
         """
-        Returns motion and location vector of the car.
+        Update the motion vector and speed of every active car.
+
+        The vector is the average displacement over the car's last `motion_window`
+        trajectory positions (up to the current tick) plus uniform noise of up to
+        motion_noise times its length in each component, and the speed is the average
+        speed over that window in m/s.
         """
-        # Filter position data up to the current simulation timestamp
-        relevant_positions = [pos for pos in car['positions'] if pos['timestamp'] <= self.timestamp]
-        last_positions = relevant_positions[-5:]  # Take the last 5 positions
+        seconds_per_position = self.sim_params.get("time_window", 1)  # Trajectories hold one position per tick
+        window = self.sim_params.get("motion_window", 5)
+        noise = self.sim_params.get("motion_noise", 0.1)
+        if self.motion_estimator is not None:
+            motion = self.motion_estimator.update(
+                self.state, self.active_car_ids, self.timestamp, seconds_per_position, noise
+            )
+        else:
+            motion = vectorized_motion_vectors(
+                self.state, self.active_car_ids, self.timestamp, seconds_per_position, window, noise
+            )
+        self.state.motion_vector[self.active_car_ids] = motion
 
-        if len(last_positions) < 2:
-            return (0, 0, 0)  # Return zero vector and speed if insufficient data
+    def simulate_car_positions(self, time_interval):
+        """
+        Simulate positions of cars by picking positions from their position data.
+
+        Only cars that arrive, depart or are already active at the current timestamp
+        are touched; the activation schedule tracks which ones those are.
+        """
+        state = self.state
+        arrived, departed = self.schedule.advance(self.timestamp)
+        state.active[arrived] = True
+        state.active[departed] = False
+        state.load(np.setdiff1d(arrived, departed))
+
+        self.active_car_ids = self.schedule.active_ids()
+        index = int(self.timestamp) - state.offset[self.active_car_ids]  # Index into each car's trajectory
+        state.position[self.active_car_ids] = state.positions_at(self.active_car_ids, index)
+
+        for car_id in departed:
+            state.completed[car_id] = True  # Mark car as completed
+            self.cars_completed += 1
+            print(f"{self.cars_completed} cars have completed their routes.")
+        state.release(departed)
+
+    def update_neighbor_index(self):
+        """
+        Rebuild the neighbor index from the positions of the active cars and compute the
+        distances of all candidate pairs in one batched call.
 
-        # Calculate the average vector
-        avg_vector = (0, 0)
-        for i in range(1, len(last_positions)):
-            avg_vector = (
-                avg_vector[0] + (last_positions[i]['position'][0] - last_positions[i-1]['position'][0]),
-                avg_vector[1] + (last_positions[i]['position'][1] - last_positions[i-1]['position'][1])
+        Fills self.neighbors and self.pair_distances with the pairs that are within
+        the connection distance. With sim_params['shards'] the search is split over
+        the tile workers, which return the same pairs.
+        """
+        connection_distance = self.sim_params.get("connection_distance", 0.4)
+        active_ids = self.active_car_ids
+        positions = self.state.position[active_ids]
+        if self.shards is not None and self.shards.handles(len(active_ids)):
+            first, second, distances = self.shards.pairs_within_range(self.timestamp, self.state, active_ids, positions)
+        else:
+            first, second, distances = pairs_within_range(
+                self.neighbor_index, self.distance_engine, connection_distance, active_ids, positions
             )
-        avg_vector = (avg_vector[0] / (len(last_positions) - 1), avg_vector[1] / (len(last_positions) - 1))
 
-        # Add random noise to the vector
-        noise = (random.uniform(-0.1, 0.1), random.uniform(-0.1, 0.1))
-        avg_vector = (avg_vector[0] + noise[0], avg_vector[1] + noise[1])
+        # Pairs within range as arrays, for batched kernels
+        self.pair_first = first
+        self.pair_second = second
+        self.pair_distance_values = distances
 
-        # Calculate the distance and speed
-        distance = self.calculate_distance(car['position'], last_positions[-1]['position'])
-        speed = distance / time_interval
+        self.pair_distances = dict(zip(zip(first.tolist(), second.tolist()), distances.tolist()))
 
-        return (avg_vector[0], avg_vector[1], speed)
+        # Each pair under both of its cars, sorted by car and then by neighbor id
+        cars = np.concatenate([first, second])
+        others = np.concatenate([second, first])
+        order = np.lexsort((others, cars))
+        entries = list(zip(others[order].tolist(), np.concatenate([distances, distances])[order].tolist()))
+        starts = np.searchsorted(cars[order], active_ids, side="left").tolist()
+        ends = np.searchsorted(cars[order], active_ids, side="right").tolist()
+        self.neighbors = {car_id: entries[start:end] for car_id, start, end in zip(active_ids.tolist(), starts, ends)}
 
-    def simulate_car_positions(self, time_interval):
+    def pair_distance(self, car_id, other_car_id):
         """
-        Simulate positions of cars by picking positions from their position data.
+        Return the distance in km between two active cars as of the last index update,
+        or None if they are out of range.
         """
-        for car in self.cars:
-            # Check if the car should be active at the current simulation timestamp
-            if car['completed']:
-                continue  # Skip cars that have completed their routes
-
-            if self.timestamp >= car['offset'] and self.timestamp < (car['offset'] + len(car['positions'])):
-                # Get the current position from the position data
-                current_position = car['positions'][int(self.timestamp - car['offset'])]  # Ensure index is an integer
-                car['position'] = (current_position['position'][0], current_position['position'][1])  # Fixed reference
-                car['active'] = True
-            else:
-                car['active'] = False
-                if self.timestamp >= (car['offset'] + len(car['positions'])):
-                    car['completed'] = True  # Mark car as completed
-                    self.cars_completed += 1
-                    print(f"{self.cars_completed} cars have completed their routes.")
+        return self.pair_distances.get((min(car_id, other_car_id), max(car_id, other_car_id)))
+
+    def connect(self, car_id, other_car_id):
+        """
+        Connect two cars within range of each other and record the new link.
+        """
+        if self.edges.add(car_id, other_car_id, self.timestamp):
+            self.link_stats.link_added(self.timestamp, self.pair_distance(car_id, other_car_id))
+
+    def validate_connections(self):
+        """
+        Start a new tick of the edge store and drop every connection whose cars are
+        no longer both active and within range.
+
+        Returns:
+            int: Number of connections dropped.
+        """
+        active = self.state.active
+        self.edges.begin_tick()
+        self.link_stats.begin_tick()
+        for (car_id, connected_car_id), created in list(self.edges.edges.items()):
+            if active[car_id] and active[connected_car_id]:
+                distance = self.pair_distance(car_id, connected_car_id)
+                if distance is not None:  # Only pairs within range are measured
+                    self.link_stats.link_kept(distance)
+                    continue
+            self.edges.drop(car_id, connected_car_id)
+            self.link_stats.link_removed(created, self.timestamp)
+        return len(self.edges.removed)
 
     def check_network(self):
         """
@@ -114,60 +233,147 @@ class NetworkSimulation:
         This function should be implemented in subclasses.
         """
         raise NotImplementedError("This method should be overridden in subclasses.")
+
+    def record_tick(self, new_connections, old_connections):
+        """
+        Compute the link statistics of the tick and record its connection changes.
+
+        Called by check_network once the tick's links are final. Subclasses define
+        self.simulation_results.
+
+        Args:
+            new_connections (int): Links created this tick.
+            old_connections (int): Links dropped this tick.
+        """
+        edges = self.edges
+        # Every remaining edge joins two active cars
+        added_pairs, removed_pairs = edges.delta()
+
+        # Calculate average connections per active car
+        total_connections = 2 * len(edges)
+        num_active = len(self.active_car_ids)
+        avg_connections = total_connections / num_active if num_active else 0
+        print(f"Average connections per active car: {avg_connections:.2f}")
+
+        # Link statistics are kept up to date by validate_connections and connect
+        avg_connection_duration = self.link_stats.avg_link_age(self.timestamp)
+        self.avg_connection_duration = avg_connection_duration
+        print(f"Average connection duration: {avg_connection_duration:.2f} s")
+
+        avg_connection_health = self.link_stats.avg_link_health()
+        self.avg_connection_health = avg_connection_health
+        print(f"Average connection health: {avg_connection_health:.2f}")
+
+        # Record this tick's connection changes; edge_store.replay_connected_pairs rebuilds the full graph
+        self.simulation_results.append({
+            "time_tick": self.time_tick,
+            "added_pairs": added_pairs,
+            "removed_pairs": removed_pairs,
+            "num_connections": len(edges),
+            "avg_connection_duration": avg_connection_duration,  # Store average connection duration
+            "avg_connection_health": avg_connection_health  # Store average connection health
+        })
+
+        # Update the counters for new and old connections
+        self.new_connections_made = new_connections
+        self.old_connections_dropped = old_connections
     def analytics_update(self):
         """
         Update the analytics for the simulation.
         This function should be implemented in subclasses.
         """
-        self.analytics.append({
+        self.last_analytics = {
             'timestamp': self.timestamp,
             'cars_completed': self.cars_completed,
             'new_connections_made': self.new_connections_made,
             'old_connections_dropped': self.old_connections_dropped,
-            'active_connections': len(self.active_connections),
-            'active_cars': len([car for car in self.cars if car['active']]),
+            'active_connections': len(self.edges),
+            'active_cars': len(self.active_car_ids),
             'avg_connection_duration': self.avg_connection_duration,
             "avg_connection_health": self.avg_connection_health,
-        })
-    
-    def save_analytics(self, filename):
+            "avg_link_lifetime": self.link_stats.avg_link_lifetime(),
+            "links_completed": self.link_stats.links_completed,
+            **self.state.memory_stats(),
+        }
+        self.analytics_sink.write(self.last_analytics)
+
+    def save_analytics(self):
         """
-        Save the simulation analytics to a file.
+        Flush the remaining analytics to the sink and close it.
+        """
+        self.analytics_sink.close()
+        if self.analytics_sink.path:
+            print(f"Analytics saved to {self.analytics_sink.path}")
 
-        Args:
-            filename (str): The name of the file to save the analytics.
+    def skip_to(self, timestamp, time_interval):
+        """
+        Jump the clock to `timestamp` without checking the network at the ticks in between.
+
+        The motion noise those ticks would have drawn is discarded, so the random
+        stream stays in step with a run that visits every tick.
         """
-        with open(filename, 'w') as f:
-            for entry in self.analytics:
-                f.write(f"{entry}\n")
-        print(f"Analytics saved to {filename}")
+        skip_motion_noise(self.state, self.active_car_ids, self.timestamp + time_interval,
+                          timestamp - time_interval, time_interval)
+        self.ticks_skipped += (timestamp - self.timestamp) // time_interval
+        self.timestamp = timestamp
+        self.simulate_car_positions(time_interval)
+        self.simulate_car_vectors(time_interval)
+
     def run_simulation(self, time_interval=1):
         """
         Run the simulation for each car in the network.
 
+        With sim_params['adaptive_clock'] the clock jumps over ticks at which
+        check_network cannot change the topology. Analytics are then only written
+        after the checks that do run, and equal the fixed-step entries of those ticks.
+
+        With sim_params['checkpoint_dir'] the state is checkpointed every
+        checkpoint_interval seconds, and with sim_params['resume'] the run continues
+        from the latest checkpoint exactly as the interrupted run would have.
+        With sim_params['shards'] the neighbor search is split over that many worker
+        processes, without changing the results.
+
         Args:
             time_interval (int): Time interval in seconds for each simulation step.
         """
-        # Update car positions based on the current timestamp
-        self.simulate_car_positions(time_interval)
-
-        # Run simulation till all cars have completed their positions
-        while any(not car['completed'] for car in self.cars):
-            self.check_network()
-            self.timestamp += time_interval
-            # time.sleep(time_interval)
+        if self.profiler is not None:
+            self.profiler.install(self)
+        if self.shards is not None:
+            self.shards.start()
+        if self.resuming:
+            self.checkpointer.restore(self)
+        else:
+            if self.checkpointer is not None:
+                self.checkpointer.start()
+            # Update car positions based on the current timestamp
             self.simulate_car_positions(time_interval)
-            for car in self.cars:
-                if car['active']:
-                    # Update the car's position directly from the position data
-                    current_position = car['positions'][int(self.timestamp - car['offset'])]  # Ensure index is an integer
-                    car['position'] = (current_position['position'][0], current_position['position'][1])  # Fixed reference
-                    
-                    # Calculate the motion vector and speed for network topology
-                    car['motion_vector'] = self.simulate_car_vectors(car, time_interval)
-            
-            # Update the analytics
-            self.analytics_update()
-        
-        # save the analytics to a file
-        self.save_analytics(self.sim_data_file)
\ No newline at end of file
+
+        try:
+            # Run simulation till every car has arrived and departed
+            while not self.schedule.empty():
+                if self.checkpointer is not None and self.checkpointer.due(self.timestamp):
+                    self.checkpointer.write(self)
+                self.update_neighbor_index()
+                if self.clock is not None:
+                    next_tick = self.clock.next_change_tick(self, time_interval)
+                    if next_tick > self.timestamp:
+                        self.skip_to(next_tick, time_interval)
+                        continue
+                self.check_network()
+                self.timestamp += time_interval
+                # time.sleep(time_interval)
+                self.simulate_car_positions(time_interval)
+                # Calculate the motion vector and speed for network topology
+                self.simulate_car_vectors(time_interval)
+
+                # Update the analytics
+                self.analytics_update()
+        finally:
+            # Flush whatever analytics are buffered, even if the run failed
+            self.save_analytics()
+            # The store is this simulation's own copy; a streaming store holds open files
+            self.state.close()
+            if self.shards is not None:
+                self.shards.close()
+            if self.profiler is not None:
+                print_profile(self.profiler.close())
\ No newline at end of file
@@ -0,0 +1,151 @@
+"""
+Minimal stand-in for osrm-routed, for exercising the route fetcher offline.
+
+Routes are straight lines between the requested coordinates, split into a few
+steps driven at a constant speed, in the same JSON shape osrm-routed returns for
+overview=full&geometries=geojson&steps=true.
+"""
+import json
+import math
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+SPEED = 13.9  # m/s, about 50 km/h
+STEPS_PER_ROUTE = 4
+POINTS_PER_STEP = 3
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    """Distance in meters between two (lon, lat) points."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def straight_route(coordinates):
+    """
+    Build an OSRM route response along straight lines through the given (lon, lat) coordinates.
+    """
+    legs = []
+    geometry = []
+    for (lon1, lat1), (lon2, lat2) in zip(coordinates[:-1], coordinates[1:]):
+        steps = []
+        for step in range(STEPS_PER_ROUTE):
+            points = []
+            for point in range(POINTS_PER_STEP + 1):
+                fraction = (step + point / POINTS_PER_STEP) / STEPS_PER_ROUTE
+                points.append([lon1 + (lon2 - lon1) * fraction, lat1 + (lat2 - lat1) * fraction])
+            distance = sum(haversine(*a, *b) for a, b in zip(points[:-1], points[1:]))
+            steps.append({
+                "geometry": {"coordinates": points, "type": "LineString"},
+                "distance": distance,
+                "duration": distance / SPEED,
+                "name": f"Stub Road {step}",
+            })
+            geometry.extend(points if not geometry else points[1:])
+        distance = sum(step["distance"] for step in steps)
+        legs.append({"steps": steps, "summary": "", "weight": distance / SPEED,
+                     "duration": distance / SPEED, "distance": distance})
+    distance = sum(leg["distance"] for leg in legs)
+    return {
+        "code": "Ok",
+        "routes": [{
+            "geometry": {"coordinates": geometry, "type": "LineString"},
+            "legs": legs,
+            "weight_name": "routability",
+            "weight": distance / SPEED,
+            "duration": distance / SPEED,
+            "distance": distance,
+        }],
+        "waypoints": [{"hint": "", "distance": 0, "name": "", "location": list(point)} for point in coordinates],
+    }
+
+
+def straight_table(coordinates):
+    """
+    Build an OSRM table response with straight-line durations between all coordinates.
+    """
+    durations = [[haversine(*a, *b) / SPEED for b in coordinates] for a in coordinates]
+    return {
+        "code": "Ok",
+        "durations": durations,
+        "sources": [{"hint": "", "distance": 0, "name": "", "location": list(point)} for point in coordinates],
+        "destinations": [{"hint": "", "distance": 0, "name": "", "location": list(point)} for point in coordinates],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like osrm-routed
+    disable_nagle_algorithm = True  # Headers and body are written separately
+    latency = 0.0
+    failure_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+    failure_random = random.Random()  # Own generator, so a stub in the caller's process leaves its seeded draws alone
+
+    def do_GET(self):
+        with StubHandler.lock:
+            StubHandler.requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self.failure_random.random() < self.failure_rate:
+            return self.reply(503, {"code": "Busy", "message": "Stub failure"})
+
+        # /{service}/v1/{profile}/{lon,lat;lon,lat...}
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        try:
+            service = parts[0]
+            coordinates = [tuple(float(value) for value in pair.split(",")) for pair in parts[3].split(";")]
+        except (IndexError, ValueError):
+            return self.reply(400, {"code": "InvalidUrl", "message": "URL string is invalid."})
+        if service == "route":
+            return self.reply(200, straight_route(coordinates))
+        if service == "table":
+            return self.reply(200, straight_table(coordinates))
+        return self.reply(400, {"code": "InvalidService", "message": "Service name is invalid."})
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # Keep stdout quiet under load
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0):
+    """
+    Start the stub server on a background thread.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind, 0 picks a free one.
+        latency (float): Seconds to wait before answering each request.
+        failure_rate (float): Fraction of requests answered with HTTP 503.
+
+    Returns:
+        tuple: (server, base_url). Call server.shutdown() to stop it.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"latency": latency, "failure_rate": failure_rate})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    server, base_url = start_stub_server("0.0.0.0", port)
+    print(f"OSRM stub server listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -1,35 +1,200 @@
+import time
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from utils import generate_random_coordinates
 OSRM_API_URL = "http://osrm-routed:5000"  # Update with your OSRM server URL
 
-def get_route_from_osrm(start, end):
-    """Fetch route from OSRM API."""
-    url = f"{OSRM_API_URL}/route/v1/driving/{start[1]},{start[0]};{end[1]},{end[0]}"
-    params = {
-        "overview": "full",
-        "geometries": "geojson",
-        "steps": "true"  # Request detailed steps in the response
-    }
-    response = requests.get(url, params=params)
+ROUTE_PARAMS = {
+    "overview": "full",
+    "geometries": "geojson",
+    "steps": "true"  # Request detailed steps in the response
+}
+
+# Cheap first-phase request: simplified geometry only, no steps
+OVERVIEW_PARAMS = {
+    "overview": "simplified",
+    "geometries": "geojson",
+    "steps": "false"
+}
+
+class OSRMError(Exception):
+    """Error response from the OSRM API."""
+    def __init__(self, status_code, text):
+        super().__init__(f"OSRM API error: {status_code}, {text}")
+        self.status_code = status_code
+
+def get_route_from_osrm(start, end, session=None, timeout=None, base_url=OSRM_API_URL, cache=None, params=ROUTE_PARAMS):
+    """
+    Fetch route from OSRM API.
+
+    Args:
+        start (tuple): (latitude, longitude) of the origin.
+        end (tuple): (latitude, longitude) of the destination.
+        session (requests.Session): Optional session to reuse pooled keep-alive connections.
+        timeout (float): Optional request timeout in seconds.
+        base_url (str): URL of the osrm-routed server.
+        cache (RouteCache): Optional persistent cache. When given, start and end are
+                            snapped to the cache precision before querying OSRM.
+        params (dict): Route service options, full geometry with steps by default.
+    """
+    if cache is not None:
+        start, end = cache.snap(start), cache.snap(end)
+        cached = cache.get(start, end, params)
+        if cached is not None:
+            return cached
+    url = f"{base_url}/route/v1/driving/{start[1]},{start[0]};{end[1]},{end[0]}"
+    response = (session or requests).get(url, params=params, timeout=timeout)
     if response.status_code == 200:
-        return response.json()
+        route = response.json()
+        if cache is not None:
+            cache.put(start, end, params, route)
+        return route
     else:
-        raise Exception(f"OSRM API error: {response.status_code}, {response.text}")
+        raise OSRMError(response.status_code, response.text)
 
-def generate_random_routes(num_routes, main_box):
-    """Generate random routes using OSRM API."""
-    routes = []
+class FetchStats:
+    """Throughput and latency statistics of a RouteFetcher."""
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.latencies = []  # Seconds per successful request, including retries
+        self.wall_time = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, latency=None, retry=False, failure=False):
+        """Record one event from a worker thread."""
+        with self.lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.retries += retry
+            self.failures += failure
+
+    def summary(self):
+        """
+        Returns:
+            dict: Request counts, throughput in requests per second and latency percentiles in ms.
+        """
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retries": self.retries,
+            "wall_time_s": self.wall_time,
+            "throughput_rps": self.requests / self.wall_time if self.wall_time > 0 else 0.0,
+            "latency_mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            "latency_p50_ms": percentile(0.5),
+            "latency_p95_ms": percentile(0.95),
+            "latency_max_ms": latencies[-1] * 1000 if latencies else 0.0,
+        }
+
+class RouteFetcher:
+    """
+    Fetch many OSRM routes concurrently over a pooled keep-alive session.
+
+    Requests that time out, fail to connect or return 429/5xx are retried with
+    exponential backoff; other error responses (e.g. NoRoute) fail immediately.
+    """
+    def __init__(self, base_url=OSRM_API_URL, concurrency=8, timeout=10, retries=3, backoff=0.5, cache=None):
+        """
+        Args:
+            base_url (str): URL of the osrm-routed server.
+            concurrency (int): Number of requests in flight at once.
+            timeout (float): Per-request timeout in seconds.
+            retries (int): Retries per route after the first attempt.
+            backoff (float): Base delay in seconds, doubled after every retry.
+            cache (RouteCache): Optional persistent route cache consulted before every request.
+        """
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.stats = FetchStats()
+
+    def fetch(self, start, end, params=ROUTE_PARAMS):
+        """Fetch one route, retrying transient failures."""
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                route = get_route_from_osrm(start, end, self.session, self.timeout, self.base_url, self.cache, params)
+                self.stats.record(latency=time.perf_counter() - started)
+                return route
+            except (requests.ConnectionError, requests.Timeout, OSRMError) as e:
+                retryable = not isinstance(e, OSRMError) or e.status_code == 429 or e.status_code >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+                self.stats.record(retry=True)
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def fetch_many(self, od_pairs, params=ROUTE_PARAMS):
+        """
+        Fetch routes for a list of (start, end) pairs.
+
+        Returns:
+            list: The route for each pair, in input order, or None where fetching failed.
+        """
+        def fetch_or_none(od_pair):
+            try:
+                return self.fetch(*od_pair, params=params)
+            except Exception as e:
+                self.stats.record(failure=True)
+                print(f"Error fetching route: {e}")
+                return None
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            routes = list(executor.map(fetch_or_none, od_pairs))
+        self.stats.wall_time += time.perf_counter() - started
+        self.stats.requests += len(od_pairs)
+        return routes
+
+    def close(self):
+        self.session.close()
+
+def generate_random_od_pairs(num_routes, main_box):
+    """Draw random (start, end) coordinate pairs within the main box."""
+    od_pairs = []
     for _ in range(num_routes):
         start = generate_random_coordinates(main_box)
         end = generate_random_coordinates(main_box)
         print(start,end)
-        # Query OSRM API for the route
-        try:
-            route = get_route_from_osrm(start, end)
-            routes.append(route)
-        except Exception as e:
-            print(f"Error fetching route: {e}")
-    return routes
+        od_pairs.append((start, end))
+    return od_pairs
+
+def generate_random_routes(num_routes, main_box, fetcher=None, od_pairs=None):
+    """
+    Generate random routes using OSRM API.
+
+    Origins and destinations are drawn up front on the calling thread, so the
+    routes do not depend on the order in which concurrent requests complete.
+    Pass `od_pairs` to route pre-drawn pairs instead.
+    """
+    if od_pairs is None:
+        od_pairs = generate_random_od_pairs(num_routes, main_box)
+    # Query OSRM API for the routes
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = RouteFetcher()
+    try:
+        routes = fetcher.fetch_many(od_pairs)
+    finally:
+        if own_fetcher:
+            fetcher.close()
+    return [route for route in routes if route is not None]
 
 '''
 {
@@ -0,0 +1,282 @@
+"""
+Per-phase tick profiler for NetworkSimulation.
+
+TickProfiler.install replaces the phase methods of one simulation instance, and
+the distance engine, neighbor index and scoring hook it uses, with timed or
+counting wrappers. Nothing in the simulation itself checks for the profiler, so a
+run without one executes exactly the same code as before.
+
+Phase times are exclusive: time spent in validate_connections or record_tick is
+not counted again under link_search, the rest of check_network. The profile is
+a JSON document with one row per tick and a summary of the whole run.
+"""
+import functools
+import json
+import sys
+import time
+from analytics_sink import to_builtin
+
+try:
+    import resource
+except ImportError:  # resource is Unix-only; peak memory is then not sampled
+    resource = None
+
+# Simulation method -> phase it is timed as
+PHASE_METHODS = {
+    "simulate_car_positions": "positions",
+    "simulate_car_vectors": "motion",
+    "update_neighbor_index": "neighbor_index",
+    "validate_connections": "validation",
+    "check_network": "link_search",
+    "record_tick": "stats",
+    "analytics_update": "analytics",
+}
+PHASES = ("positions", "motion", "neighbor_index", "clock", "validation", "link_search", "stats", "analytics",
+          "checkpoint")
+COUNTERS = ("distance_evaluations", "index_queries", "index_candidates", "candidates_scored", "candidate_list_scans",
+            "candidate_list_entries")
+
+
+def peak_rss_kb():
+    """
+    Return the peak resident set size of this process in KiB, or None where it cannot be read.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes
+
+
+class TickProfiler:
+    """
+    Records wall time per phase and hot-path operation counts for every tick of a run.
+
+    A tick starts at each neighbor index update, which opens every iteration of the
+    run loop; the initial position update is counted in the first tick.
+    """
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): JSON file the profile is written to on close, or None to keep it in memory.
+        """
+        self.path = path
+        self.ticks = []
+        self.current = None
+        self.nested = []  # Time spent in timed calls nested in each open timed call
+        self.started = None
+        self.wall_seconds = 0.0
+        self.wrapped = []  # (instance, method name) pairs shadowed by a wrapper
+
+    def install(self, simulation):
+        """
+        Wrap the phases and hot paths of `simulation` so they report to this profiler.
+        """
+        self.simulation = simulation
+        self.started = time.perf_counter()
+        self.begin_tick()
+        for method_name, phase in PHASE_METHODS.items():
+            if hasattr(simulation, method_name):
+                self.wrap(simulation, method_name, functools.partial(self.timed, phase))
+        self.wrap(simulation, "validate_connections", self.after_validation)  # Outside the timed validation
+        self.wrap(simulation, "update_neighbor_index", self.starts_tick)
+        if getattr(simulation, "clock", None) is not None:
+            self.wrap(simulation.clock, "next_change_tick", functools.partial(self.timed, "clock"))
+        if getattr(simulation, "checkpointer", None) is not None:
+            self.wrap(simulation.checkpointer, "write", functools.partial(self.timed, "checkpoint"))
+
+        self.wrap(simulation.distance_engine, "distances", functools.partial(
+            self.counted, "distance_evaluations", lambda positions1, *_: len(positions1)))
+        self.wrap(simulation.neighbor_index, "query", functools.partial(
+            self.counted_results, "index_queries", "index_candidates"))
+        if hasattr(simulation, "score_candidates"):
+            self.wrap(simulation, "score_candidates", functools.partial(
+                self.counted, "candidates_scored", lambda first, *_: len(first)))
+
+    def wrap(self, owner, name, wrapper_factory):
+        """
+        Shadow the method `name` of the instance `owner` with wrapper_factory(method) until close.
+        """
+        setattr(owner, name, wrapper_factory(getattr(owner, name)))
+        self.wrapped.append((owner, name))
+
+    def uninstall(self):
+        """
+        Remove every wrapper, so the instances use their class methods again.
+        """
+        for owner, name in self.wrapped:
+            if name in vars(owner):
+                delattr(owner, name)
+        self.wrapped = []
+
+    def timed(self, phase, function):
+        """
+        Wrap `function` so its exclusive wall time is added to `phase`.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            self.nested.append(0.0)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.current[phase] += elapsed - self.nested.pop()
+                if self.nested:
+                    self.nested[-1] += elapsed
+        return wrapper
+
+    def counted(self, counter, amount, function):
+        """
+        Wrap `function` so `amount(*args)` is added to `counter` on every call.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            self.current[counter] += amount(*args)
+            return function(*args, **kwargs)
+        return wrapper
+
+    def counted_results(self, calls_counter, results_counter, function):
+        """
+        Wrap `function` so its calls and the total length of its results are counted.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            self.current[calls_counter] += 1
+            self.current[results_counter] += len(result)
+            return result
+        return wrapper
+
+    def starts_tick(self, function):
+        """
+        Wrap `function` so every call closes the current tick and opens a new one.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if self.current["timestamp"] != self.simulation.timestamp:
+                self.end_tick()
+                self.begin_tick()
+            return function(*args, **kwargs)
+        return wrapper
+
+    def after_validation(self, function):
+        """
+        Wrap the timed validate_connections to count the candidate lists the link search
+        scans, one per car that still needs links, and their entries.
+
+        The counting time is taken out of the enclosing phase, so the profiler's own
+        bookkeeping is not billed to validation or link_search.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            start = time.perf_counter()
+            simulation = self.simulation
+            num_min_connections = simulation.sim_params.get("num_min_connections", 3)
+            open_lists = [len(neighbor_list) for car_id, neighbor_list in simulation.neighbors.items()
+                          if simulation.edges.degree(car_id) < num_min_connections]
+            self.current["candidate_list_scans"] += len(open_lists)
+            self.current["candidate_list_entries"] += sum(open_lists)
+            if self.nested:
+                self.nested[-1] += time.perf_counter() - start
+            return result
+        return wrapper
+
+    def begin_tick(self):
+        self.current = {"timestamp": self.simulation.timestamp, **{phase: 0.0 for phase in PHASES},
+                        **{counter: 0 for counter in COUNTERS}}
+
+    def end_tick(self):
+        self.current["active_cars"] = len(self.simulation.active_car_ids)
+        self.current["active_connections"] = len(self.simulation.edges)
+        self.current["peak_rss_kb"] = peak_rss_kb()
+        self.ticks.append(self.current)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Totals of the run so far: per phase the total, mean and max seconds per tick
+                  and the share of the profiled time, per counter the total, mean and max per tick.
+        """
+        ticks = self.ticks
+        num_ticks = len(ticks)
+        profiled = sum(tick[phase] for tick in ticks for phase in PHASES)
+        phases = {}
+        for phase in PHASES:
+            values = [tick[phase] for tick in ticks]
+            total = sum(values)
+            phases[phase] = {
+                "total_seconds": total,
+                "mean_seconds": total / num_ticks if num_ticks else 0.0,
+                "max_seconds": max(values, default=0.0),
+                "share": total / profiled if profiled else 0.0,
+            }
+        counters = {}
+        for counter in COUNTERS:
+            values = [tick[counter] for tick in ticks]
+            counters[counter] = {
+                "total": sum(values),
+                "mean": sum(values) / num_ticks if num_ticks else 0.0,
+                "max": max(values, default=0),
+            }
+        rss = [tick["peak_rss_kb"] for tick in ticks if tick["peak_rss_kb"] is not None]
+        return {
+            "ticks": num_ticks,
+            "wall_seconds": self.wall_seconds,
+            "profiled_seconds": profiled,
+            "ticks_per_second": num_ticks / self.wall_seconds if self.wall_seconds else 0.0,
+            "peak_rss_kb": max(rss) if rss else None,
+            "phases": phases,
+            "counters": counters,
+        }
+
+    def close(self):
+        """
+        Close the last tick and write the profile to `path`, if one was given.
+
+        Returns:
+            dict: The summary of the run.
+        """
+        if self.current is not None:
+            self.end_tick()
+            self.current = None
+            self.wall_seconds = time.perf_counter() - self.started
+            self.uninstall()
+        summary = self.summary()
+        if self.path:
+            with open(self.path, "w") as file:
+                json.dump({"summary": summary, "ticks": self.ticks}, file, default=to_builtin)
+            print(f"Profile saved to {self.path}")
+        return summary
+
+
+def make_profiler(option):
+    """
+    Create a profiler from sim_params['profile']: a file path, True to keep the profile in memory, or off.
+    """
+    if not option:
+        return None
+    return TickProfiler(option if isinstance(option, str) else None)
+
+
+def print_profile(summary):
+    """
+    Print the phase and counter tables of a profile summary.
+    """
+    print(f"{summary['ticks']} ticks in {summary['wall_seconds']:.2f}s "
+          f"({summary['ticks_per_second']:.1f} ticks/s), peak RSS {summary['peak_rss_kb']} KiB")
+    print(f"{'phase':>16}  {'total s':>9}  {'mean ms':>9}  {'max ms':>9}  {'share':>6}")
+    for phase, values in summary["phases"].items():
+        print(f"{phase:>16}  {values['total_seconds']:9.3f}  {values['mean_seconds'] * 1000:9.3f}  "
+              f"{values['max_seconds'] * 1000:9.3f}  {values['share']:6.1%}")
+    print(f"{'counter':>22}  {'total':>12}  {'mean':>10}  {'max':>8}")
+    for counter, values in summary["counters"].items():
+        print(f"{counter:>22}  {values['total']:12d}  {values['mean']:10.1f}  {values['max']:8d}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python profiler.py <profile.json>")
+        sys.exit(1)
+    with open(sys.argv[1]) as profile_file:
+        print_profile(json.load(profile_file)["summary"])
@@ -0,0 +1,464 @@
+"""
+Frozen reference implementation of the network checks.
+
+This is the code the optimized engines replaced: cars are dicts, every distance
+is an exact geodesic from geopy, and the active cars are scanned linearly.
+equivalence.py runs it as the "baseline" engine and compares every other engine
+against it. Do not optimize or fix it; its value is that it has not changed.
+
+Only the glue around the original code differs:
+- The cars come from a CarStateStore, so positions are the same
+  (latitude, longitude) trajectories the other engines see.
+- Motion vectors come from motion_estimator. The original window filter and
+  absolute noise were bugs, and every engine must draw the same noise.
+- The connected pairs after each check are kept next to the analytics entry,
+  and cars cut off before they start (in a repro) have no first position.
+"""
+import numpy as np
+from geopy.distance import geodesic
+from motion_estimator import vectorized_motion_vectors
+
+# Analytics the incremental link statistics redefined: drops and active connections
+# count links instead of link endpoints, and the duration and health averages are exact.
+# They are not compared against this reference.
+CHANGED_ANALYTICS = {
+    "smart": ("old_connections_dropped", "avg_connection_duration", "avg_connection_health"),
+    "random": ("old_connections_dropped", "active_connections", "avg_connection_duration",
+               "avg_connection_health"),
+}
+
+
+class ReferenceSimulation:
+    def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
+        """
+        Initialize the reference simulation with the cars of a state store.
+
+        Args:
+            cars (CarStateStore): The packed cars. Each becomes a dict with 'offset' and
+                         'positions', a list of {'position': (latitude, longitude), 'timestamp'}.
+        """
+        self.state = cars.fresh()
+        self.cars = []
+        for car_id in range(self.state.num_cars):
+            trajectory = self.state.trajectory(car_id).tolist()
+            timestamps = self.state.trajectory_timestamps(car_id).tolist()
+            self.cars.append({
+                "offset": int(self.state.offset[car_id]),
+                "positions": [{"position": tuple(position), "timestamp": timestamp}
+                              for position, timestamp in zip(trajectory, timestamps)],
+            })
+        self.sim_co_ordinates = sim_co_ordinates
+        self.sim_params = sim_params
+        self.sim_data_file = sim_data_file
+        self.init_cars()
+        self.timestamp = 0
+        self.cars_completed = 0
+        self.new_connections_made = 0
+        self.old_connections_dropped = 0
+        self.active_connections = []
+        self.avg_connection_duration = 0
+        self.analytics = []
+        self.tick_pairs = []  # Canonical connected pairs of the check before each analytics entry
+
+    def init_cars(self):
+        """
+        Initialize the cars with their positions and active status.
+        """
+        for id, car in enumerate(self.cars):
+            car['active'] = False
+            car['completed'] = False  # Add 'completed' flag
+            car['id'] = id
+            if car['positions']:
+                car['position'] = (car['positions'][0]['position'][0], car['positions'][0]['position'][1])  # Fixed reference
+            car['network_connections'] = []
+
+    def simulate_car_vectors(self, car_ids, time_interval):
+        """
+        Set the motion vector of the given cars with the motion estimator of the other engines.
+        """
+        motion = vectorized_motion_vectors(
+            self.state, np.array(car_ids, dtype=np.int64), self.timestamp,
+            self.sim_params.get("time_window", 1), self.sim_params.get("motion_window", 5),
+            self.sim_params.get("motion_noise", 0.1)
+        )
+        for car_id, vector in zip(car_ids, motion.tolist()):
+            self.cars[car_id]['motion_vector'] = tuple(vector)
+
+    def simulate_car_positions(self, time_interval):
+        """
+        Simulate positions of cars by picking positions from their position data.
+        """
+        for car in self.cars:
+            # Check if the car should be active at the current simulation timestamp
+            if car['completed']:
+                continue  # Skip cars that have completed their routes
+
+            if self.timestamp >= car['offset'] and self.timestamp < (car['offset'] + len(car['positions'])):
+                # Get the current position from the position data
+                current_position = car['positions'][int(self.timestamp - car['offset'])]  # Ensure index is an integer
+                car['position'] = (current_position['position'][0], current_position['position'][1])  # Fixed reference
+                car['active'] = True
+            else:
+                car['active'] = False
+                if self.timestamp >= (car['offset'] + len(car['positions'])):
+                    car['completed'] = True  # Mark car as completed
+                    self.cars_completed += 1
+                    print(f"{self.cars_completed} cars have completed their routes.")
+
+    def check_network(self):
+        """
+        Check the network connectivity of the cars.
+        This function should be implemented in subclasses.
+        """
+        raise NotImplementedError("This method should be overridden in subclasses.")
+
+    def analytics_update(self):
+        """
+        Record the analytics and the connected pairs of the last check.
+        """
+        self.analytics.append({
+            'timestamp': self.timestamp,
+            'cars_completed': self.cars_completed,
+            'new_connections_made': self.new_connections_made,
+            'old_connections_dropped': self.old_connections_dropped,
+            'active_connections': len(self.active_connections),
+            'active_cars': len([car for car in self.cars if car['active']]),
+            'avg_connection_duration': self.avg_connection_duration,
+            "avg_connection_health": self.avg_connection_health,
+        })
+        self.tick_pairs.append({(min(pair), max(pair)) for pair in self.active_connections})
+
+    def run_simulation(self, time_interval=1):
+        """
+        Run the simulation for each car in the network.
+
+        Args:
+            time_interval (int): Time interval in seconds for each simulation step.
+        """
+        # Update car positions based on the current timestamp
+        self.simulate_car_positions(time_interval)
+
+        # Run simulation till all cars have completed their positions
+        while any(not car['completed'] for car in self.cars):
+            self.check_network()
+            self.timestamp += time_interval
+            self.simulate_car_positions(time_interval)
+
+            # Calculate the motion vector and speed for network topology
+            self.simulate_car_vectors([car['id'] for car in self.cars if car['active']], time_interval)
+
+            # Update the analytics
+            self.analytics_update()
+
+
+class ReferenceSmartTopology(ReferenceSimulation):
+    def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
+        """
+        Initialize the smart topology simulation with a list of cars.
+        """
+        super().__init__(cars, sim_co_ordinates, sim_params, sim_data_file)
+        self.simulation_results = []
+        self.time_tick = 0
+        self.new_connections_made = 0
+        self.old_connections_dropped = 0
+        self.avg_connection_health = 0
+        self.connection_durations = {}  # Track connection durations
+        self.avg_connection_duration = 0
+
+    def calculate_vector_similarity(self, vector1, vector2):
+        """
+        Calculate the similarity between two motion vectors using cosine similarity.
+
+        Args:
+            vector1 (tuple): Motion vector of the first car (x, y).
+            vector2 (tuple): Motion vector of the second car (x, y).
+
+        Returns:
+            float: Cosine similarity between the two vectors.
+        """
+        dot_product = vector1[0] * vector2[0] + vector1[1] * vector2[1]
+        magnitude1 = (vector1[0]**2 + vector1[1]**2)**0.5
+        magnitude2 = (vector2[0]**2 + vector2[1]**2)**0.5
+        if magnitude1 == 0 or magnitude2 == 0:
+            return 0  # Avoid division by zero
+        return dot_product / (magnitude1 * magnitude2)
+
+    def check_network(self):
+        """
+        Check if cars are within the connection range of each other and prioritize
+        connections between cars moving in the same direction.
+        """
+        print("Checking network connections with motion vector prioritization...")
+        connection_distance = self.sim_params.get("connection_distance", 0.4)  # Default to 0.4 km
+        num_min_connections = self.sim_params.get("num_min_connections", 3)  # Default to 3 connections
+        similarity_threshold = self.sim_params.get("similarity_threshold", 0.8)  # Default to 0.8 cosine similarity
+        similarity_weight = self.sim_params.get("similarity_weight", 0.7)  # Default weight for similarity
+        distance_weight = self.sim_params.get("distance_weight", 0.3)  # Default weight for distance
+        connected_pairs = []
+        new_connections = 0
+        old_connections = 0
+
+        active_cars = [car for car in self.cars if car.get("active", True)]  # Only consider active cars
+
+        # Validate existing connections
+        for car in active_cars:
+            valid_connections = []
+            for connected_car_id in car.get("connections", []):
+                connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
+                if connected_car:
+                    distance = geodesic(car["position"], connected_car["position"]).km
+                    if distance <= connection_distance:
+                        valid_connections.append(connected_car_id)
+                        # Increment connection duration
+                        pair_key = tuple(sorted((car["id"], connected_car_id)))
+                        self.connection_durations[pair_key] = self.connection_durations.get(pair_key, 0) + 1
+                    else:
+                        old_connections += 1
+                        # Remove connection duration tracking
+                        pair_key = tuple(sorted((car["id"], connected_car_id)))
+                        self.connection_durations.pop(pair_key, None)
+                else:
+                    old_connections += 1
+            car["connections"] = valid_connections
+
+        # Add new connections if needed
+        for car in active_cars:
+            if len(car["connections"]) >= num_min_connections:
+                continue  # Skip cars that already satisfy the minimum connections
+
+            potential_connections = []
+            for other_car in active_cars:
+                if other_car["id"] != car["id"] and other_car["id"] not in car["connections"]:
+                    distance = geodesic(car["position"], other_car["position"]).km
+                    if distance <= connection_distance:
+                        similarity = self.calculate_vector_similarity(
+                            car.get("motion_vector", (0, 0)),
+                            other_car.get("motion_vector", (0, 0))
+                        )
+                        # Normalize distance to a score between 0 and 1
+                        distance_score = max(0, 1 - (distance / connection_distance))
+                        # Calculate final score using weights
+                        final_score = (similarity_weight * similarity) + (distance_weight * distance_score)
+                        potential_connections.append((other_car["id"], final_score))
+
+            # Sort potential connections by final score (descending)
+            potential_connections.sort(key=lambda x: -x[1])
+
+            for other_car_id, final_score in potential_connections:
+                if len(car["connections"]) >= num_min_connections:
+                    break  # Stop adding connections if min_connections is satisfied
+                car["connections"].append(other_car_id)
+                other_car = next(c for c in active_cars if c["id"] == other_car_id)
+                other_car["connections"].append(car["id"])
+                connected_pairs.append((car["id"], other_car_id))
+                new_connections += 1
+                # Initialize connection duration
+                pair_key = tuple(sorted((car["id"], other_car_id)))
+                self.connection_durations[pair_key] = 1
+
+        # Record connected pairs for this tick
+        connected_pairs = []  # Reset connected pairs
+        for car in active_cars:
+            for connected_car_id in car["connections"]:
+                if (car["id"], connected_car_id) not in connected_pairs and (connected_car_id, car["id"]) not in connected_pairs:
+                    connected_pairs.append((car["id"], connected_car_id))
+
+        self.simulation_results.append({
+            "time_tick": self.time_tick,
+            "connected_pairs": connected_pairs
+        })
+
+        # Update the number of active connections
+        self.active_connections = connected_pairs
+
+        # Calculate average connections per active car
+        total_connections = sum(len(car["connections"]) for car in active_cars)
+        avg_connections = total_connections / len(active_cars) if active_cars else 0
+        print(f"Average connections per active car: {avg_connections:.2f}")
+
+        # Calculate average connection duration
+        if not hasattr(self, "connection_durations"):
+            self.connection_durations = {}  # Initialize connection durations if not present
+        for car in active_cars:
+            for connected_car_id in car["connections"]:
+                pair_key = tuple(sorted((car["id"], connected_car_id)))
+                self.connection_durations[pair_key] = self.connection_durations.get(pair_key, 0) + 1
+        if self.connection_durations:
+            avg_connection_duration = sum(self.connection_durations.values()) / len(self.connection_durations)
+        else:
+            avg_connection_duration = 0
+        self.avg_connection_duration = avg_connection_duration
+        print(f"Average connection duration: {avg_connection_duration:.2f} ticks")
+
+        # Calculate average connection health
+        if connected_pairs:
+            total_health = 0
+            for car in active_cars:
+                for connected_car_id in car["connections"]:
+                    connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
+                    if connected_car:
+                        distance = geodesic(car["position"], connected_car["position"]).km
+                        connection_health = max(0, 1 - (distance / connection_distance))  # Normalize health to [0, 1]
+                        total_health += connection_health
+            avg_connection_health = total_health / len(connected_pairs)
+        else:
+            avg_connection_health = 0
+        self.avg_connection_health = avg_connection_health
+        print(f"Average connection health: {avg_connection_health:.2f}")
+
+        # Record simulation results for this tick
+        self.simulation_results.append({
+            "time_tick": self.time_tick,
+            "connected_pairs": connected_pairs,
+            "avg_connection_duration": avg_connection_duration,  # Store average connection duration
+            "avg_connection_health": avg_connection_health  # Store average connection health
+        })
+
+        # Update the counters for new and old connections
+        self.new_connections_made = new_connections
+        self.old_connections_dropped = old_connections
+        print(f"New connections made: {new_connections}, Old connections dropped: {old_connections}")
+
+
+class ReferenceRandomTopology(ReferenceSimulation):
+    def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
+        """
+        Initialize the random topology simulation with a list of cars.
+        """
+        super().__init__(cars, sim_co_ordinates, sim_params, sim_data_file)
+        self.simulation_results = []
+        self.time_tick = 0
+        self.new_connections_made = 0
+        self.old_connections_dropped = 0
+        self.connection_durations = {}  # Track connection durations
+
+    def check_network(self):
+        """
+        Check if cars are within the connection range of each other.
+
+        Ensures each car maintains a minimum number of connections and updates
+        the connections only if a connection needs to be dropped.
+        """
+        print("Checking network connections...")
+        connection_distance = self.sim_params.get("connection_distance", 0.4)  # Default to 0.4 km
+        num_min_connections = self.sim_params.get("num_min_connections", 3)  # Default to 3 connections
+        connected_pairs = []
+        new_connections = 0
+        old_connections = 0
+
+        active_cars = [car for car in self.cars if car.get("active", True)]  # Only consider active cars
+
+        # Validate existing connections
+        for car in active_cars:
+            valid_connections = []
+            for connected_car_id in car.get("connections", []):
+                connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
+                if connected_car:
+                    distance = geodesic(car["position"], connected_car["position"]).km
+                    if distance <= connection_distance:
+                        valid_connections.append(connected_car_id)
+                        # Increment connection duration
+                        pair_key = tuple(sorted((car["id"], connected_car_id)))
+                        self.connection_durations[pair_key] = self.connection_durations.get(pair_key, 0) + 1
+                    else:
+                        old_connections += 1
+                        # Remove connection duration tracking
+                        pair_key = tuple(sorted((car["id"], connected_car_id)))
+                        self.connection_durations.pop(pair_key, None)
+                else:
+                    old_connections += 1
+            car["connections"] = valid_connections
+
+        # Add new connections if needed
+        for car in active_cars:
+            if len(car["connections"]) >= num_min_connections:
+                continue  # Skip cars that already satisfy the minimum connections
+
+            potential_connections = []
+            for other_car in active_cars:
+                if other_car["id"] != car["id"] and other_car["id"] not in car["connections"]:
+                    distance = geodesic(car["position"], other_car["position"]).km
+                    if distance <= connection_distance:
+                        potential_connections.append((other_car["id"], distance))
+
+                # Check if potential connections + existing connections satisfy the minimum requirement
+                if len(car["connections"]) + len(potential_connections) > num_min_connections:
+                    break  # Skip if not enough potential connections to satisfy the requirement
+
+            # potential_connections.sort(key=lambda x: x[1])  # Sort by distance
+
+            for other_car_id, distance in potential_connections:
+                if len(car["connections"]) >= num_min_connections:
+                    break  # Stop adding connections if min_connections is satisfied
+                car["connections"].append(other_car_id)
+                other_car = next(c for c in active_cars if c["id"] == other_car_id)
+                other_car["connections"].append(car["id"])
+                connected_pairs.append((car["id"], other_car_id))
+                new_connections += 1
+                # Initialize connection duration
+                pair_key = tuple(sorted((car["id"], other_car_id)))
+                self.connection_durations[pair_key] = 1
+
+        # Record connected pairs for this tick
+        for car in active_cars:
+            for connected_car_id in car["connections"]:
+                if (car["id"], connected_car_id) not in connected_pairs and (connected_car_id, car["id"]) not in connected_pairs:
+                    connected_pairs.append((car["id"], connected_car_id))
+
+        # Calculate average connections per active car
+        total_connections = sum(len(car["connections"]) for car in active_cars)
+        avg_connections = total_connections / len(active_cars) if active_cars else 0
+        print(f"Average connections per active car: {avg_connections:.2f}")
+
+        # Calculate average connection duration
+        if self.connection_durations:
+            avg_connection_duration = sum(self.connection_durations.values()) / len(self.connection_durations)
+        else:
+            avg_connection_duration = 0
+        self.avg_connection_duration = avg_connection_duration
+        print(f"Average connection duration: {avg_connection_duration:.2f} ticks")
+
+        # Calculate average connection health
+        if connected_pairs:
+            total_health = 0
+            for car in active_cars:
+                for connected_car_id in car["connections"]:
+                    connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
+                    if connected_car:
+                        distance = geodesic(car["position"], connected_car["position"]).km
+                        connection_health = max(0, 1 - (distance / connection_distance))  # Normalize health to [0, 1]
+                        total_health += connection_health
+            avg_connection_health = total_health / len(connected_pairs)
+        else:
+            avg_connection_health = 0
+        self.avg_connection_health = avg_connection_health
+        print(f"Average connection health: {avg_connection_health:.2f}")
+
+        # Record simulation results for this tick
+        self.simulation_results.append({
+            "time_tick": self.time_tick,
+            "connected_pairs": connected_pairs,
+            "avg_connection_duration": avg_connection_duration,  # Store average connection duration
+            "avg_connection_health": avg_connection_health  # Store average connection health
+        })
+
+        # Update the counters for new and old connections
+        self.new_connections_made = new_connections
+        self.old_connections_dropped = old_connections
+        self.num_connections = len(connected_pairs)
+
+        # Update active connections
+        self.active_connections = [
+            (car["id"], connected_car_id)
+            for car in active_cars
+            for connected_car_id in car["connections"]
+        ]
+
+        print(f"created: {new_connections}, dropped: {old_connections}, connections: {len(connected_pairs)}, "
+              f"avg_connection_duration: {avg_connection_duration:.2f} ticks, avg_connection_health: {avg_connection_health:.2f}")
+
+
+REFERENCE_TOPOLOGIES = {
+    "smart": ReferenceSmartTopology,
+    "random": ReferenceRandomTopology,
+}
@@ -0,0 +1,106 @@
+import json
+import sqlite3
+import threading
+import zlib
+
+
+class RouteCache:
+    """
+    Persistent SQLite cache of OSRM responses with size-bounded LRU eviction.
+
+    Origins and destinations are snapped to `precision` decimal places before the
+    lookup, and the snapped coordinates are the ones sent to OSRM on a miss, so a
+    cached response is exact for every point that snaps to the same key.
+    """
+    def __init__(self, path, precision=4, max_entries=100000):
+        """
+        Args:
+            path (str): SQLite database file, ":memory:" for a throwaway cache.
+            precision (int): Decimal places coordinates are snapped to (4 is about 11 m).
+            max_entries (int): Entries kept before the least recently used are evicted.
+        """
+        self.path = path
+        self.precision = precision
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS routes ("
+            "key TEXT PRIMARY KEY, response BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS routes_last_used ON routes (last_used)")
+        self.clock = self.connection.execute("SELECT COALESCE(MAX(last_used), 0) FROM routes").fetchone()[0]
+        self.connection.commit()
+
+    def snap(self, position):
+        """Round a (latitude, longitude) pair to the cache precision."""
+        return (round(position[0], self.precision), round(position[1], self.precision))
+
+    def key(self, start, end, params):
+        """Build the cache key of a request from snapped coordinates and its parameters."""
+        start, end = self.snap(start), self.snap(end)
+        options = "&".join(f"{name}={params[name]}" for name in sorted(params))
+        return f"{start[0]},{start[1]};{end[0]},{end[1]}?{options}"
+
+    def get(self, start, end, params):
+        """
+        Return the cached response for a request, or None on a miss.
+        """
+        key = self.key(start, end, params)
+        with self.lock:
+            row = self.connection.execute("SELECT response FROM routes WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.clock += 1
+            self.connection.execute("UPDATE routes SET last_used = ? WHERE key = ?", (self.clock, key))
+            self.connection.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, start, end, params, response):
+        """
+        Store a response and evict the least recently used entries beyond max_entries.
+        """
+        key = self.key(start, end, params)
+        blob = zlib.compress(json.dumps(response).encode())
+        with self.lock:
+            self.clock += 1
+            self.connection.execute(
+                "INSERT OR REPLACE INTO routes (key, response, last_used) VALUES (?, ?, ?)",
+                (key, blob, self.clock)
+            )
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self.connection.execute(
+                    "DELETE FROM routes WHERE key IN (SELECT key FROM routes ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self.evictions += excess
+            self.connection.commit()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss/eviction counters, hit rate and the number of stored entries.
+        """
+        lookups = self.hits + self.misses
+        with self.lock:
+            entries = len(self)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self):
+        self.connection.close()
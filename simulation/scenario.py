@@ -0,0 +1,287 @@
+"""
+Binary columnar scenario format.
+
+A scenario is a directory of uncompressed .npy columns that can be memory-mapped:
+
+    offset.npy        (num_cars,) int64   start tick of each trip
+    start.npy         (num_cars,) int64   first row of each trip in the packed columns
+    length.npy        (num_cars,) int64   number of positions of each trip
+    trajectories.npy  (total, 2)  float32 positions relative to `origin`
+    timestamps.npy    (total,)    float64 timestamp of each position
+    routes.jsonl      one line of route metadata per trip (distance, duration, waypoints)
+    meta.json         format version, origin, bounding box and counts
+
+The packed columns are exactly the buffers of CarStateStore, so loading a scenario
+is a handful of mmap calls and no trajectory data is copied or parsed.
+"""
+import json
+import os
+import sys
+import numpy as np
+from car_state import CarStateStore
+
+
+SCENARIO_VERSION = 1
+STORE_COLUMNS = ("offset", "start", "length", "trajectories", "timestamps")
+
+
+def route_metadata(route):
+    """
+    Extract the summary of an OSRM route response, without geometry or steps.
+    """
+    if not route or "routes" not in route or not route["routes"]:
+        return {}
+    summary = route["routes"][0]
+    return {
+        "distance": summary.get("distance"),
+        "duration": summary.get("duration"),
+        "waypoints": [
+            {"name": waypoint.get("name", ""), "location": waypoint.get("location")}
+            for waypoint in route.get("waypoints", [])
+        ],
+    }
+
+
+def save_scenario(path, trips, bounding_box, dtype=np.float32):
+    """
+    Write trips to a scenario directory.
+
+    Args:
+        path (str): Directory to write, created if needed.
+        trips (list): Trips as produced by simulate_traffic_within_box.
+        bounding_box (dict): Bounding box of the simulation.
+        dtype (numpy.dtype): Storage type of the trajectory column.
+    """
+    os.makedirs(path, exist_ok=True)
+    store = CarStateStore.from_trips(trips, dtype=dtype)
+    for column in STORE_COLUMNS:
+        np.save(os.path.join(path, f"{column}.npy"), getattr(store, column))
+    with open(os.path.join(path, "routes.jsonl"), "w") as file:
+        for trip in trips:
+            file.write(json.dumps(route_metadata(trip.get("route"))) + "\n")
+    with open(os.path.join(path, "meta.json"), "w") as file:
+        json.dump({
+            "version": SCENARIO_VERSION,
+            "origin": store.origin.tolist(),
+            "bounding_box": bounding_box,
+            "num_cars": store.num_cars,
+            "num_positions": int(store.length.sum()),
+        }, file)
+    print(f"Scenario with {store.num_cars} trips saved to {path}")
+
+
+def load_scenario(path, mmap=True, stream=False):
+    """
+    Load a scenario directory as a CarStateStore.
+
+    Args:
+        path (str): Scenario directory.
+        mmap (bool): Memory-map the columns read-only instead of reading them into RAM.
+        stream (bool): Read each trajectory only while its car is active (see StreamingScenarioStore).
+
+    Returns:
+        tuple: (CarStateStore, bounding_box).
+    """
+    if stream:
+        store = StreamingScenarioStore(path)
+        print(f"Scenario with {store.num_cars} trips opened for streaming from {path}")
+        return store, store.bounding_box
+    with open(os.path.join(path, "meta.json")) as file:
+        meta = json.load(file)
+    if meta.get("version") != SCENARIO_VERSION:
+        raise ValueError(f"Unsupported scenario version {meta.get('version')} in {path}")
+    columns = {
+        column: np.load(os.path.join(path, f"{column}.npy"), mmap_mode="r" if mmap else None)
+        for column in STORE_COLUMNS
+    }
+    store = CarStateStore(origin=meta["origin"], **columns)
+    print(f"Scenario with {store.num_cars} trips loaded from {path}")
+    return store, meta["bounding_box"]
+
+
+def open_column(path, column):
+    """
+    Open a .npy column for positioned reads.
+
+    Returns:
+        tuple: (file, dtype, shape, byte offset of the first element).
+    """
+    file = open(os.path.join(path, f"{column}.npy"), "rb")
+    version = np.lib.format.read_magic(file)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+    if fortran_order:
+        raise ValueError(f"Column {column} of {path} is not C-ordered")
+    return file, dtype, shape, file.tell()
+
+
+class StreamingScenarioStore(CarStateStore):
+    """
+    CarStateStore that reads each car's trajectory from the scenario only when the car
+    arrives, and drops it once the car completes.
+
+    Loaded trajectories are packed into a pool buffer that is compacted and resized
+    as cars come and go, so `start` points into the pool and every CarStateStore
+    accessor works unchanged. Only the small per-car columns are kept for all cars;
+    trajectory memory is proportional to the cars that are active at the same time.
+    """
+    def __init__(self, path, initial_capacity=4096):
+        """
+        Args:
+            path (str): Scenario directory.
+            initial_capacity (int): Trajectory rows allocated in the pool up front.
+        """
+        with open(os.path.join(path, "meta.json")) as file:
+            meta = json.load(file)
+        if meta.get("version") != SCENARIO_VERSION:
+            raise ValueError(f"Unsupported scenario version {meta.get('version')} in {path}")
+        self.path = path
+        self.bounding_box = meta["bounding_box"]
+        self.offset = np.load(os.path.join(path, "offset.npy"))
+        self.length = np.load(os.path.join(path, "length.npy"))
+        self.file_start = np.load(os.path.join(path, "start.npy"))
+        self.origin = np.asarray(meta["origin"], dtype=np.float64)
+        self.num_cars = len(self.offset)
+        self.trajectory_file, trajectory_dtype, _, self.trajectory_base = open_column(path, "trajectories")
+        self.timestamp_file, timestamp_dtype, _, self.timestamp_base = open_column(path, "timestamps")
+
+        self.start = np.full(self.num_cars, -1, dtype=np.int64)  # Row in the pool, -1 when not loaded
+        self.trajectories = np.empty((initial_capacity, 2), dtype=trajectory_dtype)
+        self.timestamps = np.empty(initial_capacity, dtype=timestamp_dtype)
+        self.pool_used = 0  # Rows handed out, including those of released cars
+        self.pool_live = 0  # Rows held by loaded cars
+        self.peak_loaded_cars = 0
+        self.init_car_state()
+
+    def fresh(self):
+        """Return a new streaming store over the same scenario, with every car in its initial state."""
+        return StreamingScenarioStore(self.path, len(self.trajectories))
+
+    def read_rows(self, file, base, dtype, first, count, width):
+        """Read `count` rows of `width` values starting at row `first` of a column file."""
+        file.seek(base + first * width * dtype.itemsize)
+        return np.fromfile(file, dtype=dtype, count=count * width)
+
+    def reserve(self, rows):
+        """
+        Make room for `rows` more rows at the end of the pool, compacting the loaded
+        trajectories to the front and resizing the pool when it is mostly free or full.
+        """
+        if self.pool_used + rows <= len(self.trajectories):
+            return
+        loaded = np.flatnonzero(self.start >= 0)
+        capacity = len(self.trajectories)
+        while self.pool_live + rows > capacity:
+            capacity *= 2
+        while capacity > 4096 and (self.pool_live + rows) * 4 < capacity:
+            capacity //= 2
+        trajectories = np.empty((capacity, 2), dtype=self.trajectories.dtype)
+        timestamps = np.empty(capacity, dtype=self.timestamps.dtype)
+        row = 0
+        for car_id in loaded.tolist():
+            first, length = self.start[car_id], self.length[car_id]
+            trajectories[row:row + length] = self.trajectories[first:first + length]
+            timestamps[row:row + length] = self.timestamps[first:first + length]
+            self.start[car_id] = row
+            row += length
+        self.trajectories, self.timestamps = trajectories, timestamps
+        self.pool_used = row
+
+    def load(self, car_ids):
+        car_ids = [car_id for car_id in np.asarray(car_ids).tolist() if self.start[car_id] < 0]
+        self.reserve(int(self.length[car_ids].sum()))
+        for car_id in car_ids:
+            length = int(self.length[car_id])
+            first = int(self.file_start[car_id])
+            row = self.pool_used
+            self.trajectories[row:row + length] = self.read_rows(
+                self.trajectory_file, self.trajectory_base, self.trajectories.dtype, first, length, 2
+            ).reshape(-1, 2)
+            self.timestamps[row:row + length] = self.read_rows(
+                self.timestamp_file, self.timestamp_base, self.timestamps.dtype, first, length, 1
+            )
+            self.start[car_id] = row
+            self.pool_used += length
+            self.pool_live += length
+        self.peak_loaded_cars = max(self.peak_loaded_cars, self.loaded_cars())
+
+    def release(self, car_ids):
+        car_ids = np.asarray(car_ids, dtype=np.int64)
+        car_ids = car_ids[self.start[car_ids] >= 0]
+        self.pool_live -= int(self.length[car_ids].sum())
+        self.start[car_ids] = -1
+
+    def checkpoint_arrays(self):
+        return {**super().checkpoint_arrays(), "pool_start": self.start}
+
+    def checkpoint_meta(self):
+        return {
+            "pool_capacity": len(self.trajectories),
+            "pool_used": self.pool_used,
+            "pool_live": self.pool_live,
+            "peak_loaded_cars": self.peak_loaded_cars,
+        }
+
+    def restore_checkpoint(self, meta):
+        """
+        Rebuild the pool with the capacity and layout it had when the checkpoint was
+        written, so later compactions and memory_stats match the original run.
+        """
+        capacity = meta["pool_capacity"]
+        self.trajectories = np.empty((capacity, 2), dtype=self.trajectories.dtype)
+        self.timestamps = np.empty(capacity, dtype=self.timestamps.dtype)
+        for car_id in np.flatnonzero(self.start >= 0).tolist():
+            row, length, first = int(self.start[car_id]), int(self.length[car_id]), int(self.file_start[car_id])
+            self.trajectories[row:row + length] = self.read_rows(
+                self.trajectory_file, self.trajectory_base, self.trajectories.dtype, first, length, 2
+            ).reshape(-1, 2)
+            self.timestamps[row:row + length] = self.read_rows(
+                self.timestamp_file, self.timestamp_base, self.timestamps.dtype, first, length, 1
+            )
+        self.pool_used = meta["pool_used"]
+        self.pool_live = meta["pool_live"]
+        self.peak_loaded_cars = meta["peak_loaded_cars"]
+
+    def loaded_cars(self):
+        """Return the number of cars whose trajectory is in the pool."""
+        return int(np.count_nonzero(self.start >= 0))
+
+    def memory_stats(self):
+        return {
+            "trajectory_bytes": self.trajectories.nbytes + self.timestamps.nbytes,
+            "loaded_cars": self.loaded_cars(),
+        }
+
+    def close(self):
+        """Close the column files."""
+        self.trajectory_file.close()
+        self.timestamp_file.close()
+
+
+def load_route_metadata(path):
+    """
+    Read the per-trip route metadata table of a scenario.
+
+    Returns:
+        list: One dict per trip, in car id order.
+    """
+    with open(os.path.join(path, "routes.jsonl")) as file:
+        return [json.loads(line) for line in file]
+
+
+def convert_json_scenario(json_file, path):
+    """
+    Convert a simulation_data.json file written by main.save_simulation into a scenario directory.
+    """
+    with open(json_file) as file:
+        data = json.load(file)
+    save_scenario(path, data["simulation_data"], data["bounding_box"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python scenario.py <simulation_data.json> <scenario_dir>")
+        sys.exit(1)
+    convert_json_scenario(sys.argv[1], sys.argv[2])
@@ -0,0 +1,117 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, the NumPy kernel computes the same scores
+    njit = None
+
+
+def score_pairs_numpy(first, second, distances, motion_vectors, connection_distance,
+                      similarity_weight, distance_weight):
+    """
+    Score candidate pairs for SmartTopology in one vectorized pass.
+
+    The score of a pair is `similarity_weight * cosine similarity of the motion vectors
+    + distance_weight * max(0, 1 - distance / connection_distance)`, with a similarity
+    of 0 when either car stands still. Scores are symmetric, so each pair is scored once.
+
+    Args:
+        first (numpy.ndarray): Car id of the first car of each pair.
+        second (numpy.ndarray): Car id of the second car of each pair.
+        distances (numpy.ndarray): Distance of each pair in km.
+        motion_vectors (numpy.ndarray): (num_cars, 3) motion vectors indexed by car id.
+        connection_distance (float): Connection range in km.
+        similarity_weight (float): Weight of the cosine similarity.
+        distance_weight (float): Weight of the distance score.
+
+    Returns:
+        numpy.ndarray: Score of each pair.
+    """
+    vector1 = motion_vectors[first]
+    vector2 = motion_vectors[second]
+    dot_product = vector1[:, 0] * vector2[:, 0] + vector1[:, 1] * vector2[:, 1]
+    magnitude1 = np.sqrt(vector1[:, 0] ** 2 + vector1[:, 1] ** 2)
+    magnitude2 = np.sqrt(vector2[:, 0] ** 2 + vector2[:, 1] ** 2)
+    standing = (magnitude1 == 0) | (magnitude2 == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        similarity = np.where(standing, 0.0, dot_product / (magnitude1 * magnitude2))
+    distance_score = np.maximum(0, 1 - (distances / connection_distance))
+    return (similarity_weight * similarity) + (distance_weight * distance_score)
+
+
+def score_pairs_loop(first, second, distances, motion_vectors, connection_distance,
+                     similarity_weight, distance_weight):
+    """
+    Same as score_pairs_numpy as a plain loop, compiled by numba when it is installed.
+    """
+    scores = np.empty(len(first), dtype=np.float64)
+    for row in range(len(first)):
+        x1 = motion_vectors[first[row], 0]
+        y1 = motion_vectors[first[row], 1]
+        x2 = motion_vectors[second[row], 0]
+        y2 = motion_vectors[second[row], 1]
+        magnitude1 = math.sqrt(x1 ** 2 + y1 ** 2)
+        magnitude2 = math.sqrt(x2 ** 2 + y2 ** 2)
+        similarity = 0.0
+        if magnitude1 != 0 and magnitude2 != 0:
+            similarity = (x1 * x2 + y1 * y2) / (magnitude1 * magnitude2)
+        distance_score = max(0.0, 1 - (distances[row] / connection_distance))
+        scores[row] = (similarity_weight * similarity) + (distance_weight * distance_score)
+    return scores
+
+
+if njit is not None:
+    score_pairs_numba = njit(cache=True, nogil=True)(score_pairs_loop)
+else:
+    score_pairs_numba = None
+
+
+def score_pairs(first, second, distances, motion_vectors, connection_distance,
+                similarity_weight, distance_weight, use_numba=True):
+    """
+    Score candidate pairs with the numba kernel when available, else with NumPy.
+    """
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    distances = np.asarray(distances, dtype=np.float64)
+    motion_vectors = np.ascontiguousarray(motion_vectors, dtype=np.float64)
+    kernel = score_pairs_numba if use_numba and score_pairs_numba is not None else score_pairs_numpy
+    return kernel(first, second, distances, motion_vectors, float(connection_distance),
+                  float(similarity_weight), float(distance_weight))
+
+
+class CandidateLists:
+    """
+    Per-car candidate lists, best first, in compressed sparse row form.
+
+    Every scored pair appears under each of its cars that is selected by `car_mask`.
+    One lexsort ranks all lists at once by descending score with ties going to the
+    lower id, which is the order a stable descending sort of each car's id-ordered
+    neighbors gives.
+    """
+    def __init__(self, first, second, scores, car_mask=None):
+        """
+        Args:
+            first (numpy.ndarray): First car of each pair.
+            second (numpy.ndarray): Second car of each pair.
+            scores (numpy.ndarray): Score of each pair.
+            car_mask (numpy.ndarray): Boolean mask by car id of the cars to build lists for. Defaults to all.
+        """
+        forward = slice(None) if car_mask is None else car_mask[first]
+        backward = slice(None) if car_mask is None else car_mask[second]
+        cars = np.concatenate([first[forward], second[backward]]).astype(np.int64)
+        others = np.concatenate([second[forward], first[backward]]).astype(np.int64)
+        scores = np.concatenate([scores[forward], scores[backward]])
+        order = np.lexsort((others, -scores, cars))
+        self.cars = cars[order]
+        self.others = others[order]
+        self.scores = scores[order]
+
+    def ranges(self, car_ids):
+        """
+        Returns:
+            tuple: (start, end) arrays delimiting the candidates of each car in `car_ids`.
+        """
+        return (np.searchsorted(self.cars, car_ids, side="left"),
+                np.searchsorted(self.cars, car_ids, side="right"))
@@ -0,0 +1,352 @@
+"""
+Spatially sharded neighbor search across worker processes.
+
+The plane is split into tiles, one per worker process, and each worker owns the
+cars inside its tile: it holds their trajectories and computes their positions
+itself. A car is handed to a worker with its trajectory when it arrives, and
+when it crosses a tile boundary its owner hands it, trajectory and all, to the
+worker of its new tile. Tile boundaries are placed at quantiles of the car
+positions and rebalanced every `rebalance_interval` seconds so each worker owns
+a similar share of the cars; rebalancing hands cars over the same way.
+
+A tick takes two round trips. In the first, the simulation process tells each
+worker the tick, the cars that arrived in its tile and the cars that departed.
+Each worker advances its cars, returns the ones that left its tile, and returns
+for every other tile its cars within the halo of that tile, a band
+connection_distance wide around it. In the second, each worker receives the cars
+handed to it and the halo cars of its tile, and returns the pairs within range
+whose lower-id car it owns. Each pair therefore comes from exactly one worker,
+and the merged pairs are the same arrays, in the same order, as the
+single-process search returns. Per tick only arrivals, departures, hand-offs,
+halo cars and pairs cross the pipes, not every position.
+
+Only the pair search is sharded. Validation, scoring, link assignment, link
+statistics and the simulation's own car positions stay in the simulation
+process and run on the merged pairs, so the topology of a sharded run is
+identical to the single-process run, and the speedup is bounded by the share of
+the tick spent in the pair search; `python benchmark.py shards` measures it.
+The tick profiler's index counters only see searches run in the simulation process.
+"""
+import math
+import multiprocessing
+import numpy as np
+from distance_engine import DistanceEngine
+from neighbor_index import make_neighbor_index, pairs_within_range, degree_cell_size
+
+
+def tile_grid(num_tiles):
+    """
+    Return (columns, rows) of the most square grid of exactly `num_tiles` tiles.
+    """
+    columns = int(math.sqrt(num_tiles))
+    while num_tiles % columns:
+        columns -= 1
+    return columns, num_tiles // columns
+
+
+class TileLayout:
+    """
+    Tiles covering the whole plane: columns split at longitude boundaries, each
+    column split into rows at its own latitude boundaries. The outer tiles extend
+    to infinity, so every position has an owner.
+    """
+    def __init__(self, lon_bounds, lat_bounds):
+        """
+        Args:
+            lon_bounds (numpy.ndarray): Ascending inner longitude boundaries, one less than the columns.
+            lat_bounds (list): Per column, ascending inner latitude boundaries, one less than the rows.
+        """
+        self.lon_bounds = lon_bounds
+        self.lat_bounds = lat_bounds
+        self.rows = len(lat_bounds[0]) + 1
+        self.num_tiles = len(lat_bounds) * self.rows
+
+    @classmethod
+    def balanced(cls, positions, num_tiles):
+        """
+        Place the boundaries at quantiles of `positions`, so the tiles own about as many cars each.
+        """
+        columns, rows = tile_grid(num_tiles)
+        lon_bounds = np.quantile(positions[:, 1], np.arange(1, columns) / columns)
+        column_of = np.searchsorted(lon_bounds, positions[:, 1], side="right")
+        lat_bounds = []
+        for column in range(columns):
+            lats = positions[column_of == column, 0]
+            if not len(lats):
+                lats = positions[:, 0]
+            lat_bounds.append(np.quantile(lats, np.arange(1, rows) / rows))
+        return cls(lon_bounds, lat_bounds)
+
+    def extent(self, tile):
+        """
+        Returns:
+            tuple: (min lat, max lat, min lon, max lon) of a tile, infinite at the outer edges.
+        """
+        column, row = divmod(tile, self.rows)
+        lon_edges = np.concatenate([[-np.inf], self.lon_bounds, [np.inf]])
+        lat_edges = np.concatenate([[-np.inf], self.lat_bounds[column], [np.inf]])
+        return lat_edges[row], lat_edges[row + 1], lon_edges[column], lon_edges[column + 1]
+
+    def owners(self, positions):
+        """
+        Return the tile owning each position.
+        """
+        column_of = np.searchsorted(self.lon_bounds, positions[:, 1], side="right")
+        owners = np.empty(len(positions), dtype=np.int64)
+        for column, lat_bounds in enumerate(self.lat_bounds):
+            in_column = column_of == column
+            owners[in_column] = column * self.rows + np.searchsorted(lat_bounds, positions[in_column, 0], side="right")
+        return owners
+
+    def members(self, tile, positions, halo):
+        """
+        Return a mask of the positions inside a tile grown by `halo` = (lat, lon) degrees on every side.
+        """
+        min_lat, max_lat, min_lon, max_lon = self.extent(tile)
+        return ((positions[:, 0] >= min_lat - halo[0]) & (positions[:, 0] <= max_lat + halo[0]) &
+                (positions[:, 1] >= min_lon - halo[1]) & (positions[:, 1] <= max_lon + halo[1]))
+
+
+class TileWorker:
+    """
+    The cars one worker owns and the pair search over its tile. Lives in the worker process.
+    """
+    def __init__(self, tile, index_kind, connection_distance, distance_mode):
+        self.tile = tile
+        self.connection_distance = connection_distance
+        self.neighbor_index = make_neighbor_index(index_kind, connection_distance)
+        self.distance_engine = DistanceEngine(distance_mode)
+        self.cars = {}  # Owned car id -> (offset, (length, 2) trajectory)
+        self.layout = None
+        self.timestamp = 0
+        # Cars handed over this tick that are still inside this tile's halo
+        self.kept_ids = np.zeros(0, dtype=np.int64)
+        self.kept_positions = np.zeros((0, 2), dtype=np.float64)
+
+    def receive(self, cars):
+        """Take ownership of (car id, offset, trajectory) entries."""
+        for car_id, offset, trajectory in cars:
+            self.cars[car_id] = (offset, trajectory)
+
+    def hand_off(self, car_ids):
+        """Give up the given cars and return them as (car id, offset, trajectory) entries."""
+        return [(car_id, *self.cars.pop(car_id)) for car_id in car_ids]
+
+    def owned(self):
+        """Return the owned car ids in ascending order and their positions at the current tick."""
+        ids = np.array(sorted(self.cars), dtype=np.int64)
+        positions = np.zeros((len(ids), 2), dtype=np.float64)
+        for row, car_id in enumerate(ids.tolist()):
+            offset, trajectory = self.cars[car_id]
+            positions[row] = trajectory[self.timestamp - offset]
+        return ids, positions
+
+    def advance(self, timestamp, layout, halo, arrivals, departed):
+        """
+        Move the owned cars to `timestamp` and hand over the ones that left the tile.
+
+        Args:
+            timestamp (int): Current simulation tick.
+            layout (TileLayout): New tile layout, or None if it is unchanged.
+            halo (tuple): (lat, lon) halo width in degrees.
+            arrivals (list): (car id, offset, trajectory) of the cars that arrived in this tile.
+            departed (numpy.ndarray): Ids of the cars that departed; those owned here are dropped.
+
+        Returns:
+            tuple: ({tile: cars handed to it}, {tile: (ids, positions) of the cars in its halo}).
+        """
+        self.timestamp = timestamp
+        if layout is not None:
+            self.layout = layout
+        for car_id in departed.tolist():
+            self.cars.pop(car_id, None)
+        self.receive(arrivals)
+
+        ids, positions = self.owned()
+        owners = self.layout.owners(positions)
+        emigrants, halo_cars = {}, {}
+        for tile in range(self.layout.num_tiles):
+            if tile == self.tile:
+                continue
+            leaving = ids[owners == tile]
+            if len(leaving):
+                emigrants[tile] = self.hand_off(leaving.tolist())
+            # Cars leaving for another tile are in that tile's halo as well, until it owns them
+            members = self.layout.members(tile, positions, halo)
+            if members.any():
+                halo_cars[tile] = (ids[members], positions[members])
+        kept = (owners != self.tile) & self.layout.members(self.tile, positions, halo)
+        self.kept_ids, self.kept_positions = ids[kept], positions[kept]
+        return emigrants, halo_cars
+
+    def search(self, immigrants, halo_ids, halo_positions):
+        """
+        Take over the cars handed to this tile and find the pairs within range of the owned cars.
+
+        Returns:
+            tuple: (first, second, distances) of the pairs whose lower-id car is owned here.
+        """
+        self.receive(immigrants)
+        owned_ids, owned_positions = self.owned()
+        others = ~np.isin(halo_ids, owned_ids)  # Cars handed over here were also sent as halo cars
+        ids = np.concatenate([owned_ids, self.kept_ids, halo_ids[others]])
+        positions = np.concatenate([owned_positions, self.kept_positions, halo_positions[others]])
+        order = np.argsort(ids)
+        return pairs_within_range(self.neighbor_index, self.distance_engine, self.connection_distance,
+                                  ids[order], positions[order], owned_ids)
+
+
+def tile_worker(connection, tile, index_kind, connection_distance, distance_mode):
+    """
+    Serve one tile until None is received. Runs in a worker process.
+    """
+    worker = TileWorker(tile, index_kind, connection_distance, distance_mode)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        command, *args = message
+        connection.send(getattr(worker, command)(*args))
+    connection.close()
+
+
+class ShardPool:
+    """
+    Worker processes that each own the cars of one tile of the plane and search it for pairs within range.
+    """
+    def __init__(self, num_workers, num_cars, connection_distance, index_kind="grid", distance_mode="haversine",
+                 rebalance_interval=60, min_cars=1000):
+        """
+        Args:
+            num_workers (int): Worker processes, one tile each.
+            num_cars (int): Number of cars of the simulation.
+            connection_distance (float): Connection range in km; also the halo width.
+            index_kind (str): Neighbor index the workers use.
+            distance_mode (str): Distance mode of the simulation.
+            rebalance_interval (int): Simulation seconds between two placements of the tile boundaries.
+            min_cars (int): Below this many active cars the search runs in the simulation process,
+                            where it is cheaper than the round trips to the workers.
+        """
+        self.num_workers = num_workers
+        self.connection_distance = connection_distance
+        self.index_kind = index_kind
+        self.distance_mode = distance_mode
+        self.rebalance_interval = rebalance_interval
+        self.min_cars = min_cars
+        self.layout = None
+        self.next_rebalance = None
+        self.resident = np.zeros(num_cars, dtype=bool)  # Cars owned by some worker
+        self.migrations = 0
+        self.halo_cars = 0
+        self.sharded_ticks = 0
+        self.connections = []
+        self.processes = []
+
+    def start(self):
+        """Start the worker processes."""
+        for tile in range(self.num_workers):
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=tile_worker,
+                args=(worker_connection, tile, self.index_kind, self.connection_distance, self.distance_mode),
+                daemon=True
+            )
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def close(self):
+        """Stop the worker processes."""
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
+        if self.sharded_ticks:
+            print(f"Sharded {self.sharded_ticks} ticks over {self.num_workers} workers, "
+                  f"{self.migrations} hand-offs, {self.halo_cars / self.sharded_ticks:.1f} halo cars per tick")
+
+    def handles(self, num_active):
+        """Return True if a tick with `num_active` active cars is worth splitting over the workers."""
+        return bool(self.connections) and num_active >= max(self.min_cars, 1)
+
+    def pairs_within_range(self, timestamp, state, ids, positions):
+        """
+        Find every pair of active cars within range, split over the tile workers.
+
+        The workers compute the positions of the cars they own. Cars that arrived since
+        the last sharded tick are handed to the worker of their tile with their trajectory,
+        and cars that departed are dropped, so ticks searched in the simulation process
+        in between need no catching up.
+
+        Args:
+            timestamp (int): Current simulation time.
+            state (CarStateStore): The car state store, for the trajectories of arriving cars.
+            ids (numpy.ndarray): Active car ids in ascending order.
+            positions (numpy.ndarray): (len(ids), 2) positions of the cars, for placing tiles and arrivals.
+
+        Returns:
+            tuple: (first, second, distances) as returned by neighbor_index.pairs_within_range.
+        """
+        rebalanced = self.layout is None or timestamp >= self.next_rebalance
+        if rebalanced:
+            self.layout = TileLayout.balanced(positions, self.num_workers)
+            self.next_rebalance = timestamp + self.rebalance_interval
+        halo = degree_cell_size(self.connection_distance, np.abs(positions[:, 0]).max())
+
+        active = np.zeros(len(self.resident), dtype=bool)
+        active[ids] = True
+        departed = np.flatnonzero(self.resident & ~active)
+        arriving = ~self.resident[ids]
+        arrived = ids[arriving]
+        arrival_tiles = self.layout.owners(positions[arriving])
+        self.resident[departed] = False
+        self.resident[arrived] = True
+
+        for tile, connection in enumerate(self.connections):
+            arrivals = [(car_id, int(state.offset[car_id]), state.trajectory(car_id))
+                        for car_id in arrived[arrival_tiles == tile].tolist()]
+            connection.send(("advance", timestamp, self.layout if rebalanced else None, halo, arrivals, departed))
+        replies = [connection.recv() for connection in self.connections]
+
+        # Relay the handed-over cars and the halo cars to the worker of their tile
+        for tile, connection in enumerate(self.connections):
+            immigrants = [car for emigrants, _ in replies for car in emigrants.get(tile, [])]
+            halo_parts = [halo_cars[tile] for _, halo_cars in replies if tile in halo_cars]
+            halo_ids = np.concatenate([np.zeros(0, dtype=np.int64)] + [part[0] for part in halo_parts])
+            halo_positions = np.concatenate([np.zeros((0, 2))] + [part[1] for part in halo_parts])
+            self.migrations += len(immigrants)
+            self.halo_cars += len(halo_ids)
+            connection.send(("search", immigrants, halo_ids, halo_positions))
+        results = [connection.recv() for connection in self.connections]
+
+        first, second, distances = (np.concatenate(arrays) for arrays in zip(*results))
+        order = np.lexsort((second, first))
+        self.sharded_ticks += 1
+        return first[order], second[order], distances[order]
+
+
+def make_shard_pool(sim_params, num_cars):
+    """
+    Create the shard pool of a simulation from sim_params['shards'], or None for a single-process run.
+    """
+    num_workers = sim_params.get("shards", 0)
+    if not num_workers or num_workers < 2:
+        return None
+    return ShardPool(
+        num_workers,
+        num_cars,
+        sim_params.get("connection_distance", 0.4),
+        sim_params.get("neighbor_index", "grid"),
+        sim_params.get("distance_mode", "haversine"),
+        sim_params.get("shard_rebalance_interval", 60),
+        sim_params.get("shard_min_cars", 1000)
+    )
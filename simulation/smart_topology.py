@@ -1,5 +1,7 @@
+import numpy as np
 from network_simulation import NetworkSimulation
-from geopy.distance import geodesic
+from scoring_kernel import score_pairs, CandidateLists
+from link_assignment import b_matching, LINK_ASSIGNMENTS
 
 class SmartTopology(NetworkSimulation):
     def __init__(self, cars, sim_co_ordinates, sim_params, sim_data_file=None):
@@ -7,9 +9,12 @@ class SmartTopology(NetworkSimulation):
         Initialize the smart topology simulation with a list of cars.
 
         Args:
-            cars (list): A list of car objects. Each car object should have at least
-                         'id', 'position' (latitude, longitude), and 'timestamp'.
+            cars (list or CarStateStore): A list of car objects with 'offset' and 'positions',
+                         or an already packed CarStateStore.
         """
+        self.link_assignment = sim_params.get("link_assignment", "greedy")
+        if self.link_assignment not in LINK_ASSIGNMENTS:
+            raise ValueError(f"Unknown link assignment '{self.link_assignment}'. Choose from {list(LINK_ASSIGNMENTS)}.")
         super().__init__(cars, sim_co_ordinates, sim_params, sim_data_file)
         self.simulation_results = []
         self.time_tick = 0
@@ -17,26 +22,27 @@ class SmartTopology(NetworkSimulation):
         self.old_connections_dropped = 0
         # self.active_connections = 0  # Initialize active connections as a number
         self.avg_connection_health = 0
-        self.connection_durations = {}  # Track connection durations
         self.avg_connection_duration = 0
 
-    def calculate_vector_similarity(self, vector1, vector2):
+    def score_candidates(self, first, second, distances):
         """
-        Calculate the similarity between two motion vectors using cosine similarity.
+        Score candidate pairs; higher scores are connected first.
 
         Args:
-            vector1 (tuple): Motion vector of the first car (x, y).
-            vector2 (tuple): Motion vector of the second car (x, y).
+            first (numpy.ndarray): First car of each pair.
+            second (numpy.ndarray): Second car of each pair.
+            distances (numpy.ndarray): Distance of each pair in km.
 
         Returns:
-            float: Cosine similarity between the two vectors.
+            numpy.ndarray: Score of each pair.
         """
-        dot_product = vector1[0] * vector2[0] + vector1[1] * vector2[1]
-        magnitude1 = (vector1[0]**2 + vector1[1]**2)**0.5
-        magnitude2 = (vector2[0]**2 + vector2[1]**2)**0.5
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0  # Avoid division by zero
-        return dot_product / (magnitude1 * magnitude2)
+        return score_pairs(
+            first, second, distances, self.state.motion_vector,
+            self.sim_params.get("connection_distance", 0.4),
+            self.sim_params.get("similarity_weight", 0.7),
+            self.sim_params.get("distance_weight", 0.3),
+            use_numba=self.sim_params.get("use_numba", True)
+        )
 
     def check_network(self):
         """
@@ -44,132 +50,52 @@ class SmartTopology(NetworkSimulation):
         connections between cars moving in the same direction.
         """
         print("Checking network connections with motion vector prioritization...")
-        connection_distance = self.sim_params.get("connection_distance", 0.4)  # Default to 0.4 km
         num_min_connections = self.sim_params.get("num_min_connections", 3)  # Default to 3 connections
-        similarity_threshold = self.sim_params.get("similarity_threshold", 0.8)  # Default to 0.8 cosine similarity
-        similarity_weight = self.sim_params.get("similarity_weight", 0.7)  # Default weight for similarity
-        distance_weight = self.sim_params.get("distance_weight", 0.3)  # Default weight for distance
-        connected_pairs = []
         new_connections = 0
-        old_connections = 0
 
-        active_cars = [car for car in self.cars if car.get("active", True)]  # Only consider active cars
+        active_ids = self.active_car_ids.tolist()  # Only consider active cars
+        edges = self.edges
 
         # Validate existing connections
-        for car in active_cars:
-            valid_connections = []
-            for connected_car_id in car.get("connections", []):
-                connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
-                if connected_car:
-                    distance = geodesic(car["position"], connected_car["position"]).km
-                    if distance <= connection_distance:
-                        valid_connections.append(connected_car_id)
-                        # Increment connection duration
-                        pair_key = tuple(sorted((car["id"], connected_car_id)))
-                        self.connection_durations[pair_key] = self.connection_durations.get(pair_key, 0) + 1
-                    else:
-                        old_connections += 1
-                        # Remove connection duration tracking
-                        pair_key = tuple(sorted((car["id"], connected_car_id)))
-                        self.connection_durations.pop(pair_key, None)
-                else:
-                    old_connections += 1
-            car["connections"] = valid_connections
+        old_connections = self.validate_connections()
+
+        # Only cars below the minimum at this point can add connections this tick
+        needs_connections = np.zeros(self.state.num_cars, dtype=bool)
+        needs_connections[[car_id for car_id in active_ids if edges.degree(car_id) < num_min_connections]] = True
+
+        # Score every pair within range of such a car in one batched pass
+        involved = needs_connections[self.pair_first] | needs_connections[self.pair_second]
+        first, second = self.pair_first[involved], self.pair_second[involved]
+        scores = self.score_candidates(first, second, self.pair_distance_values[involved])
+        candidates = CandidateLists(first, second, scores, needs_connections)
+        starts, ends = candidates.ranges(self.active_car_ids)
+
+        if self.link_assignment == "matching":
+            # Pick links for the whole tick at once; the per-car pass below only tops up
+            # cars whose neighbors were all taken
+            capacity = np.zeros(self.state.num_cars, dtype=np.int64)
+            capacity[self.active_car_ids] = [max(0, num_min_connections - edges.degree(car_id)) for car_id in active_ids]
+            for car_id, other_car_id in b_matching(first, second, scores, capacity, edges.connected):
+                self.connect(car_id, other_car_id)
+                new_connections += 1
 
         # Add new connections if needed
-        for car in active_cars:
-            if len(car["connections"]) >= num_min_connections:
+        ranked_car_ids = candidates.others.tolist()
+        for car_id, start, end in zip(active_ids, starts.tolist(), ends.tolist()):
+            needed = num_min_connections - edges.degree(car_id)
+            if needed <= 0:
                 continue  # Skip cars that already satisfy the minimum connections
 
-            potential_connections = []
-            for other_car in active_cars:
-                if other_car["id"] != car["id"] and other_car["id"] not in car["connections"]:
-                    distance = geodesic(car["position"], other_car["position"]).km
-                    if distance <= connection_distance:
-                        similarity = self.calculate_vector_similarity(
-                            car.get("motion_vector", (0, 0)),
-                            other_car.get("motion_vector", (0, 0))
-                        )
-                        # Normalize distance to a score between 0 and 1
-                        distance_score = max(0, 1 - (distance / connection_distance))
-                        # Calculate final score using weights
-                        final_score = (similarity_weight * similarity) + (distance_weight * distance_score)
-                        potential_connections.append((other_car["id"], final_score))
-
-            # Sort potential connections by final score (descending)
-            potential_connections.sort(key=lambda x: -x[1])
-
-            for other_car_id, final_score in potential_connections:
-                if len(car["connections"]) >= num_min_connections:
-                    break  # Stop adding connections if min_connections is satisfied
-                car["connections"].append(other_car_id)
-                other_car = next(c for c in active_cars if c["id"] == other_car_id)
-                other_car["connections"].append(car["id"])
-                connected_pairs.append((car["id"], other_car_id))
+            # Candidates are ranked by final score (descending); take the best unconnected ones
+            connected = edges.neighbors(car_id)
+            for other_car_id in ranked_car_ids[start:end]:
+                if other_car_id in connected:
+                    continue
+                self.connect(car_id, other_car_id)
                 new_connections += 1
-                # Initialize connection duration
-                pair_key = tuple(sorted((car["id"], other_car_id)))
-                self.connection_durations[pair_key] = 1
-
-        # Record connected pairs for this tick
-        connected_pairs = []  # Reset connected pairs
-        for car in active_cars:
-            for connected_car_id in car["connections"]:
-                if (car["id"], connected_car_id) not in connected_pairs and (connected_car_id, car["id"]) not in connected_pairs:
-                    connected_pairs.append((car["id"], connected_car_id))
-
-        self.simulation_results.append({
-            "time_tick": self.time_tick,
-            "connected_pairs": connected_pairs
-        })
-
-        # Update the number of active connections
-        self.active_connections = connected_pairs
-
-        # Calculate average connections per active car
-        total_connections = sum(len(car["connections"]) for car in active_cars)
-        avg_connections = total_connections / len(active_cars) if active_cars else 0
-        print(f"Average connections per active car: {avg_connections:.2f}")
-
-        # Calculate average connection duration
-        if not hasattr(self, "connection_durations"):
-            self.connection_durations = {}  # Initialize connection durations if not present
-        for car in active_cars:
-            for connected_car_id in car["connections"]:
-                pair_key = tuple(sorted((car["id"], connected_car_id)))
-                self.connection_durations[pair_key] = self.connection_durations.get(pair_key, 0) + 1
-        if self.connection_durations:
-            avg_connection_duration = sum(self.connection_durations.values()) / len(self.connection_durations)
-        else:
-            avg_connection_duration = 0
-        self.avg_connection_duration = avg_connection_duration
-        print(f"Average connection duration: {avg_connection_duration:.2f} ticks")
-
-        # Calculate average connection health
-        if connected_pairs:
-            total_health = 0
-            for car in active_cars:
-                for connected_car_id in car["connections"]:
-                    connected_car = next((c for c in active_cars if c["id"] == connected_car_id), None)
-                    if connected_car:
-                        distance = geodesic(car["position"], connected_car["position"]).km
-                        connection_health = max(0, 1 - (distance / connection_distance))  # Normalize health to [0, 1]
-                        total_health += connection_health
-            avg_connection_health = total_health / len(connected_pairs)
-        else:
-            avg_connection_health = 0
-        self.avg_connection_health = avg_connection_health
-        print(f"Average connection health: {avg_connection_health:.2f}")
-
-        # Record simulation results for this tick
-        self.simulation_results.append({
-            "time_tick": self.time_tick,
-            "connected_pairs": connected_pairs,
-            "avg_connection_duration": avg_connection_duration,  # Store average connection duration
-            "avg_connection_health": avg_connection_health  # Store average connection health
-        })
+                needed -= 1
+                if needed == 0:
+                    break  # Stop adding connections if min_connections is satisfied
 
-        # Update the counters for new and old connections
-        self.new_connections_made = new_connections
-        self.old_connections_dropped = old_connections
+        self.record_tick(new_connections, old_connections)
         print(f"New connections made: {new_connections}, Old connections dropped: {old_connections}")
@@ -0,0 +1,166 @@
+"""
+Parameter sweeps over topology simulations.
+
+Every combination of a parameter grid and a topology runs in its own worker
+process. Workers memory-map the same scenario directory, so the trajectories are
+shared through the page cache instead of being pickled to each process, and each
+run starts from a fresh CarStateStore. Runs write their analytics to their own
+file and return a summary row for the comparison table.
+"""
+import contextlib
+import csv
+import itertools
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from analytics_sink import read_analytics
+from random_topology import RandomTopology
+from scenario import load_scenario
+from smart_topology import SmartTopology
+from lookahead_topology import LookaheadTopology
+
+TOPOLOGIES = {
+    "smart": SmartTopology,
+    "random": RandomTopology,
+    "lookahead": LookaheadTopology,
+}
+DEFAULT_GRID = {
+    "connection_distance": [0.1, 0.2],
+    "num_min_connections": [2, 3],
+    "similarity_weight": [0.7],
+    "distance_weight": [0.3],
+    "link_assignment": ["greedy", "matching"],
+}
+# Parameters only some topologies read; the others skip that grid axis instead of repeating identical runs
+TOPOLOGY_PARAMETERS = {
+    "link_assignment": ("smart", "lookahead"),
+}
+METRIC_FIELDS = [
+    "ticks", "new_connections", "connections_dropped", "mean_active_connections",
+    "mean_connection_health", "avg_link_lifetime", "seconds",
+]
+
+
+def parameter_grid(grid):
+    """
+    Expand a {name: [values]} grid into the list of every combination.
+    """
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def topology_grid(grid, topology):
+    """
+    Return the axes of `grid` that `topology` reads, per TOPOLOGY_PARAMETERS.
+    """
+    return {name: values for name, values in grid.items() if topology in TOPOLOGY_PARAMETERS.get(name, (topology,))}
+
+
+def summarize_analytics(analytics):
+    """
+    Reduce the per-tick analytics of one run to the columns of the comparison table.
+    """
+    ticks = len(analytics)
+    return {
+        "ticks": ticks,
+        "new_connections": sum(entry["new_connections_made"] for entry in analytics),
+        "connections_dropped": sum(entry["old_connections_dropped"] for entry in analytics),
+        "mean_active_connections": sum(entry["active_connections"] for entry in analytics) / ticks if ticks else 0,
+        "mean_connection_health": sum(entry["avg_connection_health"] for entry in analytics) / ticks if ticks else 0,
+        "avg_link_lifetime": analytics[-1].get("avg_link_lifetime", 0) if ticks else 0,
+    }
+
+
+def run_sweep_job(scenario_path, topology, sim_params, analytics_file, seed=0, time_interval=1, stream=False):
+    """
+    Run one topology simulation on a scenario. Executed in a worker process.
+
+    Returns:
+        dict: Summary row of the run.
+    """
+    random.seed(seed)
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        store, bounding_box = load_scenario(scenario_path, stream=stream)
+        with store:
+            simulation = TOPOLOGIES[topology](store, bounding_box, sim_params, analytics_file)
+            simulation.run_simulation(time_interval=time_interval)
+    summary = summarize_analytics(read_analytics(simulation.analytics_sink.path))
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+def run_sweep(scenario_path, base_params, grid, output_dir, topologies=("smart", "random"),
+              workers=None, seed=0, time_interval=1, stream=False):
+    """
+    Run every combination of `grid` and `topologies` on a scenario in parallel.
+
+    Args:
+        scenario_path (str): Scenario directory written by scenario.save_scenario.
+        base_params (dict): Simulation parameters shared by every run.
+        grid (dict): {parameter name: [values]} overriding base_params. Axes listed in
+                     TOPOLOGY_PARAMETERS only multiply the runs of the topologies that read them.
+        output_dir (str): Directory for the per-run analytics and the comparison table.
+        topologies (tuple): Names from TOPOLOGIES.
+        workers (int): Worker processes, defaults to the number of CPUs.
+        seed (int): Seed of the random module in every run, so runs are reproducible.
+        time_interval (int): Simulation step in seconds.
+        stream (bool): Stream trajectories instead of memory-mapping them whole.
+
+    Returns:
+        list: One summary dict per run, in grid order. Also written to output_dir/comparison.csv.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = []
+    for topology in topologies:
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown topology {topology!r}, expected one of {sorted(TOPOLOGIES)}")
+        for overrides in parameter_grid(topology_grid(grid, topology)):
+            run = f"{topology}-{len(jobs):03d}"
+            jobs.append((run, topology, overrides, os.path.join(output_dir, f"{run}.jsonl")))
+
+    fields = ["run", "topology", *grid, *METRIC_FIELDS]
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_sweep_job, scenario_path, topology, {**base_params, **overrides}, analytics_file, seed,
+                            time_interval, stream)
+            for run, topology, overrides, analytics_file in jobs
+        ]
+        for (run, topology, overrides, _), future in zip(jobs, futures):
+            row = {"run": run, "topology": topology}
+            row.update({name: overrides.get(name, "") for name in grid})  # Blank for axes the topology skips
+            row.update(future.result())
+            rows.append(row)
+            print(f"Finished {run} in {row['seconds']:.1f}s")
+
+    table_file = os.path.join(output_dir, "comparison.csv")
+    with open(table_file, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    print_comparison(rows, fields)
+    print(f"Comparison table saved to {table_file}")
+    return rows
+
+
+def print_comparison(rows, fields):
+    """
+    Print the comparison table with aligned columns.
+    """
+    cells = [[f"{row[name]:.3f}" if isinstance(row[name], float) else str(row[name]) for name in fields]
+             for row in rows]
+    widths = [max([len(name), *(len(line[column]) for line in cells)]) for column, name in enumerate(fields)]
+    print("  ".join(name.rjust(width) for name, width in zip(fields, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python sweep.py <scenario_dir> <output_dir>")
+        sys.exit(1)
+    from main import simultation_params
+    run_sweep(sys.argv[1], simultation_params, DEFAULT_GRID, sys.argv[2])
@@ -0,0 +1,64 @@
+import pytest
+from analytics_sink import MemorySink, ParquetSink, make_analytics_sink, read_analytics
+
+ENTRIES = [{"timestamp": tick, "active_cars": tick * 3, "avg_connection_health": tick / 7} for tick in range(1, 13)]
+
+
+def crash(sink, torn_line):
+    """Stop a sink the way a killed process would: buffered entries are lost and the last line is torn."""
+    sink.file.flush()
+    sink.file.close()
+    with open(sink.path, "a") as file:
+        file.write(torn_line)
+
+
+@pytest.mark.parametrize("kind", ["jsonl", "csv"])
+def test_resumed_sink_drops_everything_after_the_checkpoint(tmp_path, kind):
+    path = str(tmp_path / f"analytics.{kind}")
+    sink = make_analytics_sink(path, buffer_size=3, fsync_interval=0)
+    for entry in ENTRIES[:5]:
+        sink.write(entry)
+    checkpoint = sink.position()
+    assert checkpoint["entries"] == 5
+    for entry in ENTRIES[5:10]:  # Written after the checkpoint, partly flushed
+        sink.write(entry)
+    crash(sink, '{"timestamp": 11, "act' if kind == "jsonl" else "11,3")
+
+    resumed = make_analytics_sink(path, buffer_size=3, fsync_interval=0, resume_size=checkpoint["size"])
+    with open(path, "rb") as file:
+        assert len(file.read()) == checkpoint["size"]
+    for entry in ENTRIES[5:]:
+        resumed.write(entry)
+    resumed.close()
+
+    assert read_analytics(path) == ENTRIES
+    if kind == "csv":
+        with open(path) as file:
+            assert sum(line.startswith("timestamp,") for line in file) == 1  # Header written once
+
+
+def test_resume_at_the_start_of_a_file_writes_the_csv_header(tmp_path):
+    path = str(tmp_path / "analytics.csv")
+    sink = make_analytics_sink(path, fsync_interval=0)
+    checkpoint = sink.position()
+    sink.write(ENTRIES[0])
+    crash(sink, "")
+
+    resumed = make_analytics_sink(path, fsync_interval=0, resume_size=checkpoint["size"])
+    for entry in ENTRIES[:2]:
+        resumed.write(entry)
+    resumed.close()
+    assert read_analytics(path) == ENTRIES[:2]
+
+
+def test_parquet_sink_cannot_be_resumed(tmp_path):
+    with pytest.raises(ValueError, match="cannot be resumed"):
+        ParquetSink(str(tmp_path / "analytics.parquet"), resume_size=0)
+
+
+def test_memory_sink_position_counts_entries():
+    sink = MemorySink()
+    for entry in ENTRIES[:4]:
+        sink.write(entry)
+    assert sink.position() == {"entries": 4}
+    assert sink.entries == ENTRIES[:4]
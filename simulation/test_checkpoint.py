@@ -0,0 +1,68 @@
+import contextlib
+import io
+import random
+import pytest
+from benchmark import fixture_trips
+from checkpoint import checkpoint_files
+from sweep import TOPOLOGIES
+
+CRASH_AT = 150
+
+
+class Crash(Exception):
+    pass
+
+
+def run(topology, trips, bounding_box, params, analytics_file, crash_at=None):
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation = TOPOLOGIES[topology](trips, bounding_box, params, analytics_file)
+        if crash_at is not None:
+            analytics_update = simulation.analytics_update
+
+            def crashing_update():
+                analytics_update()
+                if simulation.timestamp >= crash_at:
+                    raise Crash()
+
+            simulation.analytics_update = crashing_update
+        simulation.run_simulation(time_interval=1)
+    return simulation
+
+
+@pytest.mark.parametrize("topology, motion_estimator", [
+    ("smart", "vectorized"),
+    ("lookahead", "vectorized"),
+    ("lookahead", "rolling"),
+    ("random", "rolling"),
+])
+def test_resume_after_crash_matches_uninterrupted_run(tmp_path, topology, motion_estimator):
+    trips, bounding_box = fixture_trips(150)
+    params = {"connection_distance": 0.1, "motion_estimator": motion_estimator}
+
+    random.seed(0)
+    expected = run(topology, trips, bounding_box, params, str(tmp_path / "expected.jsonl"))
+
+    checkpointed = {**params, "checkpoint_dir": str(tmp_path / "checkpoints"), "checkpoint_interval": 17,
+                    "checkpoint_full_interval": 3}
+    random.seed(0)
+    with pytest.raises(Crash):
+        run(topology, trips, bounding_box, checkpointed, str(tmp_path / "resumed.jsonl"), crash_at=CRASH_AT)
+    random.seed(12345)  # The random state must come from the checkpoint
+    resumed = run(topology, trips, bounding_box, {**checkpointed, "resume": True}, str(tmp_path / "resumed.jsonl"))
+
+    assert resumed.simulation_results == expected.simulation_results
+    assert (tmp_path / "resumed.jsonl").read_text() == (tmp_path / "expected.jsonl").read_text()
+
+
+def test_checkpoints_before_the_latest_full_snapshot_are_removed(tmp_path):
+    trips, bounding_box = fixture_trips(100)
+    params = {"connection_distance": 0.1, "checkpoint_dir": str(tmp_path), "checkpoint_interval": 10,
+              "checkpoint_full_interval": 3}
+    random.seed(0)
+    run("smart", trips, bounding_box, params, None)
+
+    files = checkpoint_files(str(tmp_path))
+    kinds = [kind for _, kind, _ in files]
+    assert kinds[0] == "full" and "full" not in kinds[1:]
+    assert len(files) <= 3
+    assert files[-1][0] > 3  # Later snapshots were written, and the older chains removed
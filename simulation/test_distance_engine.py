@@ -0,0 +1,40 @@
+import random
+import numpy as np
+import pytest
+from distance_engine import DistanceEngine, error_bound_report
+from network_simulation import NetworkSimulation
+
+# A sphere of the mean earth radius is off the WGS-84 ellipsoid by at most about 0.56%
+MAX_SPHERICAL_REL_ERROR = 0.006
+CENTERS = [(42.3141061843, -83.0368789337), (0.0, 0.0), (-33.8688, 151.2093), (69.6492, 18.9553), (85.0, 10.0)]
+
+
+@pytest.mark.parametrize("center", CENTERS)
+def test_spherical_modes_stay_within_error_bound_of_geodesic(center):
+    report = error_bound_report(center, max_distance_km=1.0, num_samples=500)
+    assert report["geodesic"]["max_abs_error_m"] == 0
+    for mode in ("haversine", "flat"):
+        assert report[mode]["max_rel_error"] < MAX_SPHERICAL_REL_ERROR, mode
+        assert report[mode]["max_abs_error_m"] < 1000 * MAX_SPHERICAL_REL_ERROR, mode
+
+
+def test_flat_matches_haversine_at_connection_ranges():
+    rng = random.Random(0)
+    positions1 = np.array([(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(1000)])
+    positions2 = positions1 + np.array([(rng.uniform(-0.003, 0.003), rng.uniform(-0.003, 0.003))
+                                        for _ in range(1000)])
+    haversine = DistanceEngine("haversine").distances(positions1, positions2)
+    flat = DistanceEngine("flat").distances(positions1, positions2)
+    np.testing.assert_allclose(flat, haversine, rtol=1e-5)
+
+
+def test_haversine_matches_calculate_distance():
+    engine = DistanceEngine("haversine")
+    pos1, pos2 = (42.3141, -83.0368), (42.3150, -83.0355)
+    assert engine.distance(pos1, pos2) * 1000 == pytest.approx(NetworkSimulation.calculate_distance(None, pos1, pos2),
+                                                               rel=1e-12)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError, match="Unknown distance mode"):
+        DistanceEngine("vincenty")
@@ -0,0 +1,81 @@
+import random
+from edge_store import EdgeStore, replay_connected_pairs
+
+
+def test_edges_are_undirected_and_added_once():
+    edges = EdgeStore(5)
+    assert edges.add(3, 1, tick=4)
+    assert not edges.add(1, 3, tick=5)
+    assert edges.connected(1, 3) and edges.connected(3, 1)
+    assert (1, 3) in edges and (3, 1) not in edges
+    assert edges.edges == {(1, 3): 4}
+    assert edges.degree(1) == edges.degree(3) == 1
+    assert edges.delta() == ([(1, 3)], [])
+
+
+def test_drop_returns_the_creation_tick():
+    edges = EdgeStore(4)
+    edges.add(0, 2, tick=7)
+    assert edges.drop(2, 0) == 7
+    assert edges.drop(2, 0) is None
+    assert edges.drop(1, 3) is None
+    assert len(edges) == 0 and edges.degree(0) == edges.degree(2) == 0
+    assert edges.removed == [((0, 2), 7)]
+
+
+def test_delta_keeps_the_order_of_each_tick():
+    edges = EdgeStore(6)
+    edges.begin_tick()
+    for pair in [(4, 5), (0, 1), (3, 2)]:
+        edges.add(*pair, tick=0)
+    assert edges.delta() == ([(4, 5), (0, 1), (2, 3)], [])
+
+    edges.begin_tick()
+    edges.drop(3, 2)
+    edges.drop(5, 4)
+    edges.add(1, 5, tick=1)
+    assert edges.delta() == ([(1, 5)], [(2, 3), (4, 5)])
+    assert edges.pairs() == [(0, 1), (1, 5)]  # Creation order
+
+
+def test_edge_dropped_and_added_again_in_one_tick_is_new_and_last():
+    edges = EdgeStore(4)
+    edges.begin_tick()
+    edges.add(0, 1, tick=0)
+    edges.add(2, 3, tick=0)
+    results = [{"added_pairs": edges.delta()[0], "removed_pairs": edges.delta()[1]}]
+
+    edges.begin_tick()
+    assert edges.drop(0, 1) == 0
+    assert edges.add(1, 0, tick=3)
+    added, removed = edges.delta()
+    results.append({"added_pairs": added, "removed_pairs": removed})
+
+    assert added == removed == [(0, 1)]
+    assert edges.edges[(0, 1)] == 3
+    assert edges.pairs() == [(2, 3), (0, 1)]  # The new edge iterates after the older ones
+    # Drops are replayed before additions, so the edge is connected after the tick
+    assert list(replay_connected_pairs(results)) == [{(0, 1), (2, 3)}, {(0, 1), (2, 3)}]
+
+
+def test_replayed_deltas_match_the_graph_after_every_tick():
+    rng = random.Random(0)
+    num_cars = 30
+    edges = EdgeStore(num_cars)
+    results, snapshots = [], []
+    for tick in range(200):
+        edges.begin_tick()
+        # Like check_network: validation drops first, then new links are added
+        for pair in edges.pairs():
+            if rng.random() < 0.2:
+                edges.drop(*pair)
+        for _ in range(rng.randint(0, 8)):
+            edges.add(*rng.sample(range(num_cars), 2), tick=tick)
+        added, removed = edges.delta()
+        results.append({"added_pairs": added, "removed_pairs": removed})
+        snapshots.append(set(edges.pairs()))
+
+        for car_id in range(num_cars):
+            assert edges.neighbors(car_id) == {other for pair in edges.pairs() if car_id in pair
+                                               for other in pair if other != car_id}
+    assert list(replay_connected_pairs(results)) == snapshots
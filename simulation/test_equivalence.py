@@ -0,0 +1,42 @@
+import contextlib
+import io
+import random
+import pytest
+from benchmark import fixture_trips
+from equivalence import check_engines, reference_engine
+from main import simultation_params
+from smart_topology import SmartTopology
+
+EXACT_ENGINES = ["brute", "grid", "kdtree", "numba", "rolling", "streaming", "adaptive", "sharded"]
+# Smart and random are compared against the frozen baseline, whose exact geodesic distances are slow
+NUM_CARS = {"smart": 40, "random": 40, "lookahead": 80}
+
+
+@pytest.mark.parametrize("topology", ["smart", "random", "lookahead"])
+def test_engines_match_reference(topology):
+    candidates = [engine for engine in EXACT_ENGINES if engine != reference_engine(topology)]
+    results = check_engines(candidates, num_cars=NUM_CARS[topology], topology=topology,
+                            sim_params=simultation_params)
+    for engine, result in results.items():
+        assert result["trajectory"] is None, engine
+        assert result["tick"] is None, (engine, result["tick"])
+
+
+@pytest.mark.parametrize("topology", ["smart", "random", "lookahead"])
+def test_float32_store_matches_reference_within_rounding(topology):
+    results = check_engines(["float32"], num_cars=NUM_CARS[topology], topology=topology,
+                            sim_params=simultation_params, tolerances={"analytics_rel": 1e-6})
+    assert results["float32"] == {"trajectory": None, "tick": None}
+
+
+def test_sharded_run_hands_cars_over_between_workers():
+    trips, bounding_box = fixture_trips(300)
+    params = {"connection_distance": 0.1, "shards": 3, "shard_min_cars": 0, "shard_rebalance_interval": 10}
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation = SmartTopology(trips, bounding_box, params)
+        simulation.run_simulation(time_interval=1)
+    shards = simulation.shards
+    assert shards.sharded_ticks > 0
+    assert shards.migrations > 0 and shards.halo_cars > 0
+    assert not shards.processes
@@ -0,0 +1,75 @@
+import itertools
+import random
+import numpy as np
+from link_assignment import b_matching
+
+
+def random_candidates(rng, num_cars, num_pairs):
+    pairs = rng.sample(list(itertools.combinations(range(num_cars), 2)), num_pairs)
+    first = np.array([pair[0] for pair in pairs], dtype=np.int64)
+    second = np.array([pair[1] for pair in pairs], dtype=np.int64)
+    scores = np.array([rng.choice([0.25, 0.5, rng.random()]) for _ in pairs])  # Some ties
+    capacity = np.array([rng.randint(0, 3) for _ in range(num_cars)], dtype=np.int64)
+    return first, second, scores, capacity
+
+
+def best_matching_score(first, second, scores, capacity):
+    """Score of the optimal b-matching, by brute force over subsets of the pairs."""
+    best = 0.0
+    for size in range(len(first) + 1):
+        for subset in itertools.combinations(range(len(first)), size):
+            degree = np.zeros(len(capacity), dtype=np.int64)
+            np.add.at(degree, first[list(subset)], 1)
+            np.add.at(degree, second[list(subset)], 1)
+            if np.all(degree <= capacity):
+                best = max(best, float(scores[list(subset)].sum()))
+    return best
+
+
+def test_no_car_takes_more_links_than_its_capacity():
+    rng = random.Random(0)
+    for _ in range(200):
+        first, second, scores, capacity = random_candidates(rng, 12, 30)
+        initial = capacity.copy()
+        selected = b_matching(first, second, scores, capacity)
+
+        degree = np.zeros(len(capacity), dtype=np.int64)
+        for car_id, other_car_id in selected:
+            degree[car_id] += 1
+            degree[other_car_id] += 1
+        assert np.all(degree <= initial)
+        np.testing.assert_array_equal(capacity, initial - degree)
+        assert len(set(selected)) == len(selected)
+        # Greedy is maximal: every pair left out has a car without capacity
+        for car_id, other_car_id in zip(first.tolist(), second.tolist()):
+            if (car_id, other_car_id) not in selected:
+                assert capacity[car_id] == 0 or capacity[other_car_id] == 0
+
+
+def test_pairs_are_taken_by_descending_score_then_ids():
+    first = np.array([2, 0, 1, 0], dtype=np.int64)
+    second = np.array([3, 1, 2, 3], dtype=np.int64)
+    scores = np.array([0.5, 0.9, 0.5, 0.5])
+    capacity = np.array([1, 2, 1, 2], dtype=np.int64)
+    assert b_matching(first, second, scores, capacity) == [(0, 1), (1, 2)]  # (0, 3) and (2, 3) lack capacity
+    np.testing.assert_array_equal(capacity, [0, 0, 0, 2])
+
+
+def test_connected_pairs_are_skipped_without_using_capacity():
+    first = np.array([0, 0, 1], dtype=np.int64)
+    second = np.array([1, 2, 2], dtype=np.int64)
+    scores = np.array([0.9, 0.5, 0.1])
+    capacity = np.array([1, 1, 1], dtype=np.int64)
+    selected = b_matching(first, second, scores, capacity, connected=lambda a, b: (a, b) == (0, 1))
+    assert selected == [(0, 2)]
+    np.testing.assert_array_equal(capacity, [0, 1, 0])
+
+
+def test_total_score_is_at_least_half_of_the_optimum():
+    rng = random.Random(1)
+    for _ in range(40):
+        first, second, scores, capacity = random_candidates(rng, 6, 9)
+        optimum = best_matching_score(first, second, scores, capacity)
+        selected = b_matching(first, second, scores, capacity.copy())
+        score_of = dict(zip(zip(first.tolist(), second.tolist()), scores.tolist()))
+        assert sum(score_of[pair] for pair in selected) >= optimum / 2 - 1e-12
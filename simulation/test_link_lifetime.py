@@ -0,0 +1,32 @@
+import contextlib
+import io
+import random
+import numpy as np
+import pytest
+from benchmark import fixture_trips
+from lookahead_topology import LookaheadTopology
+
+
+@pytest.mark.parametrize("time_interval", [1, 2, 3])
+def test_cached_lifetimes_match_uncached(time_interval):
+    trips, bounding_box = fixture_trips(150)
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation = LookaheadTopology(trips, bounding_box, {"connection_distance": 0.1, "lookahead_horizon": 10})
+    predictor = simulation.predictor
+    cached_lifetimes = predictor.lifetimes
+    checked = []
+
+    def lifetimes(first, second, timestamp):
+        result = cached_lifetimes(first, second, timestamp)
+        np.testing.assert_array_equal(result, predictor.predict(first, second, timestamp))
+        checked.append(len(first))
+        return result
+
+    predictor.lifetimes = lifetimes
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation.run_simulation(time_interval=time_interval)
+
+    assert predictor.step_seconds == time_interval
+    assert sum(checked) > 0
+    assert predictor.hits > 0
@@ -0,0 +1,63 @@
+import contextlib
+import io
+import random
+import pytest
+from benchmark import fixture_trips
+from link_statistics import LinkStatistics
+from sweep import TOPOLOGIES
+
+
+def test_averages_follow_added_kept_and_removed_links():
+    stats = LinkStatistics(connection_distance=0.1, bin_width=5)
+    stats.begin_tick()
+    stats.link_added(10, 0.05)
+    stats.link_added(12, 0.02)
+    assert stats.avg_link_age(12) == 1
+    assert stats.avg_link_health() == pytest.approx((0.5 + 0.8) / 2)
+
+    stats.begin_tick()
+    stats.link_kept(0.1)
+    stats.link_removed(12, 20)
+    assert stats.avg_link_age(20) == 10
+    assert stats.avg_link_health() == 0
+    assert stats.links_completed == 1 and stats.avg_link_lifetime() == 8
+
+    stats.begin_tick()
+    stats.link_removed(10, 31)
+    assert stats.avg_link_age(31) == 0 and stats.avg_link_health() == 0
+    assert stats.avg_link_lifetime() == pytest.approx((8 + 21) / 2)
+    assert stats.lifetime_histogram() == [(5, 1), (20, 1)]
+
+
+@pytest.mark.parametrize("topology", ["smart", "random", "lookahead"])
+def test_statistics_match_a_recount_of_the_links_after_every_check(topology):
+    trips, bounding_box = fixture_trips(150)
+    random.seed(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation = TOPOLOGIES[topology](trips, bounding_box, {"connection_distance": 0.1})
+    check_network = simulation.check_network
+    lifetimes = []
+    checks = []
+
+    def recounted_check_network():
+        check_network()
+        now = simulation.timestamp
+        edges = simulation.edges.edges
+        lifetimes.extend(now - created for _, created in simulation.edges.removed)
+        ages = [now - created for created in edges.values()]
+        healths = [simulation.link_stats.health(simulation.pair_distance(*pair)) for pair in edges]
+        assert simulation.avg_connection_duration == pytest.approx(sum(ages) / len(ages) if ages else 0)
+        assert simulation.avg_connection_health == pytest.approx(sum(healths) / len(healths) if healths else 0)
+        assert simulation.old_connections_dropped == len(simulation.edges.removed)
+        assert simulation.new_connections_made == len(simulation.edges.added)
+        checks.append(len(edges))
+
+    simulation.check_network = recounted_check_network
+    with contextlib.redirect_stdout(io.StringIO()):
+        simulation.run_simulation(time_interval=1)
+
+    assert max(checks) > 0 and lifetimes
+    last = simulation.analytics_sink.entries[-1]
+    assert last["links_completed"] == len(lifetimes)
+    assert last["avg_link_lifetime"] == pytest.approx(sum(lifetimes) / len(lifetimes))
+    assert last["active_connections"] == len(simulation.edges)
@@ -0,0 +1,64 @@
+import math
+import random
+import numpy as np
+import pytest
+from distance_engine import DistanceEngine
+from neighbor_index import cKDTree, degree_cell_size, make_neighbor_index, pairs_within_range
+
+RADIUS_KM = 0.1
+CENTERS = [(42.3141061843, -83.0368789337), (-33.8688, 151.2093), (0.0, 0.0), (69.6492, 18.9553)]
+INDEXES = ["grid", pytest.param("kdtree", marks=pytest.mark.skipif(cKDTree is None, reason="requires scipy"))]
+
+
+def boundary_positions(center, seed=0):
+    """
+    Cars on and right beside the grid lines around `center`, and scattered within
+    one radius of them, so many pairs straddle a cell boundary at about the radius.
+    """
+    rng = random.Random(seed)
+    # The farthest car from the equator fixes the cell size, as in GridIndex.build
+    anchor = (center[0] + math.copysign(0.01, center[0] or 1.0), center[1])
+    lat_size, lon_size = degree_cell_size(RADIUS_KM, abs(anchor[0]))
+    lat_lines = [(math.floor(center[0] / lat_size) + step) * lat_size for step in range(-2, 3)]
+    lon_lines = [(math.floor(center[1] / lon_size) + step) * lon_size for step in range(-2, 3)]
+    positions = [anchor]
+    for lat in lat_lines:
+        for lon in lon_lines:
+            for d_lat in (-1e-12, 0.0, 1e-12):
+                for d_lon in (-1e-12, 0.0, 1e-12):
+                    positions.append((lat + d_lat, lon + d_lon))
+    for _ in range(600):
+        lat = rng.choice(lat_lines) + rng.uniform(-lat_size, lat_size)
+        lon = rng.choice(lon_lines) + rng.uniform(-lon_size, lon_size)
+        positions.append((lat, lon))
+    return np.arange(len(positions), dtype=np.int64), np.array(positions, dtype=np.float64)
+
+
+@pytest.mark.parametrize("kind", INDEXES)
+@pytest.mark.parametrize("center", CENTERS)
+def test_index_finds_the_same_pairs_as_brute_force_at_cell_boundaries(kind, center):
+    ids, positions = boundary_positions(center)
+    distance_engine = DistanceEngine("haversine")
+    expected = pairs_within_range(make_neighbor_index("brute", RADIUS_KM), distance_engine, RADIUS_KM,
+                                  ids, positions)
+    actual = pairs_within_range(make_neighbor_index(kind, RADIUS_KM), distance_engine, RADIUS_KM,
+                                ids, positions)
+
+    assert len(expected[0]) > 1000  # Enough pairs that boundary cases are covered
+    for expected_array, actual_array in zip(expected, actual):
+        np.testing.assert_array_equal(actual_array, expected_array)
+
+
+@pytest.mark.parametrize("kind", INDEXES)
+def test_candidates_cover_every_car_within_range(kind):
+    ids, positions = boundary_positions(CENTERS[0], seed=1)
+    index = make_neighbor_index(kind, RADIUS_KM)
+    index.build(ids.tolist(), positions.tolist())
+    distances = DistanceEngine("haversine")
+    for car_id in ids.tolist()[::7]:
+        others = np.delete(ids, car_id)
+        within = others[distances.distances(np.repeat(positions[[car_id]], len(others), axis=0),
+                                            positions[others]) <= RADIUS_KM]
+        candidates = index.query(car_id)
+        assert candidates == sorted(candidates)
+        assert set(within.tolist()) <= set(candidates)
@@ -0,0 +1,40 @@
+import traffic_simulation
+from osrm_utils import RouteFetcher
+from osrm_stub_server import start_stub_server
+from route_cache import RouteCache
+from utils import manual_bounding_boxes
+
+CENTER = (42.3141061843, -83.0368789337)
+
+
+def run_trips(base_url, cache, seed):
+    fetcher = RouteFetcher(base_url=base_url, cache=cache)
+    try:
+        return traffic_simulation.simulate_traffic_within_box(
+            num_trips=40,
+            main_box=manual_bounding_boxes(CENTER, 1),
+            bounding_box=manual_bounding_boxes(CENTER, 10),
+            fetcher=fetcher,
+            workers=1,
+            seed=seed,
+        )
+    finally:
+        fetcher.close()
+
+
+def test_seeded_rerun_is_served_from_cache(tmp_path):
+    server, base_url = start_stub_server()
+    cache = RouteCache(str(tmp_path / "routes.sqlite"))
+    try:
+        first = run_trips(base_url, cache, seed=0)
+        cold = cache.stats()
+        second = run_trips(base_url, cache, seed=0)
+        warm = cache.stats()
+    finally:
+        cache.close()
+        server.shutdown()
+
+    assert cold["hits"] == 0
+    assert warm["misses"] == cold["misses"]
+    assert warm["hits"] - cold["hits"] == cold["misses"]
+    assert [trip["offset"] for trip in second] == [trip["offset"] for trip in first]
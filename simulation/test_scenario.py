@@ -0,0 +1,91 @@
+import contextlib
+import io
+import json
+import numpy as np
+import pytest
+from benchmark import fixture_trips
+from car_state import CarStateStore
+from scenario import convert_json_scenario, load_route_metadata, load_scenario, route_metadata, save_scenario
+
+
+def scenario_trips():
+    trips, bounding_box = fixture_trips(30)
+    # A trip that was cut off before it started, and one without a route
+    trips.append({"route": trips[0]["route"], "positions": np.zeros((0, 2)), "timestamps": np.zeros(0), "offset": 7})
+    trips.append({"positions": trips[1]["positions"][:5], "timestamps": trips[1]["timestamps"][:5], "offset": 3})
+    return trips, bounding_box
+
+
+def assert_same_store(actual, expected, atol=0.0):
+    for column in ("offset", "start", "length"):
+        np.testing.assert_array_equal(getattr(actual, column), getattr(expected, column))
+    np.testing.assert_array_equal(actual.origin, expected.origin)
+    for car_id in range(expected.num_cars):
+        np.testing.assert_allclose(actual.trajectory(car_id), expected.trajectory(car_id), rtol=0, atol=atol)
+        np.testing.assert_array_equal(actual.trajectory_timestamps(car_id), expected.trajectory_timestamps(car_id))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_float64_scenario_round_trips_exactly(tmp_path, mmap):
+    trips, bounding_box = scenario_trips()
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_scenario(str(tmp_path), trips, bounding_box, dtype=np.float64)
+        store, loaded_box = load_scenario(str(tmp_path), mmap=mmap)
+
+    assert loaded_box == bounding_box
+    assert_same_store(store, CarStateStore.from_trips(trips, dtype=np.float64))
+    assert store.length[-2] == 0
+    assert load_route_metadata(str(tmp_path)) == [route_metadata(trip.get("route")) for trip in trips]
+    assert load_route_metadata(str(tmp_path))[-1] == {}
+
+
+def test_float32_scenario_keeps_millimeter_precision(tmp_path):
+    trips, bounding_box = scenario_trips()
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_scenario(str(tmp_path), trips, bounding_box)
+        store, _ = load_scenario(str(tmp_path))
+    assert store.trajectories.dtype == np.float32
+    assert_same_store(store, CarStateStore.from_trips(trips, dtype=np.float64), atol=1e-8)  # ~1 mm in degrees
+
+
+def test_streaming_store_reads_the_same_trajectories(tmp_path):
+    trips, bounding_box = scenario_trips()
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_scenario(str(tmp_path), trips, bounding_box, dtype=np.float64)
+        store, loaded_box = load_scenario(str(tmp_path), stream=True)
+    expected = CarStateStore.from_trips(trips, dtype=np.float64)
+    with store:
+        assert loaded_box == bounding_box
+        store.load(np.arange(store.num_cars))
+        for car_id in range(store.num_cars):
+            np.testing.assert_array_equal(store.trajectory(car_id), expected.trajectory(car_id))
+            np.testing.assert_array_equal(store.trajectory_timestamps(car_id), expected.trajectory_timestamps(car_id))
+        store.release(np.arange(0, store.num_cars, 2))
+        assert store.loaded_cars() == store.num_cars // 2
+
+
+def test_simulation_data_json_converts_to_the_same_scenario(tmp_path):
+    trips, bounding_box = fixture_trips(10)
+    json_trips = [{"route": trip["route"], "offset": trip["offset"],
+                   "positions": [{"position": position, "timestamp": timestamp}
+                                 for position, timestamp in zip(trip["positions"].tolist(), trip["timestamps"].tolist())]}
+                  for trip in trips]
+    json_file = tmp_path / "simulation_data.json"
+    json_file.write_text(json.dumps({"simulation_data": json_trips, "bounding_box": bounding_box}))
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_json_scenario(str(json_file), str(tmp_path / "from_json"))
+        save_scenario(str(tmp_path / "direct"), trips, bounding_box)
+        converted, _ = load_scenario(str(tmp_path / "from_json"))
+        direct, _ = load_scenario(str(tmp_path / "direct"))
+    assert_same_store(converted, direct)
+
+
+def test_unsupported_version_is_rejected(tmp_path):
+    trips, bounding_box = fixture_trips(3)
+    with contextlib.redirect_stdout(io.StringIO()):
+        save_scenario(str(tmp_path), trips, bounding_box)
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    (tmp_path / "meta.json").write_text(json.dumps({**meta, "version": 0}))
+    for stream in (False, True):
+        with pytest.raises(ValueError, match="Unsupported scenario version"):
+            load_scenario(str(tmp_path), stream=stream)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from trajectory_interpolation import arc_fractions, interpolate_route
+from traffic_simulation import simulate_car_on_route
+
+
+def route_of(steps):
+    """OSRM route response with one leg of the given (coordinates, duration) steps."""
+    return {"routes": [{"legs": [{"steps": [
+        {"geometry": {"coordinates": coordinates}, "duration": duration, "distance": 0.0}
+        for coordinates, duration in steps
+    ]}]}]}
+
+
+START, MIDDLE, END = [-83.0, 42.0], [-83.0, 42.001], [-82.999, 42.001]
+
+
+@pytest.mark.parametrize("time_window", [1, 2, 3, 0.7])
+def test_last_sample_is_the_route_end(time_window):
+    times, positions = interpolate_route(route_of([([START, MIDDLE], 10.0), ([MIDDLE, END], 5.0)]), time_window)
+    assert times[-1] == 15.0
+    assert positions[-1].tolist() == END
+    assert times[0] == min(time_window, 15.0)
+    assert np.all(np.diff(times) > 0)  # No duplicate sample at the end
+
+
+def test_duration_that_is_a_multiple_of_the_window_ends_on_a_full_window():
+    times, positions = interpolate_route(route_of([([START, MIDDLE], 10.0)]), time_window=2)
+    np.testing.assert_array_equal(times, [2, 4, 6, 8, 10])
+    np.testing.assert_allclose(positions[:, 1], [42.0002, 42.0004, 42.0006, 42.0008, 42.001], rtol=0, atol=1e-12)
+    assert positions[-1].tolist() == MIDDLE
+
+
+def test_route_shorter_than_one_window_gives_its_end():
+    times, positions = interpolate_route(route_of([([START, MIDDLE], 0.4)]), time_window=1)
+    assert times.tolist() == [0.4]
+    assert positions.tolist() == [MIDDLE]
+
+
+def test_zero_length_and_zero_duration_steps():
+    route = route_of([([START, START], 3.0), ([START, MIDDLE], 0.0), ([MIDDLE, END], 2.0)])
+    times, positions = interpolate_route(route, time_window=1)
+    assert times.tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+    # Waiting at the start, then jumping to the middle of the zero-duration step
+    assert positions[:2].tolist() == [START, START]
+    assert positions[-1].tolist() == END
+    assert arc_fractions(np.array([START, START, START])).tolist() == [0.0, 0.5, 1.0]
+
+
+def test_simulated_car_starts_one_window_after_start_time_and_ends_at_the_route_end():
+    trajectory = simulate_car_on_route(route_of([([START, MIDDLE], 10.0)]), time_window=1, start_time=100.0)
+    assert trajectory[0]["timestamp"] == 101.0
+    assert trajectory[-1] == {"position": MIDDLE, "timestamp": 110.0}
+
+
+def test_invalid_route_has_no_samples():
+    times, positions = interpolate_route({"routes": []})
+    assert len(times) == 0 and positions.shape == (0, 2)
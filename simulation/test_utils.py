@@ -0,0 +1,38 @@
+import pytest
+from utils import segment_intersects_box, route_crosses_box
+
+# Segment ends are [longitude, latitude], as in OSRM geometries
+BOX = {"min_lat": 42.0, "max_lat": 43.0, "min_lon": -84.0, "max_lon": -83.0}
+
+
+@pytest.mark.parametrize("start, end, expected", [
+    ([-83.5, 42.5], [-83.4, 42.6], True),  # Inside
+    ([-85.0, 42.5], [-84.5, 42.5], False),  # Left of the box
+    ([-85.0, 42.5], [-82.0, 42.5], True),  # Through the box, both ends outside
+    ([-83.5, 41.0], [-83.5, 44.0], True),  # Vertical, through the box
+    ([-85.0, 41.0], [-82.0, 44.0], True),  # Diagonal through the box
+    ([-84.5, 42.9], [-83.9, 43.5], False),  # Cuts past the corner, outside
+    ([-85.0, 42.0], [-84.0, 43.0], True),  # Ends on a corner
+    ([-84.0, 43.0], [-84.5, 43.5], True),  # Starts on a corner, leaves the box
+    ([-85.0, 44.0], [-83.5, 42.5], True),  # Ends inside
+    ([-84.5, 43.0], [-82.5, 43.0], True),  # Along the top edge
+    ([-84.5, 43.000001], [-82.5, 43.000001], False),  # Parallel to the top edge, just outside
+    ([-83.0, 41.0], [-83.0, 44.0], True),  # Along the right edge
+    ([-82.999999, 41.0], [-82.999999, 44.0], False),  # Parallel to the right edge, just outside
+    ([-83.5, 42.5], [-83.5, 42.5], True),  # A point inside
+    ([-84.0, 42.5], [-84.0, 42.5], True),  # A point on an edge
+    ([-82.5, 42.5], [-82.5, 42.5], False),  # A point outside
+    ([-84.0, 44.0], [-82.0, 42.0], True),  # Touches the box in the corner only
+    ([-84.0, 44.0], [-82.0, 42.000001], False),  # Misses the corner
+])
+def test_segment_intersects_box(start, end, expected):
+    assert segment_intersects_box(start, end, BOX) is expected
+    assert segment_intersects_box(end, start, BOX) is expected
+
+
+def test_route_crosses_box_without_a_vertex_inside():
+    route = {"routes": [{"geometry": {"coordinates": [[-85.0, 42.5], [-82.0, 42.6], [-82.0, 45.0]]}}]}
+    assert route_crosses_box(route, BOX)
+    route["routes"][0]["geometry"]["coordinates"] = [[-85.0, 41.0], [-82.0, 41.5], [-82.0, 45.0]]
+    assert not route_crosses_box(route, BOX)
+    assert not route_crosses_box({"routes": []}, BOX)
@@ -4,13 +4,52 @@ import requests
 import time
 import timeit
 import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from utils import *
 from osrm_utils import *
+from trajectory_interpolation import interpolate_route
 
-def simulate_car_on_route(route, time_window=1, start_time=None):
+def simulate_car_on_route(route, time_window=1, start_time=None, verbose=False):
     """
     Simulate a car driving along a route using OSRM-provided speed data, evaluating position at each time window.
 
+    Positions are interpolated along the full step polylines in one vectorized pass
+    (see trajectory_interpolation.interpolate_route).
+
+    Args:
+        route (dict): The route data from OSRM API.
+        time_window (float): Time window in seconds to evaluate the car's position.
+        start_time (float): Start time of the simulation in seconds since the epoch.
+        verbose (bool): Print a summary of every step driven.
+
+    Returns:
+        list: A list of dictionaries containing positions (longitude, latitude) and timestamps.
+    """
+    if "routes" not in route or not route["routes"]:
+        print("Invalid route data.")
+        return []
+    if start_time is None:
+        start_time = time.time()  # Default to current time if not provided
+
+    if verbose:
+        for leg in route["routes"][0]["legs"]:
+            for step in leg.get("steps", []):
+                speed = step["distance"] / step["duration"] if step["duration"] > 0 else 0
+                print(f"Driving on {step.get('name', 'Unnamed Road')} "
+                      f"(distance: {step['distance']:.2f} m, duration: {step['duration']:.2f} s, speed: {speed:.2f} m/s)")
+
+    times, positions = interpolate_route(route, time_window)
+    timestamps = (start_time + times).tolist()
+    return [{"position": position, "timestamp": timestamp}
+            for position, timestamp in zip(positions.tolist(), timestamps)]
+
+
+def simulate_car_on_route_stepwise(route, time_window=1, start_time=None):
+    """
+    Original per-step simulation, moving in a straight line from each step's start to its end.
+    Kept as the reference implementation for comparisons.
+
     Args:
         route (dict): The route data from OSRM API.
         time_window (float): Time window in seconds to evaluate the car's position.
@@ -107,50 +146,175 @@ def simulate_car_on_route(route, time_window=1, start_time=None):
     return positions
 
 
-def simulate_traffic_within_box(num_trips, main_box, bounding_box, time_window=1, time_offset_range=(0, 60)):
+def simulate_route_chunk(routes, time_window, bounding_box):
+    """
+    Process pool worker: interpolate a chunk of routes and keep the ones that pass through the bounding box.
+
+    Args:
+        routes (list): Route data from OSRM API.
+        time_window (float): Time window in seconds to evaluate the car's position.
+        bounding_box (dict): Bounding box with min and max latitude and longitude.
+
+    Returns:
+        list: For each route, (times, positions) arrays from interpolate_route, or None
+              if the route is invalid or never enters the bounding box.
+    """
+    results = []
+    for route in routes:
+        try:
+            times, positions = interpolate_route(route, time_window)
+        except Exception as e:
+            print(f"Error simulating route: {e}")
+            results.append(None)
+            continue
+        lon, lat = positions.T
+        inside = ((bounding_box["min_lat"] <= lat) & (lat <= bounding_box["max_lat"]) &
+                  (bounding_box["min_lon"] <= lon) & (lon <= bounding_box["max_lon"]))
+        results.append((times, positions) if inside.any() else None)
+    return results
+
+
+def simulate_routes_parallel(routes, time_window, bounding_box, workers=None, chunk_size=32):
+    """
+    Interpolate many routes on a process pool.
+
+    Routes are split into chunks of `chunk_size` and results come back as compact
+    NumPy arrays in input order, so the output does not depend on the worker count.
+
+    Args:
+        routes (list): Route data from OSRM API.
+        time_window (float): Time window in seconds to evaluate the car's position.
+        bounding_box (dict): Bounding box with min and max latitude and longitude.
+        workers (int): Number of worker processes, defaults to the CPU count. 1 runs in-process.
+        chunk_size (int): Routes sent to a worker at a time.
+
+    Returns:
+        list: For each route, (times, positions) arrays or None, as in simulate_route_chunk.
+    """
+    chunks = [routes[i:i + chunk_size] for i in range(0, len(routes), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = [simulate_route_chunk(chunk, time_window, bounding_box) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(simulate_route_chunk, chunks, repeat(time_window), repeat(bounding_box)))
+    return [trajectory for chunk in results for trajectory in chunk]
+
+
+def prefilter_od_pairs(od_pairs, bounding_box, fetcher, margin=0.05):
+    """
+    First phase of trip generation: keep only origin/destination pairs whose route
+    passes through the bounding box.
+
+    A pair with an endpoint inside the padded box crosses it by definition and is
+    accepted without a request. Only pairs with both endpoints outside are checked
+    with a cheap simplified-overview request (no steps) and a segment-vs-box test.
+    The box is padded by `margin` kms to absorb the geometry simplification.
+
+    Args:
+        od_pairs (list): (start, end) coordinate pairs.
+        bounding_box (dict): Bounding box with min and max latitude and longitude.
+        fetcher (RouteFetcher): Route fetcher to use.
+        margin (float): Padding of the bounding box in kms.
+
+    Returns:
+        list: The accepted (start, end) pairs, in input order.
+    """
+    padded_box = pad_bounding_box(bounding_box, margin)
+    accepted = [point_in_box(start, padded_box) or point_in_box(end, padded_box) for start, end in od_pairs]
+    outside = [index for index, inside in enumerate(accepted) if not inside]
+    if outside:
+        overviews = fetcher.fetch_many([od_pairs[index] for index in outside], params=OVERVIEW_PARAMS)
+        for index, overview in zip(outside, overviews):
+            accepted[index] = overview is not None and route_crosses_box(overview, padded_box)
+    return [od_pair for od_pair, keep in zip(od_pairs, accepted) if keep]
+
+
+def simulate_traffic_within_box(num_trips, main_box, bounding_box, time_window=1, time_offset_range=(0, 60),
+                                fetcher=None, prefilter=True, prefilter_margin=0.05, workers=None, chunk_size=32,
+                                seed=None):
     """
     Simulate traffic within a bounding box.
 
+    With `prefilter`, trips are generated in two phases: random pairs are first
+    screened with prefilter_od_pairs, and full geometry with steps is only requested
+    and simulated for the pairs that cross the bounding box.
+
+    With a `seed`, every run draws the same origin/destination pairs and time
+    offsets, so a run repeated with a route cache is served from the cache.
+
     Args:
         num_trips (int): Number of trips to simulate.
         time_window (int): Time window in seconds for each simulation step.
         bounding_box (dict): Bounding box with min and max latitude and longitude.
         time_offset_range (tuple): Range (min, max) of random time offsets in seconds.
+        fetcher (RouteFetcher): Concurrent route fetcher to use, a default one is created if None.
+        prefilter (bool): Screen pairs with a cheap overview request before fetching full routes.
+        prefilter_margin (float): Padding of the bounding box in kms for the screening test.
+        workers (int): Worker processes for trip interpolation, defaults to the CPU count.
+        chunk_size (int): Routes sent to a worker at a time.
+        seed (int): Seed of the random module for the trip draws, None to leave it as is.
 
     Returns:
-        list: List of simulated trips with positions and timestamps.
+        list: List of simulated trips, each with the route, a (T, 2) 'positions' array of
+              [longitude, latitude], a (T,) 'timestamps' array and an 'offset'.
     """
+    if seed is not None:
+        random.seed(seed)
+    start_time = time.time()
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = RouteFetcher()
     simulated_trips = []
     attempted_routes = 0  # Renamed for clarity
     remaining_attempts = 100  # Renamed for clarity
+    screened_pairs = 0
+    rejected_pairs = 0
+    screening_time = 0.0
+    full_routes = 0
+    full_route_time = 0.0
     while len(simulated_trips) < num_trips and remaining_attempts > 0:
         remaining_attempts -= 1
-        routes = generate_random_routes(num_routes=num_trips - len(simulated_trips), main_box=main_box)
+        od_pairs = generate_random_od_pairs(num_trips - len(simulated_trips), main_box)
+        if prefilter:
+            started = time.perf_counter()
+            accepted_pairs = prefilter_od_pairs(od_pairs, bounding_box, fetcher, prefilter_margin)
+            screening_time += time.perf_counter() - started
+            screened_pairs += len(od_pairs)
+            rejected_pairs += len(od_pairs) - len(accepted_pairs)
+            od_pairs = accepted_pairs
+        started = time.perf_counter()
+        routes = generate_random_routes(len(od_pairs), main_box, fetcher=fetcher, od_pairs=od_pairs)
         attempted_routes += len(routes)
-        # Check if route crosses the bounding box
-        for route in routes:
-            try:
-                # Simulate the car on the route
-                simulation_data = simulate_car_on_route(route, time_window=time_window)
-                # Check if the route is within the bounding box
-                if simulation_data:
-                    for position in simulation_data:
-                        lon, lat = position["position"]
-                        if (bounding_box["min_lat"] <= lat <= bounding_box["max_lat"] and
-                                bounding_box["min_lon"] <= lon <= bounding_box["max_lon"]):
-                            random_offset = int(random.uniform(*time_offset_range))  # Generate random integer time offset
-                            simulated_trips.append({
-                                "route": route,
-                                "positions": simulation_data,
-                                "offset": random_offset,
-                            })
-                            print(f"Simulated trip added with offset {random_offset:.2f} seconds")
-                            break
-            except Exception as e:
-                print(f"Error simulating route: {e}")
-    attempted_routes += len(routes)
+        # Simulate the cars on the routes and keep the ones that cross the bounding box
+        trajectories = simulate_routes_parallel(routes, time_window, bounding_box, workers, chunk_size)
+        for route, trajectory in zip(routes, trajectories):
+            if trajectory is None:
+                continue
+            times, positions = trajectory
+            random_offset = int(random.uniform(*time_offset_range))  # Generate random integer time offset
+            simulated_trips.append({
+                "route": route,
+                "positions": positions,
+                "timestamps": start_time + times,
+                "offset": random_offset,
+            })
+            print(f"Simulated trip added with offset {random_offset:.2f} seconds")
+        full_route_time += time.perf_counter() - started
+        full_routes += len(od_pairs)
     print(f"Number of routes attempted: {attempted_routes}")
     print(f"Number of trips simulated: {len(simulated_trips)}")
+    if prefilter and screened_pairs:
+        # Every rejected pair would otherwise have cost a full fetch and simulation
+        cost_per_full_route = full_route_time / full_routes if full_routes else 0.0
+        time_saved = rejected_pairs * cost_per_full_route - screening_time
+        print(f"Prefilter acceptance rate: {(screened_pairs - rejected_pairs) / screened_pairs:.2%} "
+              f"({rejected_pairs} of {screened_pairs} pairs rejected), "
+              f"screening took {screening_time:.2f} s, estimated time saved: {time_saved:.2f} s")
+    print(f"Route fetching: {fetcher.stats.summary()}")
+    if fetcher.cache is not None:
+        print(f"Route cache: {fetcher.cache.stats()}")
+    if own_fetcher:
+        fetcher.close()
     return simulated_trips
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+import math
+import numpy as np
+from distance_engine import flat_distance
+
+
+def arc_fractions(coordinates):
+    """
+    Fraction of a polyline's length covered at each of its vertices.
+
+    Args:
+        coordinates (numpy.ndarray): (n, 2) array of [longitude, latitude] vertices.
+
+    Returns:
+        numpy.ndarray: (n,) non-decreasing fractions from 0 to 1.
+    """
+    if len(coordinates) < 2:
+        return np.zeros(len(coordinates), dtype=np.float64)
+    lengths = flat_distance(coordinates[:-1, 1], coordinates[:-1, 0], coordinates[1:, 1], coordinates[1:, 0])
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    if cumulative[-1] == 0:
+        return np.linspace(0.0, 1.0, len(coordinates))
+    return cumulative / cumulative[-1]
+
+
+def route_knots(route):
+    """
+    Times at which a car following an OSRM route passes each vertex of its geometry.
+
+    The car drives every step's polyline at that step's constant speed
+    (distance / duration). Routes without steps fall back to the overall geometry
+    driven at the route's average speed.
+
+    Args:
+        route (dict): The route data from OSRM API.
+
+    Returns:
+        tuple: (knot_times, knot_positions) with shapes (k,) and (k, 2), positions
+               as [longitude, latitude]. Both are empty for invalid routes.
+    """
+    empty = (np.zeros(0, dtype=np.float64), np.zeros((0, 2), dtype=np.float64))
+    if "routes" not in route or not route["routes"]:
+        return empty
+    legs = route["routes"][0]["legs"]
+
+    if legs and all(leg.get("steps") for leg in legs):
+        pieces = [(step["geometry"]["coordinates"], step["duration"]) for leg in legs for step in leg["steps"]]
+    else:
+        coordinates = route["routes"][0].get("geometry", {}).get("coordinates", [])
+        duration = sum(leg["duration"] for leg in legs) if legs else route["routes"][0].get("duration", 0)
+        pieces = [(coordinates, duration)]
+
+    times, positions = [], []
+    elapsed = 0.0
+    for coordinates, duration in pieces:
+        coordinates = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        if len(coordinates) == 0:
+            elapsed += duration
+            continue
+        times.append(elapsed + duration * arc_fractions(coordinates))
+        positions.append(coordinates)
+        elapsed += duration
+    if not times:
+        return empty
+    return np.concatenate(times), np.concatenate(positions)
+
+
+def interpolate_route(route, time_window=1):
+    """
+    Sample the position of a car along an OSRM route every `time_window` seconds.
+
+    Args:
+        route (dict): The route data from OSRM API.
+        time_window (float): Sampling interval in seconds.
+
+    Returns:
+        tuple: (times, positions) where times is a (T,) array of seconds since the
+               start of the trip and positions a (T, 2) array of [longitude, latitude].
+               The first sample is at `time_window` and the last one at the end of the route.
+    """
+    knot_times, knot_positions = route_knots(route)
+    if len(knot_times) == 0:
+        return knot_times, knot_positions
+    total_duration = knot_times[-1]
+    num_samples = max(1, int(math.ceil(total_duration / time_window - 1e-9)))
+    times = np.minimum(np.arange(1, num_samples + 1, dtype=np.float64) * time_window, total_duration)
+    positions = np.column_stack([
+        np.interp(times, knot_times, knot_positions[:, 0]),
+        np.interp(times, knot_times, knot_positions[:, 1]),
+    ])
+    return times, positions
@@ -83,4 +83,77 @@ def manual_bounding_boxes(center, size):
         "max_lat": lat + offset / 2,
         "min_lon": lon - offset / 2,
         "max_lon": lon + offset / 2
-    }
\ No newline at end of file
+    }
+
+def pad_bounding_box(box, margin):
+    """
+    Grow a bounding box by a margin on every side.
+
+    Args:
+        box (dict): Bounding box with min and max latitude and longitude.
+        margin (float): Margin in kms.
+
+    Returns:
+        dict: The padded bounding box.
+    """
+    lat_offset = margin / 111  # 1 degree latitude ≈ 111 km
+    lon_offset = margin / (111 * abs(math.cos(math.radians((box["min_lat"] + box["max_lat"]) / 2))))
+    return {
+        "min_lat": box["min_lat"] - lat_offset,
+        "max_lat": box["max_lat"] + lat_offset,
+        "min_lon": box["min_lon"] - lon_offset,
+        "max_lon": box["max_lon"] + lon_offset
+    }
+
+def point_in_box(position, box):
+    """Check whether a (latitude, longitude) position lies inside a bounding box."""
+    return (box["min_lat"] <= position[0] <= box["max_lat"] and
+            box["min_lon"] <= position[1] <= box["max_lon"])
+
+def segment_intersects_box(start, end, box):
+    """
+    Check whether a straight segment touches a bounding box (Liang-Barsky clipping).
+
+    Args:
+        start (list): [longitude, latitude] of the segment start, as in OSRM geometries.
+        end (list): [longitude, latitude] of the segment end.
+        box (dict): Bounding box with min and max latitude and longitude.
+
+    Returns:
+        bool: True if any point of the segment lies inside the box.
+    """
+    t_enter, t_exit = 0.0, 1.0
+    for p, q in (
+        (-(end[0] - start[0]), start[0] - box["min_lon"]),
+        (end[0] - start[0], box["max_lon"] - start[0]),
+        (-(end[1] - start[1]), start[1] - box["min_lat"]),
+        (end[1] - start[1], box["max_lat"] - start[1]),
+    ):
+        if p == 0:
+            if q < 0:
+                return False  # Parallel to this edge and outside it
+        elif p < 0:
+            t_enter = max(t_enter, q / p)
+        else:
+            t_exit = min(t_exit, q / p)
+        if t_enter > t_exit:
+            return False
+    return True
+
+def route_crosses_box(route, box):
+    """
+    Check whether the geometry of an OSRM route passes through a bounding box.
+
+    Args:
+        route (dict): OSRM route response with geojson geometry (any overview level).
+        box (dict): Bounding box with min and max latitude and longitude.
+
+    Returns:
+        bool: True if any segment of the route geometry touches the box.
+    """
+    if "routes" not in route or not route["routes"]:
+        return False
+    coordinates = route["routes"][0]["geometry"]["coordinates"]
+    if len(coordinates) == 1:
+        return segment_intersects_box(coordinates[0], coordinates[0], box)
+    return any(segment_intersects_box(start, end, box) for start, end in zip(coordinates[:-1], coordinates[1:]))
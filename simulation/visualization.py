@@ -1,20 +1,18 @@
 import json
 import matplotlib.pyplot as plt
+from analytics_sink import read_analytics
 
 '''
-Data in the json files
-[
-{'timestamp': 1, 'cars_completed': 0, 'new_connections_made': 4, 'old_connections_dropped': 24, 'active_connections': 8, 'active_cars': 14, 'avg_connection_duration': 1.0}
-]
+Data in the analytics files (JSON Lines, CSV or Parquet, one entry per tick)
+{"timestamp": 1, "cars_completed": 0, "new_connections_made": 4, "old_connections_dropped": 24, "active_connections": 8, "active_cars": 14, "avg_connection_duration": 1.0, ...}
 '''
 
 def load_simulation_data(filename):
     """
-    Load simulation data from a JSON file.
+    Load simulation analytics written by an analytics sink (or a legacy JSON file).
     """
     try:
-        with open(filename, "r") as file:
-            data_loaded = json.load(file)
+        data_loaded = read_analytics(filename)
         print(f"Simulation data loaded from {filename}")
         return data_loaded
     except FileNotFoundError:
@@ -134,8 +132,8 @@ def plot_comparison(data1, data2, key, title):
     plt.close()
 
 def main():
-    random_algorithm = load_simulation_data("/simulation_data/random_topology.json")[100:300]
-    smart_algorithm = load_simulation_data("/simulation_data/smart_topology.json")[100:300]
+    random_algorithm = load_simulation_data("/simulation_data/random_topology.jsonl")[100:300]
+    smart_algorithm = load_simulation_data("/simulation_data/smart_topology.jsonl")[100:300]
     # plot_comparison(random_algorithm, smart_algorithm, "avg_connection_duration", "Average Connection Duration Comparison")
     # plot_comparison(random_algorithm, smart_algorithm, "avg_connection_health", "Average Connection Health Comparison")
     # plot_comparison(random_algorithm, smart_algorithm, "active_connections", "Active Connections Comparison")